@@ -2,6 +2,7 @@
 Script seguro para eliminar productos duplicados.
 Primero actualiza las referencias en order_items, luego elimina duplicados.
 """
+import sys
 from src.database.connection import DatabaseConnection
 from loguru import logger
 
@@ -16,17 +17,19 @@ def fix_duplicate_products_safe():
 
     try:
         with db.get_connection() as conn:
+            # get_connection() uses RealDictCursor, so rows are always dicts
             with conn.cursor() as cursor:
+                # UPDATE/DELETE sobre toda la tabla: sin statement_timeout en esta transacción
+                db.lift_statement_timeout(cursor)
+
                 # 1. Contar productos antes
-                cursor.execute("SELECT COUNT(*) FROM products")
-                result = cursor.fetchone()
-                total_before = list(result.values())[0] if isinstance(result, dict) else result[0]
+                cursor.execute("SELECT COUNT(*) AS total FROM products")
+                total_before = cursor.fetchone()['total']
                 print(f"Total productos antes: {total_before}")
 
                 # 2. Verificar si hay order_items
-                cursor.execute("SELECT COUNT(*) FROM order_items")
-                result = cursor.fetchone()
-                order_items_count = list(result.values())[0] if isinstance(result, dict) else result[0]
+                cursor.execute("SELECT COUNT(*) AS total FROM order_items")
+                order_items_count = cursor.fetchone()['total']
                 print(f"Total items en ordenes: {order_items_count}")
                 print()
 
@@ -34,53 +37,40 @@ def fix_duplicate_products_safe():
                 if order_items_count > 0:
                     print("Actualizando referencias en order_items...")
 
-                    # Obtener mapeo de product_id viejo -> product_id nuevo (el menor)
+                    # Reasignar cada product_id duplicado al menor de su nombre en un solo UPDATE
                     cursor.execute("""
                         WITH product_mapping AS (
                             SELECT
-                                product_id,
-                                name,
-                                MIN(product_id) OVER (PARTITION BY name) as keep_id
+                                product_id AS old_id,
+                                MIN(product_id) OVER (PARTITION BY name) AS keep_id
                             FROM products
                         )
-                        SELECT product_id, keep_id
-                        FROM product_mapping
-                        WHERE product_id != keep_id
+                        UPDATE order_items oi
+                        SET product_id = pm.keep_id
+                        FROM product_mapping pm
+                        WHERE oi.product_id = pm.old_id
+                          AND pm.old_id <> pm.keep_id
                     """)
+                    updated_count = cursor.rowcount
 
-                    mappings = cursor.fetchall()
-
-                    for mapping in mappings:
-                        old_id = mapping['product_id'] if isinstance(mapping, dict) else mapping[0]
-                        new_id = mapping['keep_id'] if isinstance(mapping, dict) else mapping[1]
-
-                        cursor.execute("""
-                            UPDATE order_items
-                            SET product_id = %s
-                            WHERE product_id = %s
-                        """, (new_id, old_id))
-
-                    print(f"  [OK] {len(mappings)} referencias actualizadas")
+                    print(f"  [OK] {updated_count} referencias actualizadas")
                     print()
 
                 # 4. Eliminar productos duplicados
                 print("Eliminando productos duplicados...")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)")
                 delete_query = """
-                DELETE FROM products
-                WHERE product_id NOT IN (
-                    SELECT MIN(product_id)
-                    FROM products
-                    GROUP BY name
-                )
+                DELETE FROM products a
+                USING products b
+                WHERE a.name = b.name
+                  AND a.product_id > b.product_id
                 """
 
                 cursor.execute(delete_query)
                 deleted_count = cursor.rowcount
 
-                # 5. Contar productos después
-                cursor.execute("SELECT COUNT(*) FROM products")
-                result = cursor.fetchone()
-                total_after = list(result.values())[0] if isinstance(result, dict) else result[0]
+                # 5. Contar productos después (rowcount del DELETE es exacto)
+                total_after = total_before - deleted_count
 
                 # Confirmar cambios
                 conn.commit()
@@ -90,29 +80,30 @@ def fix_duplicate_products_safe():
                 print()
 
                 # 6. Mostrar productos únicos restantes
-                cursor.execute("""
-                    SELECT product_id, name, category, price, stock_quantity
-                    FROM products
-                    ORDER BY category, name
-                """)
-
-                products = cursor.fetchall()
-                print("=" * 80)
-                print("PRODUCTOS UNICOS RESTANTES:")
-                print("=" * 80)
-                for p in products:
-                    pid = p['product_id'] if isinstance(p, dict) else p[0]
-                    pname = p['name'] if isinstance(p, dict) else p[1]
-                    pprice = p['price'] if isinstance(p, dict) else p[3]
-                    pstock = p['stock_quantity'] if isinstance(p, dict) else p[4]
-                    print(f"[{pid}] {pname} - ${pprice} - Stock: {pstock}")
-
-                print()
-                print("=" * 80)
-                print("[COMPLETADO] Duplicados eliminados exitosamente")
-                print("=" * 80)
-                print()
-                print("Verifica los cambios en: http://localhost:3000/products")
+                divider = "=" * 80
+                sys.stdout.write(f"{divider}\nPRODUCTOS UNICOS RESTANTES:\n{divider}\n")
+
+                # Cursor del lado del servidor: las filas llegan por bloques y
+                # cada bloque se escribe con una sola llamada a stdout
+                with conn.cursor(name='prod_iter') as products:
+                    products.execute("""
+                        SELECT product_id, name, category, price, stock_quantity
+                        FROM products
+                        ORDER BY category, name
+                    """)
+                    while True:
+                        rows = products.fetchmany(1000)
+                        if not rows:
+                            break
+                        sys.stdout.write("".join(
+                            f"[{p['product_id']}] {p['name']} - ${p['price']} - Stock: {p['stock_quantity']}\n"
+                            for p in rows
+                        ))
+
+                sys.stdout.write(
+                    f"\n{divider}\n[COMPLETADO] Duplicados eliminados exitosamente\n{divider}\n\n"
+                    "Verifica los cambios en: http://localhost:3000/products\n"
+                )
 
     except Exception as e:
         logger.error(f"Error eliminando duplicados: {e}")
@@ -3,23 +3,199 @@ Script para importar datos a Supabase desde archivos CSV o JSON.
 
 Uso:
     python migrate_data_to_supabase.py --csv migration_exports/orders_data_XXXXXX.csv
-    python migrate_data_to_supabase.py --json migration_exports/orders_data_XXXXXX.json
+    python migrate_data_to_supabase.py --json migration_exports/orders_data_XXXXXX.ndjson
 """
 import sys
 import os
 import argparse
-import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 from loguru import logger
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Generator
 import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from operator import itemgetter
+
+from src.database.schema import schema_section
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Parser for one NDJSON line (orjson when installed)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Column order shared by every import path
+ORDER_COLUMNS = (
+    'order_id', 'status', 'customer_name', 'order_date',
+    'quantity', 'subtotal_amount', 'tax_rate', 'shipping_cost',
+    'category', 'subcategory',
+)
+
+# Secondary indexes created by the migration schema (name -> definition).
+# status/category lead composites that also serve ORDER BY order_id DESC;
+# the trigram index backs customer_name ILIKE '%...%' (needs pg_trgm)
+# The status/category composites also carry the aggregated columns, so the
+# stats views' GROUP BY status / category refresh as index-only scans
+ORDER_INDEXES = {
+    'idx_orders_status_covering': '(status, order_id DESC) INCLUDE (subtotal_amount)',
+    'idx_orders_customer_name': '(customer_name)',
+    'idx_orders_customer_name_trgm': 'USING gin (customer_name gin_trgm_ops)',
+    'idx_orders_order_date': '(order_date)',
+    'idx_orders_category_covering': '(category, order_id DESC) INCLUDE (subtotal_amount, quantity)',
+    'idx_orders_subcategory': '(subcategory)',
+    'idx_orders_order_year': '(order_year) INCLUDE (subtotal_amount)',
+}
+
+# Imports staging at least this fraction of the current row count drop and
+# rebuild the indexes above instead of maintaining them row by row
+INDEX_REBUILD_FRACTION = 0.25
+
+# Indexes replaced by the ones above
+LEGACY_ORDER_INDEXES = (
+    'idx_orders_status', 'idx_orders_category',
+    'idx_orders_status_order_id', 'idx_orders_category_order_id',
+)
+
+# Orders section of database_schema_store.sql: generated date part columns
+# (added to tables created before them; that ALTER rewrites the table, so it
+# only runs here, never from the apps), the stats views and orders_powerbi
+ORDERS_SCHEMA_SQL = schema_section('orders')
+
+# order_id default for rows created by the apps; moved past the imported ids
+# after every load so explicit ids and nextval() never collide
+ORDER_ID_SEQUENCE_SQL = schema_section('orders_id_sequence')
+
+COPY_TO_STAGE_QUERY = """
+COPY {table} (
+    order_id, status, customer_name, order_date,
+    quantity, subtotal_amount, tax_rate, shipping_cost,
+    category, subcategory
+) FROM STDIN WITH (FORMAT csv, HEADER {header})
+"""
+
+INITIAL_COPY_QUERY = """
+COPY orders (
+    order_id, status, customer_name, order_date,
+    quantity, subtotal_amount, tax_rate, shipping_cost,
+    category, subcategory
+) FROM STDIN WITH (FORMAT csv, HEADER true, FREEZE true)
+"""
+
+# Position of each staged row in the file: shard number (set per COPY
+# connection, 0 for a single stream) and arrival order within the shard
+STAGE_POSITION_SQL = """
+ALTER TABLE {table}
+    ADD COLUMN stage_shard int NOT NULL
+        DEFAULT coalesce(current_setting('nextflow.stage_shard', true), '0')::int,
+    ADD COLUMN stage_row bigserial
+"""
+
+# A CSV may repeat an order_id; ON CONFLICT can't touch a row twice in one
+# statement, so keep only the last occurrence in the file
+UPSERT_FROM_STAGE_QUERY = """
+INSERT INTO orders (
+    order_id, status, customer_name, order_date,
+    quantity, subtotal_amount, tax_rate, shipping_cost,
+    category, subcategory
+)
+SELECT DISTINCT ON (order_id)
+    order_id, status, customer_name, order_date,
+    quantity, subtotal_amount, tax_rate, shipping_cost,
+    category, subcategory
+FROM {table}
+ORDER BY order_id, stage_shard DESC, stage_row DESC
+ON CONFLICT (order_id) DO UPDATE SET
+    status = EXCLUDED.status,
+    customer_name = EXCLUDED.customer_name,
+    order_date = EXCLUDED.order_date,
+    quantity = EXCLUDED.quantity,
+    subtotal_amount = EXCLUDED.subtotal_amount,
+    tax_rate = EXCLUDED.tax_rate,
+    shipping_cost = EXCLUDED.shipping_cost,
+    category = EXCLUDED.category,
+    subcategory = EXCLUDED.subcategory;
+"""
+
+
+class _FileRange:
+    """Read-only view of the next ``length`` bytes of an open file (for copy_expert)."""
+
+    def __init__(self, f, length: int):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def _csv_shard_ranges(csv_file: str, parts: int):
+    """Split a CSV file (after its header) into about ``parts`` byte ranges.
+
+    Ranges end on record boundaries: a newline inside a quoted field is not
+    one (an odd number of quotes so far means the record continues). The
+    file is scanned line by line, never held in memory. Returns the list of
+    (csv_file, start, end) ranges and the number of records.
+    """
+    size = os.path.getsize(csv_file)
+    with open(csv_file, 'rb') as f:
+        pos = start = len(f.readline())  # header
+        target_size = max((size - start) // parts, 1)
+        ranges = []
+        records = 0
+        in_quotes = False
+        for line in f:
+            pos += len(line)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+            records += 1
+            if pos - start >= target_size and len(ranges) < parts - 1:
+                ranges.append((csv_file, start, pos))
+                start = pos
+        if pos > start:
+            ranges.append((csv_file, start, pos))
+    return ranges, records
+
+
+def _iter_json_records(f):
+    """Yield the order records of a JSON export opened in binary mode.
+
+    NDJSON files (one object per line, as export_data_to_json writes them)
+    are read line by line, each parsed on its own. Older exports holding a single JSON array are
+    streamed with ijson when it is installed, otherwise loaded whole.
+    """
+    head = f.readline()
+    if head.lstrip().startswith(b'['):
+        f.seek(0)
+        yield from (ijson.items(f, 'item') if ijson is not None else json.load(f))
+        return
+    for line in chain((head,), f):
+        if line.strip():
+            yield _json_loads(line)
 
 
 class SupabaseMigration:
     """Handles data migration to Supabase."""
 
-    def __init__(self, host: str, port: int, database: str, user: str, password: str):
+    def __init__(self, host: str, port: int, database: str, user: str, password: str,
+                 max_connections: int = 4):
         self.connection_params = {
             'host': host,
             'port': port,
@@ -27,17 +203,41 @@ class SupabaseMigration:
             'user': user,
             'password': password
         }
+        self.max_connections = max_connections
+        self.pool = None
+
+    @contextmanager
+    def _connection(self) -> Generator[psycopg2.extensions.connection, None, None]:
+        """Borrow a connection from the pool, creating the pool on first use."""
+        if self.pool is None:
+            self.pool = ThreadedConnectionPool(
+                minconn=1, maxconn=self.max_connections, **self.connection_params
+            )
+
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def close(self):
+        """Close every pooled connection."""
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
 
     def test_connection(self) -> bool:
         """Test connection to Supabase."""
         try:
-            conn = psycopg2.connect(**self.connection_params)
-            cursor = conn.cursor()
-            cursor.execute("SELECT version();")
-            version = cursor.fetchone()
-            logger.info(f"✅ Connected to Supabase: {version[0]}")
-            cursor.close()
-            conn.close()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT version();")
+                version = cursor.fetchone()
+                logger.info(f"✅ Connected to Supabase: {version[0]}")
+                cursor.close()
             return True
         except Exception as e:
             logger.error(f"❌ Connection failed: {e}")
@@ -46,173 +246,274 @@ class SupabaseMigration:
     def create_table_if_not_exists(self) -> bool:
         """Create the orders table if it doesn't exist."""
         try:
-            conn = psycopg2.connect(**self.connection_params)
-            cursor = conn.cursor()
-
-            create_table_sql = """
-            CREATE TABLE IF NOT EXISTS orders (
-              order_id        bigint PRIMARY KEY,
-              status          text NOT NULL,
-              customer_name   text NOT NULL,
-              order_date      date NOT NULL,
-              quantity        integer NOT NULL CHECK (quantity >= 0),
-              subtotal_amount numeric(18,2) NOT NULL CHECK (subtotal_amount >= 0),
-              tax_rate        numeric(6,4)  NOT NULL CHECK (tax_rate >= 0),
-              shipping_cost   numeric(18,2) NOT NULL CHECK (shipping_cost >= 0),
-              category        text NOT NULL,
-              subcategory     text NOT NULL
-            );
-            """
-
-            cursor.execute(create_table_sql)
-            conn.commit()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+
+                create_table_sql = """
+                CREATE TABLE IF NOT EXISTS orders (
+                  order_id        bigint PRIMARY KEY,
+                  status          text NOT NULL,
+                  customer_name   text NOT NULL,
+                  order_date      date NOT NULL,
+                  quantity        integer NOT NULL CHECK (quantity >= 0),
+                  subtotal_amount numeric(18,2) NOT NULL CHECK (subtotal_amount >= 0),
+                  tax_rate        numeric(6,4)  NOT NULL CHECK (tax_rate >= 0),
+                  shipping_cost   numeric(18,2) NOT NULL CHECK (shipping_cost >= 0),
+                  category        text NOT NULL,
+                  subcategory     text NOT NULL
+                );
+                """
+
+                cursor.execute(create_table_sql)
+                cursor.execute(ORDERS_SCHEMA_SQL)
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(ORDER_ID_SEQUENCE_SQL)
+                conn.commit()
 
-            logger.info("✅ Table 'orders' created or already exists")
+                logger.info("✅ Table 'orders' created or already exists")
 
-            cursor.close()
-            conn.close()
+                cursor.close()
             return True
 
         except Exception as e:
             logger.error(f"❌ Error creating table: {e}")
             return False
 
-    def import_from_csv(self, csv_file: str, batch_size: int = 1000) -> bool:
-        """Import data from CSV file."""
+    def import_from_csv(self, csv_file: str, batch_size: int = 10000, workers: int = 1,
+                        initial_load: bool = False) -> bool:
+        """Import data from CSV file.
+
+        The file is streamed into a staging table with COPY and then upserted
+        into ``orders`` with a single INSERT ... SELECT, so the number of
+        round-trips does not grow with the row count. With ``workers > 1``
+        the rows are split into contiguous shards that are copied
+        concurrently over separate pooled connections.
+
+        ``initial_load`` replaces the contents of ``orders`` instead of
+        upserting: the table is truncated and loaded with COPY ... FREEZE
+        in one transaction, which skips the later freeze/hint-bit pass.
+        """
+        if initial_load:
+            return self._import_csv_initial(csv_file)
+
+        if workers > 1:
+            return self._import_csv_parallel(csv_file, workers)
+
         try:
             logger.info(f"Reading CSV file: {csv_file}")
-            df = pd.read_csv(csv_file)
 
-            logger.info(f"Found {len(df)} records to import")
+            with self._connection() as conn:
+                cursor = conn.cursor()
 
-            conn = psycopg2.connect(**self.connection_params)
-            cursor = conn.cursor()
+                # Staging table lives only for this transaction
+                cursor.execute("""
+                CREATE TEMP TABLE orders_stage (LIKE orders INCLUDING DEFAULTS)
+                ON COMMIT DROP;
+                """)
+                cursor.execute(STAGE_POSITION_SQL.format(table='orders_stage'))
 
-            # Prepare insert query
-            insert_query = """
-            INSERT INTO orders (
-                order_id, status, customer_name, order_date,
-                quantity, subtotal_amount, tax_rate, shipping_cost,
-                category, subcategory
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            ON CONFLICT (order_id) DO UPDATE SET
-                status = EXCLUDED.status,
-                customer_name = EXCLUDED.customer_name,
-                order_date = EXCLUDED.order_date,
-                quantity = EXCLUDED.quantity,
-                subtotal_amount = EXCLUDED.subtotal_amount,
-                tax_rate = EXCLUDED.tax_rate,
-                shipping_cost = EXCLUDED.shipping_cost,
-                category = EXCLUDED.category,
-                subcategory = EXCLUDED.subcategory;
-            """
-
-            # Convert dataframe to list of tuples
-            data = [
-                (
-                    row['order_id'],
-                    row['status'],
-                    row['customer_name'],
-                    row['order_date'],
-                    row['quantity'],
-                    row['subtotal_amount'],
-                    row['tax_rate'],
-                    row['shipping_cost'],
-                    row['category'],
-                    row['subcategory']
-                )
-                for _, row in df.iterrows()
-            ]
+                with open(csv_file, 'rb') as f:
+                    cursor.copy_expert(
+                        COPY_TO_STAGE_QUERY.format(table='orders_stage', header='true'), f
+                    )
 
-            # Import in batches
-            total_batches = (len(data) + batch_size - 1) // batch_size
+                logger.info(f"Found {cursor.rowcount} records to import")
 
-            for i in range(0, len(data), batch_size):
-                batch = data[i:i + batch_size]
-                execute_batch(cursor, insert_query, batch)
+                imported = self._upsert_from_stage(cursor, 'orders_stage')
                 conn.commit()
 
-                batch_num = (i // batch_size) + 1
-                logger.info(f"✅ Imported batch {batch_num}/{total_batches} ({len(batch)} records)")
+                cursor.close()
+
+            logger.info(f"✅ Successfully imported {imported} records")
+            return True
 
-            cursor.close()
-            conn.close()
+        except Exception as e:
+            logger.error(f"❌ Error importing from CSV: {e}")
+            return False
 
-            logger.info(f"✅ Successfully imported {len(data)} records")
+    def _import_csv_initial(self, csv_file: str) -> bool:
+        """First-time load: TRUNCATE and COPY FREEZE straight into orders."""
+        try:
+            logger.info(f"Reading CSV file: {csv_file}")
+
+            with self._connection() as conn:
+                with conn.cursor() as cursor:
+                    # FREEZE requires the table to be truncated (or created)
+                    # in the same transaction as the COPY
+                    cursor.execute("TRUNCATE orders")
+                    # The table is locked by TRUNCATE anyway: build the
+                    # indexes once after the COPY
+                    self._drop_order_indexes(cursor)
+                    with open(csv_file, 'rb') as f:
+                        cursor.copy_expert(INITIAL_COPY_QUERY, f)
+                    imported = cursor.rowcount
+                    self._create_order_indexes(cursor)
+                    cursor.execute(ORDER_ID_SEQUENCE_SQL)
+                    cursor.execute("ANALYZE orders")
+                conn.commit()
+
+            logger.info(f"✅ Successfully imported {imported} records")
             return True
 
         except Exception as e:
             logger.error(f"❌ Error importing from CSV: {e}")
             return False
 
-    def import_from_json(self, json_file: str, batch_size: int = 1000) -> bool:
-        """Import data from JSON file."""
+    def _import_csv_parallel(self, csv_file: str, workers: int) -> bool:
+        """Import a CSV file using one COPY stream per worker."""
+        # Temp tables are per-session, so shards share an unlogged table
+        stage_table = f"orders_stage_{os.getpid()}"
+
         try:
-            logger.info(f"Reading JSON file: {json_file}")
+            logger.info(f"Reading CSV file: {csv_file}")
 
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data_list = json.load(f)
+            # Byte ranges of the raw file, each COPYed as-is (no parsing in
+            # Python, and COPY still tells quoted empty strings from NULL)
+            shards, records = _csv_shard_ranges(csv_file, workers)
 
-            logger.info(f"Found {len(data_list)} records to import")
+            logger.info(f"Found {records} records to import ({len(shards)} shards)")
 
-            conn = psycopg2.connect(**self.connection_params)
-            cursor = conn.cursor()
+            with self._connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"CREATE UNLOGGED TABLE {stage_table} (LIKE orders INCLUDING DEFAULTS)"
+                    )
+                    cursor.execute(STAGE_POSITION_SQL.format(table=stage_table))
+                conn.commit()
 
-            # Prepare insert query
-            insert_query = """
-            INSERT INTO orders (
-                order_id, status, customer_name, order_date,
-                quantity, subtotal_amount, tax_rate, shipping_cost,
-                category, subcategory
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            ON CONFLICT (order_id) DO UPDATE SET
-                status = EXCLUDED.status,
-                customer_name = EXCLUDED.customer_name,
-                order_date = EXCLUDED.order_date,
-                quantity = EXCLUDED.quantity,
-                subtotal_amount = EXCLUDED.subtotal_amount,
-                tax_rate = EXCLUDED.tax_rate,
-                shipping_cost = EXCLUDED.shipping_cost,
-                category = EXCLUDED.category,
-                subcategory = EXCLUDED.subcategory;
-            """
-
-            # Convert to list of tuples
-            data = [
-                (
-                    row['order_id'],
-                    row['status'],
-                    row['customer_name'],
-                    row['order_date'],
-                    row['quantity'],
-                    row['subtotal_amount'],
-                    row['tax_rate'],
-                    row['shipping_cost'],
-                    row['category'],
-                    row['subcategory']
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    copied = sum(executor.map(
+                        lambda job: self._copy_shard(stage_table, *job), enumerate(shards)
+                    ))
+                logger.info(f"Copied {copied} records into {stage_table}")
+
+                with self._connection() as conn:
+                    with conn.cursor() as cursor:
+                        imported = self._upsert_from_stage(cursor, stage_table)
+                    conn.commit()
+            finally:
+                with self._connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"DROP TABLE IF EXISTS {stage_table}")
+                    conn.commit()
+
+            logger.info(f"✅ Successfully imported {imported} records")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error importing from CSV: {e}")
+            return False
+
+    def _drop_order_indexes(self, cursor):
+        """Drop the secondary orders indexes (and legacy ones) before a bulk load."""
+        cursor.execute(
+            f"DROP INDEX IF EXISTS {', '.join((*ORDER_INDEXES, *LEGACY_ORDER_INDEXES))}"
+        )
+
+    def _create_order_indexes(self, cursor):
+        """Create any missing secondary orders index."""
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for index_name, definition in ORDER_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON orders {definition}")
+
+    def _upsert_from_stage(self, cursor, stage_table: str) -> int:
+        """Merge the staging table into orders.
+
+        When the staged rows are a large part of the table (at least
+        INDEX_REBUILD_FRACTION of it) the secondary indexes are dropped for
+        the load and rebuilt afterwards, since a sorted build is cheaper than
+        per-row maintenance. Smaller, incremental imports keep the indexes:
+        a rebuild would hold ACCESS EXCLUSIVE on orders for its whole
+        duration. Everything runs in the caller's transaction, so a failure
+        restores the indexes on rollback.
+        """
+        cursor.execute("SET LOCAL synchronous_commit = off")
+
+        cursor.execute(f"SELECT count(*) FROM {stage_table}")
+        staged = cursor.fetchone()[0]
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = 'orders'::regclass")
+        existing = max(cursor.fetchone()[0], 0)
+        rebuild = staged >= existing * INDEX_REBUILD_FRACTION
+
+        if rebuild:
+            self._drop_order_indexes(cursor)
+        else:
+            cursor.execute(f"DROP INDEX IF EXISTS {', '.join(LEGACY_ORDER_INDEXES)}")
+
+        cursor.execute(UPSERT_FROM_STAGE_QUERY.format(table=stage_table))
+        imported = cursor.rowcount
+
+        self._create_order_indexes(cursor)
+        cursor.execute(ORDER_ID_SEQUENCE_SQL)
+        cursor.execute("ANALYZE orders")
+
+        return imported
+
+    def _copy_shard(self, stage_table: str, index: int, shard: tuple) -> int:
+        """COPY one (csv_file, start, end) byte range into the staging table on its own connection."""
+        csv_file, start, end = shard
+        with self._connection() as conn, open(csv_file, 'rb') as f:
+            f.seek(start)
+            with conn.cursor() as cursor:
+                # Tags the rows with their shard (stage_shard default)
+                cursor.execute("SELECT set_config('nextflow.stage_shard', %s, true)", (str(index),))
+                cursor.copy_expert(
+                    COPY_TO_STAGE_QUERY.format(table=stage_table, header='false'),
+                    _FileRange(f, end - start)
                 )
-                for row in data_list
-            ]
+                copied = cursor.rowcount
+            conn.commit()
+        return copied
 
-            # Import in batches
-            total_batches = (len(data) + batch_size - 1) // batch_size
+    def import_from_json(self, json_file: str, batch_size: int = 10000) -> bool:
+        """Import data from JSON file."""
+        try:
+            logger.info(f"Reading JSON file: {json_file}")
 
-            for i in range(0, len(data), batch_size):
-                batch = data[i:i + batch_size]
-                execute_batch(cursor, insert_query, batch)
+            with open(json_file, 'rb') as f, self._connection() as conn:
+                records = _iter_json_records(f)
+
+                cursor = conn.cursor()
+
+                # Prepare insert query
+                insert_query = """
+                INSERT INTO orders (
+                    order_id, status, customer_name, order_date,
+                    quantity, subtotal_amount, tax_rate, shipping_cost,
+                    category, subcategory
+                ) VALUES %s
+                ON CONFLICT (order_id) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    customer_name = EXCLUDED.customer_name,
+                    order_date = EXCLUDED.order_date,
+                    quantity = EXCLUDED.quantity,
+                    subtotal_amount = EXCLUDED.subtotal_amount,
+                    tax_rate = EXCLUDED.tax_rate,
+                    shipping_cost = EXCLUDED.shipping_cost,
+                    category = EXCLUDED.category,
+                    subcategory = EXCLUDED.subcategory;
+                """
+
+                # Lazily project each record to a row tuple; execute_values
+                # consumes the iterator page by page
+                row_values = itemgetter(*ORDER_COLUMNS)
+                imported = 0
+
+                def rows():
+                    nonlocal imported
+                    for record in records:
+                        imported += 1
+                        yield row_values(record)
+
+                # One multi-row INSERT per page of batch_size rows
+                execute_values(cursor, insert_query, rows(), page_size=batch_size)
+                cursor.execute(ORDER_ID_SEQUENCE_SQL)
                 conn.commit()
 
-                batch_num = (i // batch_size) + 1
-                logger.info(f"✅ Imported batch {batch_num}/{total_batches} ({len(batch)} records)")
+                cursor.close()
 
-            cursor.close()
-            conn.close()
-
-            logger.info(f"✅ Successfully imported {len(data)} records")
+            logger.info(f"✅ Successfully imported {imported} records")
             return True
 
         except Exception as e:
@@ -222,19 +523,18 @@ class SupabaseMigration:
     def verify_import(self) -> Dict[str, Any]:
         """Verify the imported data."""
         try:
-            conn = psycopg2.connect(**self.connection_params)
-            cursor = conn.cursor()
+            with self._connection() as conn:
+                cursor = conn.cursor()
 
-            # Get count
-            cursor.execute("SELECT COUNT(*) FROM orders")
-            count = cursor.fetchone()[0]
+                # Get count
+                cursor.execute("SELECT COUNT(*) FROM orders")
+                count = cursor.fetchone()[0]
 
-            # Get sample data
-            cursor.execute("SELECT * FROM orders LIMIT 5")
-            sample = cursor.fetchall()
+                # Get sample data
+                cursor.execute("SELECT * FROM orders LIMIT 5")
+                sample = cursor.fetchall()
 
-            cursor.close()
-            conn.close()
+                cursor.close()
 
             logger.info(f"✅ Verification: Found {count} records in Supabase")
 
@@ -252,13 +552,16 @@ def main():
     """Main function."""
     parser = argparse.ArgumentParser(description='Import data to Supabase')
     parser.add_argument('--csv', help='Path to CSV file to import')
-    parser.add_argument('--json', help='Path to JSON file to import')
+    parser.add_argument('--json', help='Path to JSON (NDJSON) file to import')
     parser.add_argument('--host', required=True, help='Supabase host (e.g., xxx.supabase.co)')
     parser.add_argument('--port', type=int, default=5432, help='Database port (default: 5432)')
     parser.add_argument('--database', default='postgres', help='Database name (default: postgres)')
     parser.add_argument('--user', default='postgres', help='Database user (default: postgres)')
     parser.add_argument('--password', required=True, help='Database password')
-    parser.add_argument('--batch-size', type=int, default=1000, help='Batch size for import (default: 1000)')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Batch size for import (default: 10000)')
+    parser.add_argument('--initial-load', action='store_true',
+                        help='Replace existing orders with a TRUNCATE + COPY FREEZE load (CSV only)')
+    parser.add_argument('--workers', type=int, default=1, help='Parallel COPY streams for CSV import (default: 1)')
 
     args = parser.parse_args()
 
@@ -274,9 +577,18 @@ def main():
         port=args.port,
         database=args.database,
         user=args.user,
-        password=args.password
+        password=args.password,
+        max_connections=max(4, args.workers)
     )
 
+    try:
+        return run_import(migration, args)
+    finally:
+        migration.close()
+
+
+def run_import(migration: SupabaseMigration, args: argparse.Namespace) -> int:
+    """Run the import steps, returning the process exit code."""
     # Test connection
     print("\n1. Testing connection to Supabase...")
     if not migration.test_connection():
@@ -294,7 +606,9 @@ def main():
     success = False
 
     if args.csv:
-        success = migration.import_from_csv(args.csv, args.batch_size)
+        success = migration.import_from_csv(
+            args.csv, args.batch_size, args.workers, initial_load=args.initial_load
+        )
     elif args.json:
         success = migration.import_from_json(args.json, args.batch_size)
 
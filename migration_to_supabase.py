@@ -8,8 +8,7 @@ Este script:
 """
 import sys
 import os
-import json
-import pandas as pd
+import argparse
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from loguru import logger
@@ -18,24 +17,18 @@ from loguru import logger
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.database.connection import db_connection
-
-
-class DatabaseMigration:
-    """Handles database migration from local PostgreSQL to Supabase."""
-
-    def __init__(self):
-        self.export_dir = "migration_exports"
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        os.makedirs(self.export_dir, exist_ok=True)
-
-    def export_schema(self) -> str:
-        """Export the database schema (DDL)."""
-        logger.info("Exporting database schema...")
-
-        schema_sql = """
--- Database Schema for Supabase Migration
--- Generated: {timestamp}
-
+from src.database.schema import schema_section
+
+# Stored columns of orders, in table order (the generated date parts are left
+# out of the data exports)
+ORDER_COLUMNS = (
+    'order_id', 'status', 'customer_name', 'order_date',
+    'quantity', 'subtotal_amount', 'tax_rate', 'shipping_cost',
+    'category', 'subcategory',
+)
+
+# Static DDL written by export_schema (the header with the timestamp is prepended)
+SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS orders (
   order_id        bigint PRIMARY KEY,
   status          text NOT NULL,
@@ -46,15 +39,31 @@ CREATE TABLE IF NOT EXISTS orders (
   tax_rate        numeric(6,4)  NOT NULL CHECK (tax_rate >= 0),
   shipping_cost   numeric(18,2) NOT NULL CHECK (shipping_cost >= 0),
   category        text NOT NULL,
-  subcategory     text NOT NULL
+  subcategory     text NOT NULL,
+  order_year      int GENERATED ALWAYS AS (EXTRACT(YEAR FROM order_date)::int) STORED,
+  order_month     int GENERATED ALWAYS AS (EXTRACT(MONTH FROM order_date)::int) STORED,
+  order_quarter   int GENERATED ALWAYS AS (EXTRACT(QUARTER FROM order_date)::int) STORED
 );
 
+-- Shared with database_schema_store.sql: date part columns on older tables,
+-- stats materialized views and the orders_powerbi view
+""" + schema_section('orders') + """
+-- order_id assigned by a sequence instead of MAX(order_id) + 1
+""" + schema_section('orders_id_sequence') + """
+
 -- Indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+-- status/category filters are always ordered by order_id DESC; the INCLUDE
+-- columns let the stats views' GROUP BY status / category use index-only scans
+CREATE INDEX IF NOT EXISTS idx_orders_status_covering ON orders(status, order_id DESC) INCLUDE (subtotal_amount);
 CREATE INDEX IF NOT EXISTS idx_orders_customer_name ON orders(customer_name);
 CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders(order_date);
-CREATE INDEX IF NOT EXISTS idx_orders_category ON orders(category);
+CREATE INDEX IF NOT EXISTS idx_orders_category_covering ON orders(category, order_id DESC) INCLUDE (subtotal_amount, quantity);
 CREATE INDEX IF NOT EXISTS idx_orders_subcategory ON orders(subcategory);
+DROP INDEX IF EXISTS idx_orders_status, idx_orders_category, idx_orders_status_order_id, idx_orders_category_order_id;
+
+-- customer_name ILIKE '%...%' (n8n search_orders)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_orders_customer_name_trgm ON orders USING gin (customer_name gin_trgm_ops);
 
 -- Row Level Security (RLS) policies for Supabase
 -- Uncomment and adjust based on your security requirements
@@ -80,7 +89,29 @@ CREATE INDEX IF NOT EXISTS idx_orders_subcategory ON orders(subcategory);
 -- ON orders FOR DELETE
 -- TO authenticated
 -- USING (true);
-""".format(timestamp=self.timestamp)
+"""
+
+
+class DatabaseMigration:
+    """Handles database migration from local PostgreSQL to Supabase."""
+
+    def __init__(self, ordered: bool = False):
+        self.export_dir = "migration_exports"
+        # Sorting by order_id is only needed for diff-friendly exports;
+        # the import upserts by key and does not depend on row order
+        self.ordered = ordered
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def export_schema(self) -> str:
+        """Export the database schema (DDL)."""
+        logger.info("Exporting database schema...")
+
+        schema_sql = (
+            "\n-- Database Schema for Supabase Migration\n"
+            f"-- Generated: {self.timestamp}\n"
+            + SCHEMA_SQL
+        )
 
         schema_file = os.path.join(self.export_dir, f"schema_{self.timestamp}.sql")
         with open(schema_file, 'w', encoding='utf-8') as f:
@@ -94,15 +125,23 @@ CREATE INDEX IF NOT EXISTS idx_orders_subcategory ON orders(subcategory);
         logger.info("Exporting data to CSV...")
 
         try:
-            query = "SELECT * FROM orders ORDER BY order_id"
-
-            with db_connection.get_connection() as conn:
-                df = pd.read_sql_query(query, conn)
+            # The server formats the CSV; rows are written straight to disk
+            order_clause = " ORDER BY order_id" if self.ordered else ""
+            # Only the stored columns; the generated date parts are recomputed on import
+            query = (
+                f"COPY (SELECT {', '.join(ORDER_COLUMNS)} FROM orders{order_clause}) "
+                "TO STDOUT WITH (FORMAT csv, HEADER true)"
+            )
 
             csv_file = os.path.join(self.export_dir, f"orders_data_{self.timestamp}.csv")
-            df.to_csv(csv_file, index=False, encoding='utf-8')
+            with db_connection.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    db_connection.lift_statement_timeout(cursor)
+                    with open(csv_file, 'wb') as f:
+                        cursor.copy_expert(query, f)
+                    exported = cursor.rowcount
 
-            logger.info(f"✅ Exported {len(df)} records to: {csv_file}")
+            logger.info(f"✅ Exported {exported} records to: {csv_file}")
             return csv_file
 
         except Exception as e:
@@ -110,27 +149,31 @@ CREATE INDEX IF NOT EXISTS idx_orders_subcategory ON orders(subcategory);
             raise
 
     def export_data_to_json(self) -> str:
-        """Export all data from orders table to JSON."""
+        """Export all data from orders table to NDJSON (one JSON object per line)."""
         logger.info("Exporting data to JSON...")
 
         try:
-            query = "SELECT * FROM orders ORDER BY order_id"
-            results = db_connection.execute_query(query)
-
-            # Convert date objects to strings
-            for row in results:
-                if 'order_date' in row and row['order_date']:
-                    row['order_date'] = row['order_date'].isoformat()
-                # Convert Decimal to float for JSON serialization
-                for key in ['subtotal_amount', 'tax_rate', 'shipping_cost']:
-                    if key in row and row[key] is not None:
-                        row[key] = float(row[key])
-
-            json_file = os.path.join(self.export_dir, f"orders_data_{self.timestamp}.json")
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-
-            logger.info(f"✅ Exported {len(results)} records to: {json_file}")
+            # The server renders each row with row_to_json and COPY streams
+            # the lines straight to disk. CSV format with control characters
+            # as quote/delimiter writes them untouched: text format would
+            # double every backslash, and JSON never has them raw
+            order_clause = " ORDER BY o.order_id" if self.ordered else ""
+            # Same columns as the CSV export
+            query = (
+                "COPY (SELECT row_to_json(o) FROM "
+                f"(SELECT {', '.join(ORDER_COLUMNS)} FROM orders) o{order_clause}) "
+                "TO STDOUT WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+            )
+
+            json_file = os.path.join(self.export_dir, f"orders_data_{self.timestamp}.ndjson")
+            with db_connection.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    db_connection.lift_statement_timeout(cursor)
+                    with open(json_file, 'wb') as f:
+                        cursor.copy_expert(query, f)
+                    exported = cursor.rowcount
+
+            logger.info(f"✅ Exported {exported} records to: {json_file}")
             return json_file
 
         except Exception as e:
@@ -156,7 +199,12 @@ CREATE INDEX IF NOT EXISTS idx_orders_subcategory ON orders(subcategory);
             FROM orders
             """
 
-            stats = db_connection.execute_query(stats_query)[0]
+            # Full-table aggregate: no statement_timeout for it
+            with db_connection.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    db_connection.lift_statement_timeout(cursor)
+                    cursor.execute(stats_query)
+                    stats = cursor.fetchone()
 
             report = f"""
 # Migration Report
@@ -302,7 +350,12 @@ python start_web_app.py
 
 def main():
     """Main function."""
-    migration = DatabaseMigration()
+    parser = argparse.ArgumentParser(description='Export local data for Supabase migration')
+    parser.add_argument('--ordered', action='store_true',
+                        help='Sort exported rows by order_id (stable output for diffs)')
+    args = parser.parse_args()
+
+    migration = DatabaseMigration(ordered=args.ordered)
     success = migration.run_export()
 
     if success:
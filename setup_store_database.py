@@ -3,24 +3,60 @@ Setup Store Database
 Creates the necessary tables for the store module
 """
 
+import argparse
+import os
 import sys
 from loguru import logger
 from src.database.connection import DatabaseConnection
+from src.database.schema import schema_section
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database_schema_store.sql')
+
+
+def migrate_orders():
+    """
+    Apply only the orders section of the schema (generated date part
+    columns, stats views, orders_powerbi) to an existing database.
+
+    One-time migration for databases set up before those columns existed;
+    unlike the full script it does not insert the sample products again.
+    """
+    logger.info("Migrating orders table...")
+
+    try:
+        db = DatabaseConnection()
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                # Rewrites orders once (ADD COLUMN ... STORED): no statement_timeout
+                db.lift_statement_timeout(cursor)
+                cursor.execute(schema_section('orders'))
+                conn.commit()
+
+        logger.info("Orders table migrated successfully!")
+        print("[OK] Orders table migrated!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error migrating orders table: {e}")
+        print(f"[ERROR] Error: {e}")
+        return False
 
 
 def setup_database():
     """Create store tables in the database"""
     logger.info("Setting up store database tables...")
 
-    # Read SQL schema
-    with open('database_schema_store.sql', 'r') as f:
+    # Read SQL schema as raw UTF-8 bytes; psycopg2 sends them without re-encoding
+    with open(SCHEMA_FILE, 'rb') as f:
         sql_script = f.read()
 
     try:
         db = DatabaseConnection()
         with db.get_connection() as conn:
             with conn.cursor() as cursor:
-                # Execute the SQL script
+                # Execute the whole script in one round trip; the DDL may
+                # outlast the pool's statement_timeout
+                db.lift_statement_timeout(cursor)
                 cursor.execute(sql_script)
                 conn.commit()
 
@@ -41,5 +77,10 @@ def setup_database():
 
 
 if __name__ == '__main__':
-    success = setup_database()
+    parser = argparse.ArgumentParser(description='Create the store tables')
+    parser.add_argument('--orders-only', action='store_true',
+                        help='Only migrate the existing orders table (no sample products)')
+    args = parser.parse_args()
+
+    success = migrate_orders() if args.orders_only else setup_database()
     sys.exit(0 if success else 1)
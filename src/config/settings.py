@@ -2,6 +2,8 @@
 Configuration settings for the database connection and application.
 """
 import os
+import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from pydantic import Field
@@ -12,8 +14,14 @@ from dotenv import load_dotenv
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 ENV_FILE = PROJECT_ROOT / ".env"
 
-# Load environment variables from .env file
-load_dotenv(ENV_FILE)
+# Load environment variables from .env file once per process (child
+# processes inherit both the variables and the sentinel)
+if not os.environ.get("_NEXTFLOW_ENV_LOADED"):
+    load_dotenv(ENV_FILE)
+    os.environ["_NEXTFLOW_ENV_LOADED"] = "1"
+
+# Name of the running script (store_app, web_app, ...) for pg_stat_activity
+_SCRIPT_NAME = Path(sys.argv[0]).stem if Path(sys.argv[0]).stem.isidentifier() else "nextflow"
 
 
 class DatabaseSettings(BaseSettings):
@@ -25,6 +33,13 @@ class DatabaseSettings(BaseSettings):
     user: str = Field(default="postgres", env="PG_USER")
     password: str = Field(default="postgres", env="PG_PASS")
     db_schema: str = Field(default="public", env="PG_SCHEMA_RAW")
+    # Pooled connections: name shown in pg_stat_activity and per-statement limit
+    application_name: str = Field(default=_SCRIPT_NAME, env="PG_APP_NAME")
+    statement_timeout_ms: int = Field(default=5000, env="PG_STATEMENT_TIMEOUT_MS")
+    # Connection pool bounds; callers wait up to pool_timeout_s for a free slot
+    pool_min_size: int = Field(default=2, env="PG_POOL_MIN")
+    pool_max_size: int = Field(default=20, env="PG_POOL_MAX")
+    pool_timeout_s: float = Field(default=30.0, env="PG_POOL_TIMEOUT")
     
     @property
     def connection_string(self) -> str:
@@ -70,7 +85,30 @@ class N8NSettings(BaseSettings):
         return self.url
 
 
+@lru_cache(maxsize=1)
+def get_db_settings() -> DatabaseSettings:
+    """Return the process-wide database settings."""
+    return DatabaseSettings()
+
+
+@lru_cache(maxsize=1)
+def get_logging_settings() -> LoggingSettings:
+    """Return the process-wide logging settings."""
+    return LoggingSettings()
+
+
+@lru_cache(maxsize=1)
+def get_n8n_settings() -> N8NSettings:
+    """Return the process-wide n8n webhook settings."""
+    return N8NSettings()
+
+
 # Global settings instances
-db_settings = DatabaseSettings()
-logging_settings = LoggingSettings()
-n8n_settings = N8NSettings()
+db_settings = get_db_settings()
+logging_settings = get_logging_settings()
+n8n_settings = get_n8n_settings()
+
+# n8n values resolved once, for code that reads them on every call
+N8N_WEBHOOK_URL = n8n_settings.webhook_url
+N8N_WEBHOOK_ENABLED = n8n_settings.enabled
+N8N_WEBHOOK_SECRET = n8n_settings.secret
@@ -1,12 +1,19 @@
 """
 Database connection management for PostgreSQL.
 """
+import atexit
+import tempfile
+import threading
+import uuid
+import weakref
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
-from typing import Generator, Dict, Any, List, Optional
+from typing import Generator, Dict, Any, Iterator, List, Optional, Sequence
 from loguru import logger
 
 from src.config.settings import db_settings
@@ -14,6 +21,17 @@ from src.config.settings import db_settings
 
 class DatabaseConnection:
     """Handles database connections and operations."""
+
+    # psycopg2 pool shared by every instance, created on first use
+    _pool: Optional[ThreadedConnectionPool] = None
+    _pool_lock = threading.Lock()
+    # One slot per pooled connection: getconn() raises when the pool is
+    # exhausted, so callers queue here instead
+    _pool_slots: Optional[threading.BoundedSemaphore] = None
+
+    # Names of the statements already PREPAREd on each pooled connection
+    _prepared: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+    _prepared_lock = threading.Lock()
     
     def __init__(self):
         self.connection_string = db_settings.connection_string
@@ -40,29 +58,141 @@ class DatabaseConnection:
             logger.error(f"Failed to initialize database engine: {e}")
             raise
     
+    @classmethod
+    def _get_pool(cls) -> ThreadedConnectionPool:
+        """Return the shared connection pool, creating it if needed."""
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool_slots = threading.BoundedSemaphore(db_settings.pool_max_size)
+                    cls._pool = ThreadedConnectionPool(
+                        minconn=db_settings.pool_min_size,
+                        maxconn=db_settings.pool_max_size,
+                        host=db_settings.host,
+                        port=db_settings.port,
+                        database=db_settings.name,
+                        user=db_settings.user,
+                        password=db_settings.password,
+                        application_name=db_settings.application_name,
+                        # 0 = sin limite; protege el pool de consultas que no terminan
+                        options=f"-c statement_timeout={db_settings.statement_timeout_ms}",
+                        cursor_factory=RealDictCursor
+                    )
+                    atexit.register(cls.close_pool)
+                    logger.info("Database connection pool initialized")
+        return cls._pool
+
+    @classmethod
+    def close_pool(cls):
+        """Close every pooled connection (registered with atexit)."""
+        with cls._pool_lock:
+            if cls._pool is not None and not cls._pool.closed:
+                cls._pool.closeall()
+            cls._pool = None
+
+    @staticmethod
+    def lift_statement_timeout(cursor) -> None:
+        """
+        Disable the pool-wide statement_timeout for the current transaction.
+
+        For long-running work on pooled connections (exports, view
+        refreshes, DDL); SET LOCAL ends with the transaction, so the
+        connection goes back to the pool with the normal limit.
+        """
+        cursor.execute("SET LOCAL statement_timeout = 0")
+
     @contextmanager
     def get_connection(self) -> Generator[psycopg2.extensions.connection, None, None]:
-        """Get a raw psycopg2 connection with context manager."""
+        """Get a pooled psycopg2 connection with context manager."""
+        pool = None
         conn = None
+        slots = None
         try:
-            conn = psycopg2.connect(
-                host=db_settings.host,
-                port=db_settings.port,
-                database=db_settings.name,
-                user=db_settings.user,
-                password=db_settings.password,
-                cursor_factory=RealDictCursor
-            )
+            pool = self._get_pool()
+            if not self._pool_slots.acquire(timeout=db_settings.pool_timeout_s):
+                raise PoolError(
+                    f"No database connection free after {db_settings.pool_timeout_s}s "
+                    f"(pool size {db_settings.pool_max_size})"
+                )
+            slots = self._pool_slots
+            conn = pool.getconn()
             yield conn
         except Exception as e:
             logger.error(f"Database connection error: {e}")
-            if conn:
-                conn.rollback()
             raise
         finally:
             if conn:
-                conn.close()
+                # Hand the connection back without an open transaction;
+                # drop it from the pool if it can't be reset
+                discard = bool(conn.closed)
+                if not discard and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+                pool.putconn(conn, close=discard)
+            if slots is not None:
+                slots.release()
     
+    def execute_prepared(
+        self,
+        cursor,
+        name: str,
+        query: str,
+        params: Sequence[Any] = (),
+        arg_types: str = ""
+    ) -> None:
+        """
+        Execute a query as a server-side prepared statement.
+
+        The statement is PREPAREd the first time it is used on the cursor's
+        connection; afterwards only EXECUTE is sent, so Postgres skips the
+        parse/plan step. ``query`` uses $1, $2... placeholders.
+        """
+        conn = cursor.connection
+        with self._prepared_lock:
+            prepared = self._prepared.setdefault(conn, set())
+            needs_prepare = name not in prepared
+
+        if needs_prepare:
+            types = f"({arg_types})" if arg_types else ""
+            cursor.execute(f"PREPARE {name}{types} AS {query}")
+            with self._prepared_lock:
+                prepared.add(name)
+
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cursor.execute(f"EXECUTE {name}({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def query_prepared(
+        self, name: str, query: str, params: Sequence[Any] = (), arg_types: str = ""
+    ) -> List[Dict[str, Any]]:
+        """Run a SELECT as a prepared statement (see execute_prepared) and return its rows."""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self.execute_prepared(cursor, name, query, params, arg_types)
+                    return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Prepared query {name} failed: {e}")
+            raise
+
+    def update_prepared(
+        self, name: str, query: str, params: Sequence[Any] = (), arg_types: str = ""
+    ) -> int:
+        """Run an UPDATE/INSERT/DELETE as a prepared statement and return affected rows."""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self.execute_prepared(cursor, name, query, params, arg_types)
+                    conn.commit()
+                    return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Prepared update {name} failed: {e}")
+            raise
+
     @contextmanager
     def get_session(self):
         """Get SQLAlchemy session with context manager."""
@@ -102,6 +232,46 @@ class DatabaseConnection:
             logger.error(f"Query execution failed: {e}")
             raise
     
+    def iter_query(
+        self, query: str, params: Optional[Dict[str, Any]] = None, itersize: int = 10000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the rows of a SELECT through a server-side (named) cursor.
+
+        Only ``itersize`` rows are fetched per round-trip, so large results
+        are never held in memory. The pooled connection is kept until the
+        generator is exhausted or closed.
+        """
+        with self.get_connection() as conn:
+            # Streams read the whole result: no per-statement limit
+            with conn.cursor() as setup:
+                self.lift_statement_timeout(setup)
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                yield from cursor
+
+    def copy_out(self, copy_sql: str, max_memory: int = 8 * 1024 * 1024) -> "tempfile.SpooledTemporaryFile":
+        """
+        Run a ``COPY ... TO STDOUT`` statement and return its output.
+
+        The data is written by the server straight into a spooled temp file
+        (in memory up to ``max_memory`` bytes, then on disk), rewound and
+        ready to read. The caller closes it.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self.lift_statement_timeout(cursor)
+                    cursor.copy_expert(copy_sql, buffer)
+            buffer.seek(0)
+            return buffer
+        except Exception as e:
+            buffer.close()
+            logger.error(f"COPY failed: {e}")
+            raise
+    
     def execute_update(self, query: str, params: Optional[Dict[str, Any]] = None) -> int:
         """Execute an UPDATE/INSERT/DELETE query and return affected rows."""
         try:
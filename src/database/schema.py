@@ -0,0 +1,19 @@
+"""
+Sections of database_schema_store.sql shared with the migration scripts.
+"""
+from pathlib import Path
+
+SCHEMA_FILE = Path(__file__).resolve().parents[2] / "database_schema_store.sql"
+
+
+def schema_section(name: str) -> str:
+    """
+    Return the SQL between ``-- BEGIN <name>`` and ``-- END <name>`` in the schema file.
+
+    Lets the migration scripts run the same DDL as setup_store_database.py
+    instead of keeping their own copies of it.
+    """
+    sql = SCHEMA_FILE.read_text(encoding="utf-8")
+    begin, end = f"-- BEGIN {name}\n", f"-- END {name}\n"
+    start = sql.index(begin) + len(begin)
+    return sql[start:sql.index(end, start)]
@@ -3,26 +3,149 @@ n8n Webhook Integration for NextFlow.
 
 This module handles sending events to n8n workflows via webhooks.
 """
+import asyncio
 import requests
 import json
+import queue
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from loguru import logger
 
-from src.config.settings import n8n_settings
+from src.config.settings import N8N_WEBHOOK_URL, N8N_WEBHOOK_ENABLED, N8N_WEBHOOK_SECRET
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+_now = datetime.now
+
+
+def _dumps(payload: Dict[str, Any]) -> bytes:
+    """Serialize a payload to JSON bytes (orjson when installed).
+
+    Non-string keys (e.g. old_statuses keyed by order_id) are written as
+    strings, like the stdlib json module does.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=str).encode("utf-8")
+
+
+def _disabled_event(*args, **kwargs) -> None:
+    """send_event replacement used while webhooks are disabled."""
+    return None
+
+
+async def _disabled_async_event(*args, **kwargs) -> None:
+    """asend_event replacement used while webhooks are disabled."""
+    return None
+
+
+def _disabled_notification(*args, **kwargs) -> bool:
+    """enqueue/send_* replacement used while webhooks are disabled."""
+    return False
 
 
 class N8NWebhook:
     """Handle webhook communications with n8n."""
 
+    # Key order of every payload; per-event fields are filled in on send
+    _envelope = {"event_type": None, "timestamp": None, "source": "NextFlow"}
+
+    # Methods replaced by a no-op returning False when webhooks are disabled
+    _NOTIFICATION_METHODS = (
+        "enqueue",
+        "send_order_created",
+        "send_order_updated",
+        "send_order_deleted",
+        "send_order_status_changed",
+        "send_bulk_status_update",
+        "send_low_stock_alert",
+        "send_high_value_order",
+        "send_daily_summary",
+    )
+
     def __init__(self):
-        self.webhook_url = n8n_settings.webhook_url
-        self.enabled = n8n_settings.enabled
-        self.secret = n8n_settings.secret
+        self.webhook_url = N8N_WEBHOOK_URL
+        self.enabled = N8N_WEBHOOK_ENABLED
+        self.secret = N8N_WEBHOOK_SECRET
+
+        if not self.enabled:
+            # Disabled: no session or worker, and every send is a no-op
+            logger.debug("n8n webhooks are disabled")
+            self.send_event = _disabled_event
+            self.asend_event = _disabled_async_event
+            for name in self._NOTIFICATION_METHODS:
+                setattr(self, name, _disabled_notification)
+            return
+
+        # Static headers, built once
+        self.headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "NextFlow/1.0"
+        }
+        if self.secret:
+            self.headers["X-N8N-Secret"] = self.secret
+
+        # Keep-alive session shared by every event sent through this instance
+        # Webhook POSTs are not idempotent: only retry when the connection
+        # was never established (n8n cannot have seen the event). Read
+        # timeouts and 5xx answers are not retried, so events are never sent
+        # twice and a send waits at most connect retries + one read timeout
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.3,
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False
+        )
+        # pool_maxsize covers concurrent chatbot requests (one per greenlet)
+        # so none of them falls back to opening a throwaway connection
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, pool_block=False, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # (connect, read): an unreachable n8n fails fast instead of holding
+        # the request for the full read timeout
+        self.timeout = (3, 10)
+
+        # Circuit breaker: after failure_threshold consecutive connection
+        # failures, skip sends for open_seconds
+        self.failure_threshold = 5
+        self.open_seconds = 30.0
+        self._fail_count = 0
+        self._open_until = 0.0
+
+        # httpx client for asend_event, created on first async send
+        self._aclient = None
+
+        # Background queue for fire-and-forget notifications; bounded so a
+        # slow or unreachable n8n cannot grow memory without limit
+        self.max_batch = 32
+        self.max_wait = 0.05
+        self.max_queued = 1000
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=self.max_queued)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
 
     def send_event(self, event_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        Send an event to n8n webhook.
+        Send an event to n8n webhook and wait for the response.
 
         Args:
             event_type: Type of event (order_created, order_updated, order_deleted, etc.)
@@ -35,34 +158,174 @@ class N8NWebhook:
             logger.debug("n8n webhooks are disabled")
             return None
 
+        return self._post(event_type, self._build_payload(event_type, data))
+
+    async def asend_event(self, event_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Async version of send_event for use from coroutines.
+
+        Uses a pooled httpx.AsyncClient when httpx is installed; otherwise
+        runs the synchronous send in a worker thread so the event loop is
+        never blocked. The client is bound to the loop that first uses it.
+        """
+        if not self.enabled:
+            logger.debug("n8n webhooks are disabled")
+            return None
+
+        if self._circuit_open(event_type):
+            return None
+
+        payload = self._build_payload(event_type, data)
+        if httpx is None:
+            return await asyncio.to_thread(self._post, event_type, payload)
+
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_keepalive_connections=32),
+                headers=self.headers
+            )
+
         try:
-            payload = {
-                "event_type": event_type,
-                "timestamp": datetime.now().isoformat(),
-                "source": "NextFlow",
-                "data": data
-            }
-
-            headers = {
-                "Content-Type": "application/json",
-                "User-Agent": "NextFlow/1.0"
-            }
-
-            # Add secret header if configured
-            if self.secret:
-                headers["X-N8N-Secret"] = self.secret
+            logger.info(f"Sending {event_type} event to n8n: {self.webhook_url}")
+            response = await self._aclient.post(self.webhook_url, content=_dumps(payload))
 
+            if response.status_code in [200, 201, 202]:
+                logger.info(f"✅ Event {event_type} sent successfully to n8n")
+                self._fail_count = 0
+                try:
+                    return response.json()
+                except ValueError:
+                    return {"status": "success", "message": "Event received"}
+            else:
+                logger.warning(f"⚠️ n8n webhook returned status {response.status_code}: {response.text}")
+                return None
+
+        except httpx.TimeoutException:
+            logger.error(f"❌ Timeout sending event to n8n: {event_type}")
+            self._record_failure()
+            return None
+        except httpx.TransportError:
+            logger.error(f"❌ Connection error sending event to n8n: {event_type}")
+            self._record_failure()
+            return None
+        except Exception as e:
+            logger.error(f"❌ Error sending event to n8n: {e}")
+            return None
+
+    async def aclose(self):
+        """Close the async HTTP client, if one was created."""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    def enqueue(self, event_type: str, data: Dict[str, Any]) -> bool:
+        """
+        Queue an event to be sent to n8n by the background worker.
+
+        Events queued within ``max_wait`` seconds of each other are sent
+        together (up to ``max_batch``) as a single ``batch`` event whose
+        ``events`` list holds the individual payloads. A lone event is sent
+        with the regular single-event payload.
+
+        Never blocks the caller: when ``max_queued`` events are already
+        waiting, the event is dropped with a warning.
+
+        Returns:
+            bool: True if the event was queued, False if webhooks are disabled
+            or the queue is full
+        """
+        if not self.enabled:
+            logger.debug("n8n webhooks are disabled")
+            return False
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(self._build_payload(event_type, data))
+        except queue.Full:
+            logger.warning(f"n8n webhook queue full, dropping {event_type} event")
+            return False
+        return True
+
+    def _build_payload(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Wrap event data in the envelope n8n expects."""
+        payload = self._envelope.copy()
+        payload["event_type"] = event_type
+        payload["timestamp"] = _now().isoformat()
+        payload["data"] = data
+        return payload
+
+    def _ensure_worker(self):
+        """Start the queue worker thread on first use."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._drain_queue, name="n8n-webhook", daemon=True
+                )
+                self._worker.start()
+
+    def _drain_queue(self):
+        """Collect queued events into batches and post them."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if len(batch) == 1:
+                self._post(batch[0]["event_type"], batch[0])
+            else:
+                payload = self._envelope.copy()
+                payload["event_type"] = "batch"
+                payload["timestamp"] = _now().isoformat()
+                payload["events"] = batch
+                self._post("batch", payload)
+
+    def _circuit_open(self, event_type: str) -> bool:
+        """True while the breaker is open (n8n recently unreachable)."""
+        if time.monotonic() < self._open_until:
+            logger.debug(f"n8n circuit open, skipping {event_type} event")
+            return True
+        return False
+
+    def _record_failure(self):
+        """Count a connection failure and open the breaker at the threshold."""
+        self._fail_count += 1
+        if self._fail_count >= self.failure_threshold:
+            self._open_until = time.monotonic() + self.open_seconds
+            logger.warning(
+                f"n8n unreachable {self._fail_count} times in a row, "
+                f"pausing webhooks for {self.open_seconds:.0f}s"
+            )
+            self._fail_count = 0
+
+    def _post(self, event_type: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """POST a payload to the webhook URL and parse the response."""
+        if self._circuit_open(event_type):
+            return None
+
+        try:
             logger.info(f"Sending {event_type} event to n8n: {self.webhook_url}")
 
-            response = requests.post(
+            response = self.session.post(
                 self.webhook_url,
-                json=payload,
-                headers=headers,
-                timeout=10
+                data=_dumps(payload),
+                timeout=self.timeout
             )
 
             if response.status_code in [200, 201, 202]:
                 logger.info(f"✅ Event {event_type} sent successfully to n8n")
+                self._fail_count = 0
                 try:
                     return response.json()
                 except:
@@ -73,9 +336,11 @@ class N8NWebhook:
 
         except requests.exceptions.Timeout:
             logger.error(f"❌ Timeout sending event to n8n: {event_type}")
+            self._record_failure()
             return None
         except requests.exceptions.ConnectionError:
             logger.error(f"❌ Connection error sending event to n8n: {event_type}")
+            self._record_failure()
             return None
         except Exception as e:
             logger.error(f"❌ Error sending event to n8n: {e}")
@@ -83,38 +348,54 @@ class N8NWebhook:
 
     def send_order_created(self, order_data: Dict[str, Any]) -> bool:
         """Send order created event to n8n."""
-        return self.send_event("order.created", order_data)
+        return self.enqueue("order.created", order_data)
+
+    def send_orders_created(self, orders: List[Dict[str, Any]]) -> bool:
+        """Send one event for a batch of created orders to n8n."""
+        return self.enqueue("order.bulk_created", {
+            "orders": orders,
+            "created_count": len(orders)
+        })
 
     def send_order_updated(self, order_id: int, order_data: Dict[str, Any]) -> bool:
         """Send order updated event to n8n."""
-        return self.send_event("order.updated", {
+        return self.enqueue("order.updated", {
             "order_id": order_id,
             **order_data
         })
 
     def send_order_deleted(self, order_id: int) -> bool:
         """Send order deleted event to n8n."""
-        return self.send_event("order.deleted", {"order_id": order_id})
+        return self.enqueue("order.deleted", {"order_id": order_id})
 
     def send_order_status_changed(self, order_id: int, old_status: str, new_status: str) -> bool:
         """Send order status changed event to n8n."""
-        return self.send_event("order.status_changed", {
+        return self.enqueue("order.status_changed", {
             "order_id": order_id,
             "old_status": old_status,
             "new_status": new_status
         })
 
-    def send_bulk_status_update(self, order_ids: list, new_status: str, updated_count: int) -> bool:
+    def send_bulk_status_update(
+        self,
+        order_ids: list,
+        new_status: str,
+        updated_count: int,
+        old_statuses: Optional[Dict[int, str]] = None
+    ) -> bool:
         """Send bulk status update event to n8n."""
-        return self.send_event("order.bulk_status_update", {
+        data = {
             "order_ids": order_ids,
             "new_status": new_status,
             "updated_count": updated_count
-        })
+        }
+        if old_statuses is not None:
+            data["old_statuses"] = old_statuses
+        return self.enqueue("order.bulk_status_update", data)
 
     def send_low_stock_alert(self, product: str, current_stock: int, threshold: int) -> bool:
         """Send low stock alert to n8n."""
-        return self.send_event("inventory.low_stock", {
+        return self.enqueue("inventory.low_stock", {
             "product": product,
             "current_stock": current_stock,
             "threshold": threshold
@@ -122,7 +403,7 @@ class N8NWebhook:
 
     def send_high_value_order(self, order_id: int, amount: float, customer: str) -> bool:
         """Send high value order alert to n8n."""
-        return self.send_event("order.high_value", {
+        return self.enqueue("order.high_value", {
             "order_id": order_id,
             "amount": amount,
             "customer": customer
@@ -130,7 +411,7 @@ class N8NWebhook:
 
     def send_daily_summary(self, summary_data: Dict[str, Any]) -> bool:
         """Send daily summary to n8n."""
-        return self.send_event("report.daily_summary", summary_data)
+        return self.enqueue("report.daily_summary", summary_data)
 
     def test_connection(self) -> bool:
         """Test the n8n webhook connection."""
@@ -4,9 +4,30 @@ Pydantic models for store module (products, cart, customer orders)
 """
 
 from datetime import datetime
-from decimal import Decimal
-from typing import Optional, List
-from pydantic import BaseModel, Field, EmailStr, validator
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Optional, List
+from pydantic import BaseModel, Field, PrivateAttr, computed_field, model_validator
+
+
+# Basic address format check; compiled once by pydantic-core
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+
+def to_cents(amount: Decimal) -> int:
+    """Convert a money amount to integer cents (half-up)"""
+    return int((Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> Decimal:
+    """Convert integer cents back to a 2-decimal Decimal"""
+    return Decimal(cents).scaleb(-2)
+
+
+def format_cents(cents: int) -> str:
+    """Format integer cents as a 2-decimal string (same text as str(from_cents(cents)))"""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
 
 
 class ProductBase(BaseModel):
@@ -17,6 +38,7 @@ class ProductBase(BaseModel):
     category: str = Field(..., description="Product category")
     subcategory: str = Field(..., description="Product subcategory")
     price: Decimal = Field(..., ge=0, description="Product price")
+    price_cents: int = Field(0, exclude=True, description="Price in cents")
     image_url: Optional[str] = Field(None, description="Product image URL")
     stock_quantity: int = Field(0, ge=0, description="Available stock")
     is_active: bool = Field(True, description="Is product active")
@@ -26,6 +48,12 @@ class ProductBase(BaseModel):
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def set_price_cents(self):
+        """Keep the integer-cents copy of price in sync"""
+        self.price_cents = to_cents(self.price)
+        return self
+
 
 class ProductCreate(BaseModel):
     """Model for creating a new product"""
@@ -56,16 +84,21 @@ class CartItem(BaseModel):
     product_id: int
     product_name: str
     product_price: Decimal
+    price_cents: int = Field(0, exclude=True, description="Price in cents")
     product_image: Optional[str] = None
     quantity: int = Field(..., gt=0)
-    subtotal: Decimal
 
-    @validator('subtotal', always=True)
-    def calculate_subtotal(cls, v, values):
-        """Calculate subtotal automatically"""
-        if 'product_price' in values and 'quantity' in values:
-            return values['product_price'] * values['quantity']
-        return v
+    @model_validator(mode="after")
+    def set_price_cents(self):
+        """Keep the integer-cents copy of product_price in sync"""
+        self.price_cents = to_cents(self.product_price)
+        return self
+
+    @computed_field
+    @property
+    def subtotal(self) -> Decimal:
+        """Line subtotal, computed on access/serialization"""
+        return from_cents(self.price_cents * self.quantity)
 
 
 class Cart(BaseModel):
@@ -77,24 +110,85 @@ class Cart(BaseModel):
     shipping_cost: Decimal = Decimal('0.00')
     total: Decimal = Decimal('0.00')
 
+    # product_id -> item, kept in sync by the item helpers below
+    _items_by_id: Dict[int, CartItem] = PrivateAttr(default_factory=dict)
+    # Running totals in cents, kept in sync by apply_delta/calculate_totals
+    _subtotal_cents: int = PrivateAttr(0)
+    _tax_cents: int = PrivateAttr(0)
+    _shipping_cents: int = PrivateAttr(0)
+    _total_cents: int = PrivateAttr(0)
+    _tax_basis_points: int = PrivateAttr(0)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._items_by_id = {item.product_id: item for item in self.items}
+        self._subtotal_cents = sum(item.quantity * item.price_cents for item in self.items)
+        self._tax_basis_points = int(self.tax_rate * 10000)
+        self._tax_cents = to_cents(self.tax_amount)
+        self._shipping_cents = to_cents(self.shipping_cost)
+        self._total_cents = to_cents(self.total)
+
+    def totals_cents(self) -> Dict[str, int]:
+        """Current totals as integer cents"""
+        return {
+            "subtotal": self._subtotal_cents,
+            "tax_amount": self._tax_cents,
+            "shipping_cost": self._shipping_cents,
+            "total": self._total_cents,
+        }
+
+    def get_item(self, product_id: int) -> Optional[CartItem]:
+        """Return the cart line for a product, if any"""
+        return self._items_by_id.get(product_id)
+
+    def add_item(self, item: CartItem):
+        """Append a new cart line"""
+        self.items.append(item)
+        self._items_by_id[item.product_id] = item
+
+    def remove_item(self, product_id: int) -> Optional[CartItem]:
+        """Remove and return the cart line for a product, if any"""
+        item = self._items_by_id.pop(product_id, None)
+        if item is not None:
+            self.items.remove(item)
+        return item
+
+    def clear_items(self):
+        """Remove every cart line (in place)"""
+        self.items.clear()
+        self._items_by_id.clear()
+
+    def apply_delta(self, subtotal_delta_cents: int):
+        """Adjust totals after a single-line change without re-summing the cart"""
+        self._subtotal_cents += subtotal_delta_cents
+        self._set_totals(self._subtotal_cents)
+
     def calculate_totals(self):
         """Calculate cart totals"""
-        self.subtotal = sum(item.subtotal for item in self.items)
-        self.tax_amount = self.subtotal * self.tax_rate
+        # Integer cents internally; Decimal only on the model fields
+        self._subtotal_cents = sum(item.quantity * item.price_cents for item in self.items)
+        self._set_totals(self._subtotal_cents)
+
+    def _set_totals(self, subtotal_cents: int):
+        """Derive tax, shipping and total from the subtotal"""
+        tax_cents = (subtotal_cents * self._tax_basis_points + 5000) // 10000
 
         # Free shipping over $100, otherwise $10
-        if self.subtotal >= 100:
-            self.shipping_cost = Decimal('0.00')
-        else:
-            self.shipping_cost = Decimal('10.00')
+        shipping_cents = 0 if subtotal_cents >= 10000 else 1000
 
-        self.total = self.subtotal + self.tax_amount + self.shipping_cost
+        self._tax_cents = tax_cents
+        self._shipping_cents = shipping_cents
+        self._total_cents = subtotal_cents + tax_cents + shipping_cents
+
+        self.subtotal = from_cents(subtotal_cents)
+        self.tax_amount = from_cents(tax_cents)
+        self.shipping_cost = from_cents(shipping_cents)
+        self.total = from_cents(self._total_cents)
 
 
 class CustomerInfo(BaseModel):
     """Customer information for checkout"""
     customer_name: str = Field(..., min_length=2)
-    customer_email: EmailStr
+    customer_email: str = Field(..., max_length=254, pattern=EMAIL_PATTERN)
     customer_phone: Optional[str] = None
     shipping_address: str = Field(..., min_length=5)
     shipping_city: str = Field(..., min_length=2)
@@ -111,6 +205,7 @@ class OrderItemBase(BaseModel):
     product_id: int
     product_name: str
     product_price: Decimal
+    price_cents: int = Field(0, exclude=True, description="Price in cents")
     quantity: int = Field(..., gt=0)
     subtotal: Decimal
     created_at: Optional[datetime] = None
@@ -118,6 +213,12 @@ class OrderItemBase(BaseModel):
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def set_price_cents(self):
+        """Keep the integer-cents copy of product_price in sync"""
+        self.price_cents = to_cents(self.product_price)
+        return self
+
 
 class CustomerOrderBase(BaseModel):
     """Customer order model"""
@@ -1,20 +1,348 @@
 """
 Order service for database operations and data cleaning.
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import threading
+import time
+import numpy as np
 import pandas as pd
 from loguru import logger
+from psycopg2.errors import UndefinedObject, UndefinedTable
+from psycopg2.extras import execute_values
 
 from src.database.connection import db_connection
+from src.database.schema import schema_section
 from src.models.order import Order, OrderCleaningResult
 
+# Materialized views with the dashboard / Power BI aggregates, created (with
+# the unique keys REFRESH ... CONCURRENTLY needs) by database_schema_store.sql:
+# name -> (query, ORDER BY used when reading). The queries are the live
+# fallback for databases without the views; the year is computed from
+# order_date there, since the generated order_year column may be missing too
+ORDER_STATS_VIEWS = {
+    "orders_stats_by_status": (
+        """
+        SELECT status, COUNT(*) AS order_count, SUM(subtotal_amount) AS total_revenue
+        FROM orders
+        GROUP BY status
+        """,
+        "order_count DESC",
+    ),
+    "orders_stats_by_category": (
+        """
+        SELECT category,
+               COUNT(*) AS order_count,
+               SUM(subtotal_amount) AS total_revenue,
+               AVG(subtotal_amount) AS avg_order_value,
+               SUM(quantity) AS total_quantity
+        FROM orders
+        GROUP BY category
+        """,
+        "total_revenue DESC",
+    ),
+    "orders_stats_by_year": (
+        """
+        SELECT EXTRACT(YEAR FROM order_date)::int AS year,
+               COUNT(*) AS order_count,
+               SUM(subtotal_amount) AS total_revenue,
+               AVG(subtotal_amount) AS avg_order_value
+        FROM orders
+        GROUP BY 1
+        """,
+        "year",
+    ),
+}
+
+# order_id is assigned by the database. The sequence is attached to tables
+# created before it existed and moved past their current MAX(order_id)
+ORDER_ID_SEQUENCE_SQL = schema_section("orders_id_sequence")
+
+INSERT_ORDER_QUERY = """
+    INSERT INTO orders (status, customer_name, order_date, quantity,
+                        subtotal_amount, tax_rate, shipping_cost, category, subcategory)
+    VALUES (%(status)s, %(customer_name)s, %(order_date)s, %(quantity)s,
+            %(subtotal_amount)s, %(tax_rate)s, %(shipping_cost)s, %(category)s, %(subcategory)s)
+    RETURNING order_id
+"""
+
+# Multi-row variant: execute_values expands VALUES %s one page at a time
+INSERT_ORDERS_COLUMNS = (
+    "status", "customer_name", "order_date", "quantity",
+    "subtotal_amount", "tax_rate", "shipping_cost", "category", "subcategory",
+)
+INSERT_ORDERS_QUERY = (
+    f"INSERT INTO orders ({', '.join(INSERT_ORDERS_COLUMNS)}) VALUES %s "
+    f"RETURNING order_id, {', '.join(INSERT_ORDERS_COLUMNS)}"
+)
+INSERT_ORDERS_PAGE_SIZE = 1000
+
+# Flat projection read by Power BI (view orders_powerbi, created by
+# database_schema_store.sql); the live variant is used while it is missing
+POWERBI_ORDERS_QUERY = "SELECT * FROM orders_powerbi ORDER BY order_id DESC"
+POWERBI_ORDERS_LIVE_QUERY = """
+    SELECT order_id, status, customer_name, order_date, quantity,
+           subtotal_amount, tax_rate, shipping_cost, category, subcategory,
+           EXTRACT(YEAR FROM order_date)::int AS year,
+           EXTRACT(MONTH FROM order_date)::int AS month,
+           EXTRACT(QUARTER FROM order_date)::int AS quarter
+    FROM orders
+    ORDER BY order_id DESC
+"""
+
+# Bulk status change returning each row's previous status ($1 ids, $2 status)
+BULK_UPDATE_STATUS_QUERY = """
+    WITH prev AS (
+        SELECT order_id, status AS old_status
+        FROM orders
+        WHERE order_id = ANY($1)
+        FOR UPDATE
+    ),
+    upd AS (
+        UPDATE orders o
+        SET status = $2
+        FROM prev
+        WHERE o.order_id = prev.order_id
+        RETURNING o.order_id, prev.old_status
+    )
+    SELECT order_id, old_status FROM upd
+"""
+
+# Columns of each stats view and their types (used to pad the single UNION ALL
+# read below, where every branch must have the same column list)
+ORDER_STATS_COLUMNS = {
+    "orders_stats_by_status": ("status", "order_count", "total_revenue"),
+    "orders_stats_by_category": (
+        "category", "order_count", "total_revenue", "avg_order_value", "total_quantity",
+    ),
+    "orders_stats_by_year": ("year", "order_count", "total_revenue", "avg_order_value"),
+}
+ORDER_STATS_COLUMN_TYPES = {
+    "status": "text",
+    "category": "text",
+    "year": "int",
+    "order_count": "bigint",
+    "total_revenue": "numeric",
+    "avg_order_value": "numeric",
+    "total_quantity": "bigint",
+}
+
+
+
+def _stats_query(live: bool = False) -> str:
+    """
+    All three aggregates in one round-trip, rows tagged with their view and
+    position. ``live`` runs the view queries themselves instead of reading
+    the materialized views.
+    """
+    return " UNION ALL ".join(
+        f"SELECT {index} AS view_index, "
+        f"row_number() OVER (ORDER BY {order_by}) AS position, "
+        + ", ".join(
+            column if column in ORDER_STATS_COLUMNS[name] else f"NULL::{type_} AS {column}"
+            for column, type_ in ORDER_STATS_COLUMN_TYPES.items()
+        )
+        + (f" FROM ({query}) AS {name}" if live else f" FROM {name}")
+        for index, (name, (query, order_by)) in enumerate(ORDER_STATS_VIEWS.items())
+    ) + " ORDER BY view_index, position"
+
+
+ORDER_STATS_QUERY = _stats_query()
+# Fallback while the views are missing or cannot be refreshed
+ORDER_STATS_LIVE_QUERY = _stats_query(live=True)
+
+# Views older than this are refreshed on read (covers writes from other
+# processes, e.g. store checkouts and bulk imports); writes refresh them at
+# most once per this interval (see stats_refresh_due_in)
+STATS_MAX_AGE_SECONDS = 60
+
+
+# numpy base type -> converter to the native Python value
+_NUMPY_CONVERTERS = (
+    (np.integer, int),
+    (np.floating, float),
+    (np.bool_, bool),
+    (np.ndarray, np.ndarray.tolist),
+)
+# Concrete type -> converter (None for types left as they are), filled on first sight
+_native_converters: Dict[type, Any] = {}
+
+
+def _to_native(value: Any) -> Any:
+    """Return ``value`` as a native Python type if it is a numpy scalar/array."""
+    value_type = type(value)
+    try:
+        convert = _native_converters[value_type]
+    except KeyError:
+        convert = next(
+            (fn for base, fn in _NUMPY_CONVERTERS if issubclass(value_type, base)), None
+        )
+        _native_converters[value_type] = convert
+    return convert(value) if convert is not None else value
+
 
 class OrderService:
     """Service class for order-related operations."""
+
+    # Shared by every instance: views are refreshed by one thread at a time
+    _stats_ready = False
+    _stats_refreshed_at = 0.0
+    _stats_lock = threading.Lock()
+    _order_id_seq_ready = False
     
     def __init__(self):
         self.db = db_connection
+
+    def _ensure_order_id_sequence(self, cursor):
+        """Attach the order_id sequence to orders if it is not there yet."""
+        if OrderService._order_id_seq_ready:
+            return
+        cursor.execute(ORDER_ID_SEQUENCE_SQL)
+        OrderService._order_id_seq_ready = True
+
+    def create_order(self, order_data: Dict[str, Any]) -> int:
+        """Insert an order and return the order_id assigned by the database."""
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self._ensure_order_id_sequence(cursor)
+                    cursor.execute(INSERT_ORDER_QUERY, order_data)
+                    order_id = cursor.fetchone()["order_id"]
+                    conn.commit()
+
+            logger.info(f"New order {order_id} created successfully")
+            return order_id
+
+        except (UndefinedTable, UndefinedObject) as e:
+            # The sequence (or orders itself) is gone: re-attach it on the next insert
+            OrderService._order_id_seq_ready = False
+            logger.error(f"Failed to create order: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to create order: {e}")
+            raise
+
+    def create_orders(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Insert several orders in one transaction and return the inserted rows.
+
+        RETURNING does not guarantee input order, so each returned row carries
+        its own order_id next to the inserted values instead of being paired
+        with ``orders`` by position.
+        """
+        try:
+            rows = [tuple(order[column] for column in INSERT_ORDERS_COLUMNS) for order in orders]
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self._ensure_order_id_sequence(cursor)
+                    returned = execute_values(
+                        cursor, INSERT_ORDERS_QUERY, rows,
+                        page_size=INSERT_ORDERS_PAGE_SIZE, fetch=True
+                    )
+                    conn.commit()
+
+            created = [dict(row) for row in returned]
+            logger.info(f"Bulk insert: {len(created)} orders created")
+            return created
+
+        except (UndefinedTable, UndefinedObject) as e:
+            # The sequence (or orders itself) is gone: re-attach it on the next insert
+            OrderService._order_id_seq_ready = False
+            logger.error(f"Failed bulk order insert: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed bulk order insert: {e}")
+            raise
+
+    def refresh_stats_views(self, wait: bool = True) -> bool:
+        """
+        Refresh the aggregate views after writing to orders.
+
+        CONCURRENTLY keeps the views readable during the refresh. With
+        ``wait=False`` the call returns immediately if another thread is
+        already refreshing. The views themselves come from
+        database_schema_store.sql; while they are missing this raises and
+        get_order_stats aggregates live.
+        """
+        if not OrderService._stats_lock.acquire(blocking=wait):
+            return False
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Full-table refreshes can outlast the pool's statement_timeout
+                    self.db.lift_statement_timeout(cursor)
+                    for name in ORDER_STATS_VIEWS:
+                        cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+                    conn.commit()
+            OrderService._stats_ready = True
+            OrderService._stats_refreshed_at = time.monotonic()
+            return True
+        except Exception as e:
+            # Next attempt after STATS_MAX_AGE_SECONDS, not on every read
+            OrderService._stats_refreshed_at = time.monotonic()
+            logger.error(f"Failed to refresh order stats views: {e}")
+            raise
+        finally:
+            OrderService._stats_lock.release()
+
+    def get_order_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Read the pre-aggregated order stats.
+
+        Returns ``by_status``, ``by_category`` and ``by_year`` row lists
+        (order_count, total_revenue, plus avg_order_value/total_quantity
+        where available).
+        """
+        if time.monotonic() - OrderService._stats_refreshed_at > STATS_MAX_AGE_SECONDS:
+            try:
+                # Before the first refresh wait for it; afterwards stale
+                # views are served while another thread refreshes them
+                self.refresh_stats_views(wait=not OrderService._stats_ready)
+            except Exception:
+                pass  # already logged; served from the live query below
+
+        # Views missing or never refreshed in this process: aggregate live
+        query = ORDER_STATS_QUERY if OrderService._stats_ready else ORDER_STATS_LIVE_QUERY
+
+        try:
+            names = list(ORDER_STATS_VIEWS)
+            # orders_stats_by_status -> by_status
+            stats = {"by_" + name.rsplit("_by_", 1)[1]: [] for name in names}
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+                    for row in cursor.fetchall():
+                        name = names[row["view_index"]]
+                        stats["by_" + name.rsplit("_by_", 1)[1]].append(
+                            {column: row[column] for column in ORDER_STATS_COLUMNS[name]}
+                        )
+            return stats
+
+        except Exception as e:
+            logger.error(f"Failed to read order stats: {e}")
+            raise
+
+    def stats_refresh_due_in(self) -> float:
+        """Seconds until a write may refresh the views again (0 = now)."""
+        if not OrderService._stats_ready:
+            return 0.0
+        elapsed = time.monotonic() - OrderService._stats_refreshed_at
+        return max(0.0, STATS_MAX_AGE_SECONDS - elapsed)
     
+    def iter_powerbi_orders(self) -> Iterator[Dict[str, Any]]:
+        """Stream the Power BI projection of orders, newest first."""
+        rows = self.db.iter_query(POWERBI_ORDERS_QUERY)
+        try:
+            first = next(rows, None)
+        except UndefinedTable:
+            # orders_powerbi not created yet (database_schema_store.sql)
+            logger.warning("View orders_powerbi missing; projecting orders live")
+            rows = self.db.iter_query(POWERBI_ORDERS_LIVE_QUERY)
+            first = next(rows, None)
+        if first is None:
+            return
+        yield first
+        yield from rows
+
     def get_all_orders(self) -> List[Dict[str, Any]]:
         """Retrieve all orders from the database."""
         try:
@@ -258,8 +586,6 @@ class OrderService:
     
     def _convert_pandas_to_dict(self, pandas_obj):
         """Convert pandas objects to native Python types for JSON serialization."""
-        import numpy as np
-        
         if hasattr(pandas_obj, 'to_dict'):
             # For DataFrames and Series
             result = pandas_obj.to_dict()
@@ -268,19 +594,9 @@ class OrderService:
                 for key, value in result.items():
                     if isinstance(value, dict):
                         for sub_key, sub_value in value.items():
-                            if isinstance(sub_value, (np.integer, np.int64, np.int32)):
-                                result[key][sub_key] = int(sub_value)
-                            elif isinstance(sub_value, (np.floating, np.float64, np.float32)):
-                                result[key][sub_key] = float(sub_value)
-                            elif isinstance(sub_value, np.ndarray):
-                                result[key][sub_key] = sub_value.tolist()
+                            value[sub_key] = _to_native(sub_value)
                     else:
-                        if isinstance(value, (np.integer, np.int64, np.int32)):
-                            result[key] = int(value)
-                        elif isinstance(value, (np.floating, np.float64, np.float32)):
-                            result[key] = float(value)
-                        elif isinstance(value, np.ndarray):
-                            result[key] = value.tolist()
+                        result[key] = _to_native(value)
             return result
         else:
             return str(pandas_obj)
@@ -346,6 +662,34 @@ class OrderService:
             logger.error(f"Failed to generate data quality report: {e}")
             raise
     
+    def bulk_update_status(self, order_ids: List[int], new_status: str) -> List[Dict[str, Any]]:
+        """
+        Set the status of several orders in one UPDATE.
+
+        Returns one dict per updated row with ``order_id`` and ``old_status``.
+        """
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # The ids travel as one array parameter, so a single
+                    # prepared plan serves every batch size
+                    self.db.execute_prepared(
+                        cursor,
+                        "orders_bulk_status",
+                        BULK_UPDATE_STATUS_QUERY,
+                        (list(order_ids), new_status),
+                        arg_types="bigint[], text",
+                    )
+                    updated = [dict(row) for row in cursor.fetchall()]
+                    conn.commit()
+
+            logger.info(f"Bulk status update: {len(updated)} orders updated to {new_status}")
+            return updated
+
+        except Exception as e:
+            logger.error(f"Failed bulk status update: {e}")
+            raise
+
     def update_order(self, order_id: int, update_data: Dict[str, Any]) -> bool:
         """Update a specific order."""
         try:
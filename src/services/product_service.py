@@ -3,54 +3,180 @@ Product Service
 Service layer for managing products in the store
 """
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
 from decimal import Decimal
+from functools import lru_cache
+import threading
 import psycopg2
+from psycopg2.extensions import cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
+from cachetools import TTLCache
 from loguru import logger
 
-from src.database.connection import DatabaseConnection
+from src.database.connection import db_connection
 from src.models.store_models import ProductBase, ProductCreate, ProductUpdate
 
+# Columns the catalog views use; timestamps are only returned for single products
+PRODUCT_LIST_COLUMNS = (
+    "product_id, name, description, category, subcategory, "
+    "price, image_url, stock_quantity, is_active"
+)
+
+# Default and maximum page sizes for /api/products?limit=&after=
+PRODUCT_PAGE_SIZE = 50
+PRODUCT_PAGE_MAX = 200
+
+# search_products filters in a fixed order: (SQL with {} for each placeholder, arg types)
+SEARCH_FILTERS = (
+    ("(search_tsv @@ plainto_tsquery('simple', {}) OR lower(name) LIKE {})", ("text", "text")),
+    ("(name ILIKE {} OR description ILIKE {})", ("text", "text")),
+    ("category = {}", ("text",)),
+    ("price >= {}", ("numeric",)),
+    ("price <= {}", ("numeric",)),
+)
+
+
+@lru_cache(maxsize=None)
+def _search_statement(shape: Tuple[bool, ...]) -> Tuple[str, str]:
+    """Build the search query ($n placeholders) and arg types for a filter combination"""
+    conditions = ["is_active = TRUE"]
+    arg_types: List[str] = []
+    for used, (clause, types) in zip(shape, SEARCH_FILTERS):
+        if used:
+            start = len(arg_types) + 1
+            conditions.append(clause.format(*(f"${i}" for i in range(start, start + len(types)))))
+            arg_types.extend(types)
+
+    query = (
+        f"SELECT {PRODUCT_LIST_COLUMNS} FROM products "
+        f"WHERE {' AND '.join(conditions)} ORDER BY category, name"
+    )
+    return query, ", ".join(arg_types)
+
 
 class ProductService:
     """Service for managing products"""
 
-    def __init__(self):
-        self.db = DatabaseConnection()
+    # Read cache shared by every instance so writes from any service
+    # invalidate what the others serve
+    _cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+    _cache_lock = threading.Lock()
+    # Bumped on every write so callers can key their own caches on it
+    _cache_version = 0
 
-    def get_all_products(self, active_only: bool = True) -> List[Dict[str, Any]]:
-        """Get all products from the database"""
+    def __init__(self):
+        self.db = db_connection
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            return self._cache.get(key)
+
+    def _cache_set(self, key, value):
+        with self._cache_lock:
+            self._cache[key] = value
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Drop every cached product read (call after writing to products)"""
+        with cls._cache_lock:
+            cls._cache.clear()
+            cls._cache_version += 1
+
+    @classmethod
+    def cache_version(cls) -> int:
+        """Current product data version (changes whenever the cache is invalidated)"""
+        return cls._cache_version
+
+    def get_all_products(self, active_only: bool = True) -> Tuple[Dict[str, Any], ...]:
+        """
+        Get all products from the database.
+
+        The result is the cached copy itself, shared by every caller until the
+        cache expires or is invalidated: treat it as read-only.
+        """
+        cached = self._cache_get(("all", active_only))
+        if cached is not None:
+            return cached
+
+        where = "WHERE is_active = TRUE " if active_only else ""
         try:
             with self.db.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    if active_only:
-                        cursor.execute(
-                            "SELECT * FROM products WHERE is_active = TRUE ORDER BY category, name"
-                        )
-                    else:
-                        cursor.execute("SELECT * FROM products ORDER BY category, name")
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    cursor.execute(
+                        f"SELECT {PRODUCT_LIST_COLUMNS} FROM products {where}ORDER BY category, name"
+                    )
+                    cols = tuple(d.name for d in cursor.description)
+                    # Iterating the cursor builds one row tuple at a time,
+                    # so the dicts are the only full copy in Python
+                    products = tuple(dict(zip(cols, row)) for row in cursor)
 
-                    products = cursor.fetchall()
-                    logger.info(f"Retrieved {len(products)} products from database")
-                    return [dict(product) for product in products]
+            logger.info(f"Retrieved {len(products)} products from database")
+            self._cache_set(("all", active_only), products)
+            return products
 
         except Exception as e:
             logger.error(f"Error getting products: {e}")
             raise
 
+    def get_products_page(
+        self,
+        after_id: Optional[int] = None,
+        limit: int = PRODUCT_PAGE_SIZE,
+        category: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get one page of active products ordered by product_id.
+
+        Keyset pagination: pass the last product_id of the previous page as
+        after_id, so each page is an index range scan instead of an OFFSET.
+        """
+        conditions = ["is_active = TRUE"]
+        params: List[Any] = []
+        if after_id is not None:
+            conditions.append("product_id > %s")
+            params.append(after_id)
+        if category:
+            conditions.append("category = %s")
+            params.append(category)
+        params.append(limit)
+
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    cursor.execute(
+                        f"SELECT {PRODUCT_LIST_COLUMNS} FROM products "
+                        f"WHERE {' AND '.join(conditions)} ORDER BY product_id LIMIT %s",
+                        params
+                    )
+                    cols = tuple(d.name for d in cursor.description)
+                    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Error getting products page: {e}")
+            raise
+
     def get_product_by_id(self, product_id: int) -> Optional[Dict[str, Any]]:
         """Get a specific product by ID"""
+        cached = self._cache_get(("product", product_id))
+        if cached is not None:
+            return dict(cached)
+
         try:
             with self.db.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(
-                        "SELECT * FROM products WHERE product_id = %s", (product_id,)
+                    self.db.execute_prepared(
+                        cursor,
+                        "get_product_by_id",
+                        "SELECT * FROM products WHERE product_id = $1",
+                        (product_id,),
+                        arg_types="int",
                     )
                     product = cursor.fetchone()
 
                     if product:
                         logger.info(f"Retrieved product {product_id}")
+                        product = dict(product)
+                        self._cache_set(("product", product_id), product)
                         return dict(product)
                     else:
                         logger.warning(f"Product {product_id} not found")
@@ -60,6 +186,26 @@ class ProductService:
             logger.error(f"Error getting product {product_id}: {e}")
             raise
 
+    def get_products_by_ids(self, product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get several products in one query, keyed by product ID"""
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self.db.execute_prepared(
+                        cursor,
+                        "get_products_by_ids",
+                        "SELECT * FROM products WHERE product_id = ANY($1)",
+                        (list(product_ids),),
+                        arg_types="int[]",
+                    )
+                    products = {row["product_id"]: dict(row) for row in cursor.fetchall()}
+                    logger.info(f"Retrieved {len(products)} products by ID")
+                    return products
+
+        except Exception as e:
+            logger.error(f"Error getting products {product_ids}: {e}")
+            raise
+
     def search_products(
         self,
         search_term: Optional[str] = None,
@@ -70,33 +216,33 @@ class ProductService:
         """Search products with filters"""
         try:
             with self.db.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    query = "SELECT * FROM products WHERE is_active = TRUE"
-                    params = []
-
-                    if search_term:
-                        query += " AND (name ILIKE %s OR description ILIKE %s)"
-                        params.extend([f"%{search_term}%", f"%{search_term}%"])
-
-                    if category:
-                        query += " AND category = %s"
-                        params.append(category)
-
-                    if min_price is not None:
-                        query += " AND price >= %s"
-                        params.append(min_price)
-
-                    if max_price is not None:
-                        query += " AND price <= %s"
-                        params.append(max_price)
-
-                    query += " ORDER BY category, name"
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    like = None
+                    if search_term and len(search_term.strip()) < 2:
+                        like = f"%{search_term}%"
+
+                    # Filtro SQL -> parametros; los que quedan en None no aplican.
+                    # lower(name) LIKE usa el indice trigram para coincidencias parciales
+                    values = (
+                        (search_term, f"%{search_term.strip().lower()}%")
+                        if search_term and like is None else None,
+                        (like, like) if like is not None else None,
+                        (category,) if category else None,
+                        (min_price,) if min_price is not None else None,
+                        (max_price,) if max_price is not None else None,
+                    )
+                    shape = tuple(v is not None for v in values)
+                    params = [value for v in values if v is not None for value in v]
 
-                    cursor.execute(query, params)
-                    products = cursor.fetchall()
+                    # One prepared statement per filter combination (32 at most)
+                    name = "product_search_" + "".join("1" if used else "0" for used in shape)
+                    query, arg_types = _search_statement(shape)
+                    self.db.execute_prepared(cursor, name, query, params, arg_types)
+                    cols = tuple(d.name for d in cursor.description)
+                    products = [dict(zip(cols, row)) for row in cursor.fetchall()]
 
                     logger.info(f"Found {len(products)} products matching search criteria")
-                    return [dict(product) for product in products]
+                    return products
 
         except Exception as e:
             logger.error(f"Error searching products: {e}")
@@ -104,15 +250,20 @@ class ProductService:
 
     def get_categories(self) -> List[str]:
         """Get all unique categories"""
+        cached = self._cache_get(("categories",))
+        if cached is not None:
+            return list(cached)
+
         try:
             with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
                     cursor.execute(
                         "SELECT DISTINCT category FROM products WHERE is_active = TRUE ORDER BY category"
                     )
                     categories = [row[0] for row in cursor.fetchall()]
                     logger.info(f"Retrieved {len(categories)} categories")
-                    return categories
+                    self._cache_set(("categories",), categories)
+                    return list(categories)
 
         except Exception as e:
             logger.error(f"Error getting categories: {e}")
@@ -143,6 +294,7 @@ class ProductService:
                     )
                     product = cursor.fetchone()
                     conn.commit()
+                    self.invalidate_cache()
 
                     logger.info(f"Created product {product['product_id']}: {product['name']}")
                     return dict(product)
@@ -185,6 +337,7 @@ class ProductService:
                     cursor.execute(query, params)
                     product = cursor.fetchone()
                     conn.commit()
+                    self.invalidate_cache()
 
                     if product:
                         logger.info(f"Updated product {product_id}")
@@ -201,7 +354,7 @@ class ProductService:
         """Update product stock (can be positive or negative)"""
         try:
             with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
                     cursor.execute(
                         """
                         UPDATE products
@@ -214,6 +367,7 @@ class ProductService:
                     )
                     result = cursor.fetchone()
                     conn.commit()
+                    self.invalidate_cache()
 
                     if result:
                         logger.info(
@@ -243,6 +397,33 @@ class ProductService:
             logger.error(f"Error checking stock for product {product_id}: {e}")
             return False
 
+    def check_stock_availability_bulk(
+        self, items: Iterable[Tuple[int, int]]
+    ) -> List[int]:
+        """Check stock for (product_id, quantity) pairs with a single query.
+
+        Quantities for a repeated product_id are added together. Returns the
+        IDs that are missing, inactive or lack sufficient stock (empty if all
+        are OK).
+        """
+        requested: Dict[int, int] = {}
+        for product_id, quantity in items:
+            requested[product_id] = requested.get(product_id, 0) + quantity
+
+        try:
+            products = self.get_products_by_ids(list(requested))
+        except Exception as e:
+            logger.error(f"Error checking stock for products {list(requested)}: {e}")
+            return list(requested)
+
+        return [
+            product_id
+            for product_id, quantity in requested.items()
+            if product_id not in products
+            or not products[product_id]["is_active"]
+            or products[product_id]["stock_quantity"] < quantity
+        ]
+
     def delete_product(self, product_id: int) -> bool:
         """Soft delete a product (set is_active to False)"""
         try:
@@ -257,6 +438,7 @@ class ProductService:
                         (product_id,),
                     )
                     conn.commit()
+                    self.invalidate_cache()
 
                     logger.info(f"Deleted (deactivated) product {product_id}")
                     return True
@@ -3,14 +3,15 @@ Store Service
 Service layer for managing shopping cart and customer orders
 """
 
-from typing import List, Optional, Dict, Any
+from collections import defaultdict
+from typing import Iterator, List, Optional, Dict, Any
 from decimal import Decimal
 import uuid
-from datetime import datetime
+from psycopg2.extensions import cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
 from loguru import logger
 
-from src.database.connection import DatabaseConnection
+from src.database.connection import db_connection
 from src.models.store_models import (
     Cart,
     CartItem,
@@ -21,11 +22,92 @@ from src.models.store_models import (
 from src.services.product_service import ProductService
 
 
+VALID_ORDER_STATUSES = frozenset(
+    {"pending", "processing", "shipped", "delivered", "cancelled"}
+)
+
+# Whole checkout as one writable CTE. Cart lines arrive as parallel arrays so
+# the statement has a fixed signature and can be PREPAREd. Admin order ids
+# come from the orders_order_id_seq default.
+CHECKOUT_QUERY = """
+    WITH new_order AS (
+        INSERT INTO customer_orders (
+            customer_name, customer_email, customer_phone,
+            shipping_address, shipping_city, shipping_state,
+            shipping_zip, shipping_country,
+            subtotal_amount, tax_amount, shipping_cost, total_amount,
+            status, payment_method, payment_status,
+            notes, session_id
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
+        RETURNING *
+    ),
+    lines AS (
+        SELECT * FROM unnest($18, $19, $20, $21, $22)
+            AS l(product_id, product_name, product_price, quantity, subtotal)
+    ),
+    new_items AS (
+        INSERT INTO order_items (
+            customer_order_id, product_id, product_name,
+            product_price, quantity, subtotal
+        )
+        SELECT n.customer_order_id, l.product_id, l.product_name,
+               l.product_price, l.quantity, l.subtotal
+        FROM new_order n, lines l
+        RETURNING *
+    ),
+    demand AS (
+        SELECT product_id, SUM(quantity) AS quantity
+        FROM lines
+        GROUP BY product_id
+    ),
+    stock_upd AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity - d.quantity,
+            updated_at = CURRENT_TIMESTAMP
+        FROM demand d
+        WHERE p.product_id = d.product_id AND p.stock_quantity >= d.quantity
+        RETURNING p.product_id
+    ),
+    admin_orders AS (
+        INSERT INTO orders (
+            status, customer_name, order_date, quantity,
+            subtotal_amount, tax_rate, shipping_cost, category, subcategory
+        )
+        SELECT 'Order Finished', $1, CURRENT_DATE, l.quantity,
+               l.subtotal, $23, $24, 'Store Order', l.product_name
+        FROM lines l
+        RETURNING order_id
+    )
+    SELECT n.*, NULL AS _items, i.*,
+           (SELECT array_agg(product_id) FROM stock_upd) AS _updated_ids
+    FROM new_order n
+    LEFT JOIN new_items i ON TRUE
+    ORDER BY i.order_item_id
+"""
+CHECKOUT_ARG_TYPES = (
+    "text, text, text, text, text, text, text, text, "
+    "numeric, numeric, numeric, numeric, text, text, text, text, text, "
+    "int[], text[], numeric[], int[], numeric[], numeric, numeric"
+)
+
+ORDER_BY_ID_QUERY = "SELECT * FROM customer_orders WHERE customer_order_id = %s"
+ORDERS_BY_EMAIL_QUERY = (
+    "SELECT * FROM customer_orders WHERE customer_email = %s ORDER BY order_date DESC"
+)
+ORDER_ITEMS_QUERY = "SELECT * FROM order_items WHERE customer_order_id = ANY(%s)"
+CUSTOMER_ORDERS_PAGE_QUERY = (
+    "SELECT * FROM customer_orders ORDER BY order_date DESC LIMIT %s OFFSET %s"
+)
+UPDATE_ORDER_STATUS_QUERY = (
+    "UPDATE customer_orders SET status = %s WHERE customer_order_id = %s RETURNING *"
+)
+
+
 class StoreService:
     """Service for managing store operations (cart, checkout, orders)"""
 
     def __init__(self):
-        self.db = DatabaseConnection()
+        self.db = db_connection
         self.product_service = ProductService()
 
     def add_to_cart(self, cart: Cart, product_id: int, quantity: int) -> Cart:
@@ -39,39 +121,34 @@ class StoreService:
             if not product["is_active"]:
                 raise ValueError(f"Product {product_id} is not available")
 
-            # Check stock
-            if not self.product_service.check_stock_availability(product_id, quantity):
-                raise ValueError(f"Insufficient stock for product {product_id}")
-
             # Check if product already in cart
-            existing_item = next(
-                (item for item in cart.items if item.product_id == product_id), None
-            )
+            existing_item = cart.get_item(product_id)
+
+            # Check stock against the row already fetched (cart + new quantity)
+            new_quantity = quantity + (existing_item.quantity if existing_item else 0)
+            if product["stock_quantity"] < new_quantity:
+                raise ValueError(f"Insufficient stock for product {product_id}")
 
             if existing_item:
                 # Update quantity
-                new_quantity = existing_item.quantity + quantity
-                if not self.product_service.check_stock_availability(
-                    product_id, new_quantity
-                ):
-                    raise ValueError(f"Insufficient stock for product {product_id}")
-
                 existing_item.quantity = new_quantity
-                existing_item.subtotal = existing_item.product_price * new_quantity
+                cart.apply_delta(quantity * existing_item.price_cents)
             else:
+                # psycopg2 already returns NUMERIC as Decimal
+                price = product["price"]
+                if not isinstance(price, Decimal):
+                    price = Decimal(str(price))
+
                 # Add new item
                 cart_item = CartItem(
                     product_id=product_id,
                     product_name=product["name"],
-                    product_price=Decimal(str(product["price"])),
+                    product_price=price,
                     product_image=product.get("image_url"),
                     quantity=quantity,
-                    subtotal=Decimal(str(product["price"])) * quantity,
                 )
-                cart.items.append(cart_item)
-
-            # Recalculate totals
-            cart.calculate_totals()
+                cart.add_item(cart_item)
+                cart.apply_delta(quantity * cart_item.price_cents)
 
             logger.info(f"Added {quantity}x product {product_id} to cart")
             return cart
@@ -86,7 +163,7 @@ class StoreService:
             if quantity <= 0:
                 return self.remove_from_cart(cart, product_id)
 
-            item = next((item for item in cart.items if item.product_id == product_id), None)
+            item = cart.get_item(product_id)
             if not item:
                 raise ValueError(f"Product {product_id} not found in cart")
 
@@ -94,10 +171,9 @@ class StoreService:
             if not self.product_service.check_stock_availability(product_id, quantity):
                 raise ValueError(f"Insufficient stock for product {product_id}")
 
+            delta = (quantity - item.quantity) * item.price_cents
             item.quantity = quantity
-            item.subtotal = item.product_price * quantity
-
-            cart.calculate_totals()
+            cart.apply_delta(delta)
 
             logger.info(f"Updated product {product_id} quantity to {quantity}")
             return cart
@@ -109,8 +185,9 @@ class StoreService:
     def remove_from_cart(self, cart: Cart, product_id: int) -> Cart:
         """Remove item from cart"""
         try:
-            cart.items = [item for item in cart.items if item.product_id != product_id]
-            cart.calculate_totals()
+            item = cart.remove_item(product_id)
+            if item is not None:
+                cart.apply_delta(-item.quantity * item.price_cents)
 
             logger.info(f"Removed product {product_id} from cart")
             return cart
@@ -122,7 +199,7 @@ class StoreService:
     def clear_cart(self, cart: Cart) -> Cart:
         """Clear all items from cart"""
         try:
-            cart.items = []
+            cart.clear_items()
             cart.calculate_totals()
 
             logger.info("Cart cleared")
@@ -142,11 +219,14 @@ class StoreService:
             if not cart.items:
                 raise ValueError("Cart is empty")
 
-            # Validate stock for all items
+            # Validate stock for all items in one query
+            unavailable = set(
+                self.product_service.check_stock_availability_bulk(
+                    (item.product_id, item.quantity) for item in cart.items
+                )
+            )
             for item in cart.items:
-                if not self.product_service.check_stock_availability(
-                    item.product_id, item.quantity
-                ):
+                if item.product_id in unavailable:
                     raise ValueError(
                         f"Insufficient stock for product {item.product_name}"
                     )
@@ -155,24 +235,15 @@ class StoreService:
             cart.calculate_totals()
 
             # Generate session ID
-            session_id = str(uuid.uuid4())
+            session_id = uuid.uuid4().hex
 
-            # Create order in database
+            # Create order, items, stock updates and admin orders in one statement
             with self.db.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    # Insert customer order
-                    cursor.execute(
-                        """
-                        INSERT INTO customer_orders (
-                            customer_name, customer_email, customer_phone,
-                            shipping_address, shipping_city, shipping_state,
-                            shipping_zip, shipping_country,
-                            subtotal_amount, tax_amount, shipping_cost, total_amount,
-                            status, payment_method, payment_status,
-                            notes, session_id
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING customer_order_id
-                        """,
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    self.db.execute_prepared(
+                        cursor,
+                        "checkout",
+                        CHECKOUT_QUERY,
                         (
                             customer_info.customer_name,
                             customer_info.customer_email,
@@ -191,102 +262,51 @@ class StoreService:
                             "completed" if checkout_request.payment_method == "simulated" else "pending",
                             customer_info.notes,
                             session_id,
+                            [item.product_id for item in cart.items],
+                            [item.product_name for item in cart.items],
+                            [item.product_price for item in cart.items],
+                            [item.quantity for item in cart.items],
+                            [item.subtotal for item in cart.items],
+                            cart.tax_rate,
+                            cart.shipping_cost / len(cart.items),  # Distribute shipping cost
                         ),
+                        arg_types=CHECKOUT_ARG_TYPES,
                     )
-
-                    order_id = cursor.fetchone()["customer_order_id"]
-
-                    # Insert order items
-                    for item in cart.items:
-                        cursor.execute(
-                            """
-                            INSERT INTO order_items (
-                                customer_order_id, product_id, product_name,
-                                product_price, quantity, subtotal
-                            ) VALUES (%s, %s, %s, %s, %s, %s)
-                            """,
-                            (
-                                order_id,
-                                item.product_id,
-                                item.product_name,
-                                item.product_price,
-                                item.quantity,
-                                item.subtotal,
-                            ),
+                    rows = cursor.fetchall()
+
+                    # Columns: customer_orders.*, marker, order_items.*, updated ids
+                    cols = [d.name for d in cursor.description]
+                    split = cols.index("_items")
+                    order_cols, item_cols = cols[:split], cols[split + 1:-1]
+
+                    updated_ids = set(rows[0][-1] or ())
+                    if len(updated_ids) != len({item.product_id for item in cart.items}):
+                        # Stock changed since validation; the transaction is rolled back
+                        missing = [
+                            item.product_name
+                            for item in cart.items
+                            if item.product_id not in updated_ids
+                        ]
+                        raise ValueError(
+                            f"Insufficient stock for product {', '.join(missing)}"
                         )
 
-                        # Update product stock directly in the same transaction
-                        cursor.execute(
-                            """
-                            UPDATE products
-                            SET stock_quantity = stock_quantity - %s,
-                                updated_at = CURRENT_TIMESTAMP
-                            WHERE product_id = %s AND stock_quantity >= %s
-                            """,
-                            (item.quantity, item.product_id, item.quantity),
-                        )
-
-                    # Also create entries in the main 'orders' table for admin dashboard
-                    # Each item becomes a separate order in the orders table
-                    # IMPORTANT: Do this BEFORE commit to keep in same transaction
-
-                    # Get the next order_id (max + 1)
-                    cursor.execute("SELECT COALESCE(MAX(order_id), 0) + 1 as next_id FROM orders")
-                    next_order_id_result = cursor.fetchone()
-                    next_order_id = next_order_id_result["next_id"] if next_order_id_result else 1
-
-                    for item in cart.items:
-                        cursor.execute(
-                            """
-                            INSERT INTO orders (
-                                order_id, status, customer_name, order_date, quantity,
-                                subtotal_amount, tax_rate, shipping_cost, category, subcategory
-                            ) VALUES (%s, %s, %s, CURRENT_DATE, %s, %s, %s, %s, %s, %s)
-                            """,
-                            (
-                                next_order_id,
-                                "Order Finished",
-                                customer_info.customer_name,
-                                item.quantity,
-                                item.subtotal,
-                                cart.tax_rate,
-                                cart.shipping_cost / len(cart.items),  # Distribute shipping cost
-                                "Store Order",  # Category
-                                item.product_name,  # Subcategory with product name
-                            ),
-                        )
-                        next_order_id += 1  # Increment for next item
+                    order = dict(zip(order_cols, rows[0][:split]))
+                    order_id = order["customer_order_id"]
+                    order["items"] = [
+                        dict(zip(item_cols, row[split + 1:-1])) for row in rows
+                    ]
 
                     # Commit all changes in one transaction
                     conn.commit()
+                    # Stock changed, so cached product reads are stale
+                    self.product_service.invalidate_cache()
 
                     logger.info(
                         f"Order {order_id} created successfully for {customer_info.customer_email}"
                     )
                     logger.info(f"Created {len(cart.items)} order entries in orders table")
 
-                    # Get complete order details within the same connection
-                    cursor.execute(
-                        "SELECT * FROM customer_orders WHERE customer_order_id = %s",
-                        (order_id,),
-                    )
-                    order = cursor.fetchone()
-
-                    if not order:
-                        raise ValueError(f"Order {order_id} not found after creation")
-
-                    order = dict(order)
-
-                    # Get order items
-                    cursor.execute(
-                        "SELECT * FROM order_items WHERE customer_order_id = %s",
-                        (order_id,),
-                    )
-                    items = [dict(item) for item in cursor.fetchall()]
-
-                    order["items"] = items
-
-                    logger.info(f"Retrieved order {order_id} details successfully")
                     return order
 
         except Exception as e:
@@ -299,10 +319,7 @@ class StoreService:
             with self.db.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                     # Get order
-                    cursor.execute(
-                        "SELECT * FROM customer_orders WHERE customer_order_id = %s",
-                        (order_id,),
-                    )
+                    cursor.execute(ORDER_BY_ID_QUERY, (order_id,))
                     order = cursor.fetchone()
 
                     if not order:
@@ -311,10 +328,7 @@ class StoreService:
                     order = dict(order)
 
                     # Get order items
-                    cursor.execute(
-                        "SELECT * FROM order_items WHERE customer_order_id = %s",
-                        (order_id,),
-                    )
+                    cursor.execute(ORDER_ITEMS_QUERY, ([order_id],))
                     items = [dict(item) for item in cursor.fetchall()]
 
                     order["items"] = items
@@ -330,23 +344,21 @@ class StoreService:
         try:
             with self.db.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(
-                        """
-                        SELECT * FROM customer_orders
-                        WHERE customer_email = %s
-                        ORDER BY order_date DESC
-                        """,
-                        (email,),
-                    )
+                    cursor.execute(ORDERS_BY_EMAIL_QUERY, (email,))
                     orders = [dict(order) for order in cursor.fetchall()]
 
-                    # Get items for each order
-                    for order in orders:
+                    # Get items for all orders in one query and group them here
+                    items_by_order: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+                    if orders:
                         cursor.execute(
-                            "SELECT * FROM order_items WHERE customer_order_id = %s",
-                            (order["customer_order_id"],),
+                            ORDER_ITEMS_QUERY,
+                            ([order["customer_order_id"] for order in orders],),
                         )
-                        order["items"] = [dict(item) for item in cursor.fetchall()]
+                        for item in cursor.fetchall():
+                            items_by_order[item["customer_order_id"]].append(dict(item))
+
+                    for order in orders:
+                        order["items"] = items_by_order.get(order["customer_order_id"], [])
 
                     logger.info(f"Retrieved {len(orders)} orders for {email}")
                     return orders
@@ -355,6 +367,23 @@ class StoreService:
             logger.error(f"Error getting orders for {email}: {e}")
             raise
 
+    def iter_customer_orders(
+        self, limit: int, offset: int = 0, batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a page of customer orders (newest first) from a server-side cursor.
+
+        Only ``batch_size`` rows are held in memory at a time, so large admin
+        exports do not materialize the whole page. The pooled connection
+        stays checked out until the generator is exhausted or closed.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor(name="admin_orders_cur", cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(CUSTOMER_ORDERS_PAGE_QUERY, (limit, offset))
+                for row in cursor:
+                    yield dict(row)
+
     def get_all_customer_orders(
         self, limit: int = 100, offset: int = 0
     ) -> List[Dict[str, Any]]:
@@ -362,14 +391,7 @@ class StoreService:
         try:
             with self.db.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(
-                        """
-                        SELECT * FROM customer_orders
-                        ORDER BY order_date DESC
-                        LIMIT %s OFFSET %s
-                        """,
-                        (limit, offset),
-                    )
+                    cursor.execute(CUSTOMER_ORDERS_PAGE_QUERY, (limit, offset))
                     orders = [dict(order) for order in cursor.fetchall()]
 
                     logger.info(f"Retrieved {len(orders)} customer orders")
@@ -382,21 +404,12 @@ class StoreService:
     def update_order_status(self, order_id: int, status: str) -> Optional[Dict[str, Any]]:
         """Update order status"""
         try:
-            valid_statuses = ["pending", "processing", "shipped", "delivered", "cancelled"]
-            if status not in valid_statuses:
+            if status not in VALID_ORDER_STATUSES:
                 raise ValueError(f"Invalid status: {status}")
 
             with self.db.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(
-                        """
-                        UPDATE customer_orders
-                        SET status = %s
-                        WHERE customer_order_id = %s
-                        RETURNING *
-                        """,
-                        (status, order_id),
-                    )
+                    cursor.execute(UPDATE_ORDER_STATUS_QUERY, (status, order_id))
                     order = cursor.fetchone()
                     conn.commit()
 
@@ -0,0 +1,94 @@
+"""
+orjson-backed JSON provider for the Flask apps (store and admin dashboard).
+"""
+import sys
+from typing import Any
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o: Any) -> Any:
+    """
+    Fallback for types JSON can't encode: numpy/pandas values first, then
+    Flask's default hook (dates, Decimal, UUID, dataclasses).
+
+    Only runs for values the encoder does not know, so there is no need to
+    pre-walk responses converting pandas types.
+    """
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+
+    pd = sys.modules.get("pandas")
+    if pd is not None:
+        if isinstance(o, pd.DataFrame):
+            return o.to_dict("records")
+        if isinstance(o, (pd.Series, pd.Index)):
+            return o.tolist()
+
+    if hasattr(o, "dtype"):
+        return str(o)
+
+    return DefaultJSONProvider.default(o)
+
+
+class PandasJSONProvider(DefaultJSONProvider):
+    """Stdlib JSON provider that also understands numpy/pandas values."""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(PandasJSONProvider):
+    """
+    Flask JSON provider that serializes with orjson.
+
+    Dates, Decimals, UUIDs, etc. still go through Flask's default hook so
+    responses look exactly as they did with the stdlib provider.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # numpy scalars/arrays (pandas query results) are encoded natively
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(
+            obj, default=kwargs.get("default", self.default), option=option
+        ).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
+class SocketIOJSON:
+    """
+    json-module shim for python-socketio (``SocketIO(app, json=...)``) that
+    encodes packets with the app's provider, so emits use orjson too.
+
+    Keys are not sorted: packet payloads don't need a stable order.
+    """
+
+    def __init__(self, app: Flask):
+        self._provider = app.json
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        kwargs["sort_keys"] = False
+        return self._provider.dumps(obj, **kwargs)
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return self._provider.loads(s)
+
+
+def init_json_provider(app: Flask) -> None:
+    """Use orjson for jsonify/request.get_json when it is installed."""
+    app.json = OrjsonProvider(app) if orjson is not None else PandasJSONProvider(app)
@@ -5,6 +5,7 @@ Initializes and starts the customer-facing store on port 3000
 
 import sys
 import os
+from importlib.util import find_spec
 from loguru import logger
 
 # Add the project root to the Python path
@@ -18,7 +19,6 @@ def check_dependencies():
     required_modules = [
         'flask',
         'flask_cors',
-        'flask_session',
         'psycopg2',
         'pydantic',
         'loguru',
@@ -31,10 +31,10 @@ def check_dependencies():
 
     missing_modules = []
     for module in required_modules:
-        try:
-            __import__(module)
+        # find_spec only locates the module; it does not import it
+        if find_spec(module) is not None:
             print(f"[OK] {module} - OK")
-        except ImportError:
+        else:
             print(f"[X] {module} - NOT FOUND")
             missing_modules.append(module)
 
@@ -85,23 +85,13 @@ def check_database_schema():
     try:
         db = DatabaseConnection()
 
-        # Check if products table exists
-        result = db.execute_query("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables
-                WHERE table_name = 'products'
-            ) as exists
-        """)
-        products_exists = result[0]['exists'] if result else False
-
-        # Check if customer_orders table exists
+        # Check both store tables in one round trip (resolved via search_path)
         result = db.execute_query("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables
-                WHERE table_name = 'customer_orders'
-            ) as exists
+            SELECT to_regclass('products') IS NOT NULL AS products_exists,
+                   to_regclass('customer_orders') IS NOT NULL AS orders_exists
         """)
-        orders_exists = result[0]['exists'] if result else False
+        products_exists = result[0]['products_exists'] if result else False
+        orders_exists = result[0]['orders_exists'] if result else False
 
         if products_exists and orders_exists:
             print("[OK] Tablas de la tienda - OK")
@@ -167,8 +157,11 @@ def main():
     print()
 
     try:
-        from store_app import app
-        app.run(host='0.0.0.0', port=3000, debug=True)
+        from store_app import STORE_DEBUG, app
+        # No reloader: it would re-run every preflight check in a child process.
+        # Production: gunicorn -k gthread ... store_wsgi:app (see store_wsgi.py)
+        app.run(host='0.0.0.0', port=3000, threaded=True,
+                debug=STORE_DEBUG, use_reloader=False)
     except KeyboardInterrupt:
         print("\n\n[OK] Aplicacion detenida")
         sys.exit(0)
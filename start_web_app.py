@@ -93,8 +93,10 @@ def start_web_app():
     
     try:
         # Importar y ejecutar la aplicación web
-        from web_app import app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        # socketio.run para que funcionen los WebSockets (app.run no los sirve)
+        from web_app import app, socketio
+        debug = os.getenv('WEB_DEBUG', '').lower() in ('1', 'true', 'yes')
+        socketio.run(app, debug=debug, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
     except KeyboardInterrupt:
         print("\n👋 Aplicación detenida por el usuario")
     except Exception as e:
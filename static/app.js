@@ -65,6 +65,12 @@ function initializeWebSocket() {
         handleOrderChange(data);
     });
 
+    // Evento: Varios cambios agrupados (ráfagas); basta con recargar una vez
+    socket.on('order_changed_batch', function(changes) {
+        console.log(`📝 ${changes.length} órdenes modificadas`);
+        handleOrderChange(changes[changes.length - 1]);
+    });
+
     // Evento: Notificación
     socket.on('notification', function(data) {
         console.log('🔔 Notificación:', data);
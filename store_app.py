@@ -3,29 +3,43 @@ Store Web Application
 Customer-facing e-commerce store running on port 3000
 """
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 try:
-    from flask_session import Session
-except ImportError:
-    # For newer versions of flask-session
     from cachelib.file import FileSystemCache
-    Session = None
+    from cachelib.redis import RedisCache
+except ImportError:
+    FileSystemCache = RedisCache = None
+try:
+    import redis
+except ImportError:
+    redis = None
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 from decimal import Decimal
+import gzip
+import hashlib
+import json
 import os
+import threading
+import time
+import uuid
 from datetime import timedelta
+from functools import cache
+from typing import TYPE_CHECKING, Optional
+from cachetools import TTLCache
 from loguru import logger
 
-from src.services.product_service import ProductService
-from src.services.store_service import StoreService
-from src.models.store_models import (
-    Cart,
-    CartItem,
-    CustomerInfo,
-    CheckoutRequest,
-    ProductCreate,
-    ProductUpdate,
-)
+import src.config.settings  # noqa: F401  (loads .env into os.environ)
+from src.utils.json_provider import init_json_provider
+
+# Services and models are imported on first use to keep cold start cheap
+if TYPE_CHECKING:
+    from src.models.store_models import Cart
+    from src.services.product_service import ProductService
+    from src.services.store_service import StoreService
 
 # Initialize Flask app
 app = Flask(__name__,
@@ -33,75 +47,306 @@ app = Flask(__name__,
             static_folder='store_static')
 
 # Configuration
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SESSION_TYPE'] = 'filesystem'
+STORE_DEBUG = os.getenv('STORE_DEBUG', '').lower() in ('1', 'true')
+
+# Sessions are Flask's signed cookies; every worker must share the same key.
+# A per-process random key would make each gunicorn worker reject the
+# cookies signed by the others, so it is only allowed in debug mode
+if not os.environ.get('STORE_SECRET_KEY'):
+    if not STORE_DEBUG:
+        raise RuntimeError("STORE_SECRET_KEY is not set (required unless STORE_DEBUG=1)")
+    logger.warning("STORE_SECRET_KEY not set; using a per-process key (debug only)")
+app.config['SECRET_KEY'] = os.environ.get('STORE_SECRET_KEY') or os.urandom(24)
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 app.config['SESSION_COOKIE_NAME'] = 'store_session'
-app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(__file__), 'flask_session')
-
-# Initialize session
-if Session is not None:
-    Session(app)
+app.config['PROPAGATE_EXCEPTIONS'] = True
+
+# Carts too big for the cookie are kept server-side under a random key:
+# in Redis when REDIS_URL is set (shared by every worker/host), otherwise on disk
+CART_COOKIE_LIMIT = 3500
+CART_OVERFLOW_TIMEOUT = int(app.config['PERMANENT_SESSION_LIFETIME'].total_seconds())
+REDIS_URL = os.getenv('REDIS_URL')
+if RedisCache is not None and redis is not None and REDIS_URL:
+    cart_overflow = RedisCache(
+        host=redis.from_url(REDIS_URL, socket_keepalive=True),
+        key_prefix='store:cart:',
+        default_timeout=CART_OVERFLOW_TIMEOUT
+    )
+elif FileSystemCache is not None:
+    cart_overflow = FileSystemCache(
+        os.path.join(os.path.dirname(__file__), 'flask_session', 'carts'),
+        threshold=10000,
+        default_timeout=CART_OVERFLOW_TIMEOUT
+    )
 else:
-    # For flask-session >= 0.6.0
-    from flask_session import Session as FlaskSession
-    FlaskSession(app)
+    cart_overflow = None
 
 # Enable CORS
 CORS(app)
 
-# Initialize services
-product_service = ProductService()
-store_service = StoreService()
+# Compress JSON/HTML responses (brotli when available, else gzip)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+if Compress is not None:
+    Compress(app)
+
+# Serialize JSON responses with orjson when available
+init_json_provider(app)
+
+# Static assets: fingerprinted images never change, css/js may
+STATIC_IMAGES_PREFIX = f"{app.static_url_path}/images/"
+STATIC_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+STATIC_DEFAULT_CACHE = 'public, max-age=3600'
+
+
+@app.after_request
+def add_static_cache_headers(response):
+    """Set Cache-Control on /store_static responses"""
+    if request.path.startswith(app.static_url_path + '/') and response.status_code in (200, 304):
+        if request.path.startswith(STATIC_IMAGES_PREFIX):
+            response.headers['Cache-Control'] = STATIC_IMMUTABLE_CACHE
+        else:
+            response.headers['Cache-Control'] = STATIC_DEFAULT_CACHE
+    return response
+
+
+# Services, created on first use
+@cache
+def get_product_service() -> "ProductService":
+    from src.services.product_service import ProductService
+    return ProductService()
+
+
+@cache
+def get_store_service() -> "StoreService":
+    from src.services.store_service import StoreService
+    return StoreService()
+
+
+# Serialized /api/products bodies (plus a gzip copy) keyed by filters + product data version
+_products_responses: TTLCache = TTLCache(maxsize=256, ttl=30)
+_products_responses_lock = threading.Lock()
+
+
+# Serialized /api/categories body; rebuilt when the product data version changes
+# or after CATEGORIES_MAX_AGE (admin writes from other processes do not bump it)
+CATEGORIES_MAX_AGE = 300
+_categories_cache = {'body': None, 'gen': None, 'expires': 0.0}
+_categories_lock = threading.Lock()
 
 
 # Helper functions
-def get_cart_from_session() -> Cart:
-    """Get cart from session or create new one"""
-    if 'cart' not in session:
-        session['cart'] = {
-            'items': [],
-            'subtotal': '0.00',
-            'tax_rate': '0.08',
-            'tax_amount': '0.00',
-            'shipping_cost': '0.00',
-            'total': '0.00'
-        }
-
-    cart_data = session['cart']
-    items = [CartItem(**item) for item in cart_data['items']]
-
-    cart = Cart(
-        items=items,
-        subtotal=Decimal(cart_data['subtotal']),
-        tax_rate=Decimal(cart_data['tax_rate']),
-        tax_amount=Decimal(cart_data['tax_amount']),
-        shipping_cost=Decimal(cart_data['shipping_cost']),
-        total=Decimal(cart_data['total'])
-    )
+def get_categories_body() -> bytes:
+    """Return the serialized category list, hitting the DB only when stale"""
+    gen = get_product_service().cache_version()
+    entry = _categories_cache
+    if entry['body'] is not None and entry['gen'] == gen and time.monotonic() < entry['expires']:
+        return entry['body']
+
+    with _categories_lock:
+        if entry['body'] is not None and entry['gen'] == gen and time.monotonic() < entry['expires']:
+            return entry['body']
+
+        body = app.json.dumps(get_product_service().get_categories()).encode('utf-8')
+        entry.update(body=body, gen=gen, expires=time.monotonic() + CATEGORIES_MAX_AGE)
+        return body
+
+
+def stream_products_page(after, limit, category) -> Response:
+    """Stream one page of products; X-Next-Cursor holds the after value for the next page"""
+    products = get_product_service().get_products_page(after, limit, category)
+    dumps = app.json.dumps
+
+    def generate():
+        yield '['
+        for index, product in enumerate(products):
+            yield (',' if index else '') + dumps(product)
+        yield ']'
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if len(products) == limit:
+        response.headers['X-Next-Cursor'] = str(products[-1]['product_id'])
+    return response
+
+
+def get_products_response(search, category, min_price, max_price):
+    """
+    Return (etag, body, gzipped) for a product listing, serializing and
+    compressing it once per data version (gzipped is None for small bodies).
+    """
+    key = (search, category, min_price, max_price, get_product_service().cache_version())
+    cached = _products_responses.get(key)
+    if cached is not None:
+        return cached
+
+    with _products_responses_lock:
+        cached = _products_responses.get(key)
+        if cached is not None:
+            return cached
 
+        if any([search, category, min_price, max_price]):
+            products = get_product_service().search_products(
+                search_term=search,
+                category=category,
+                min_price=Decimal(min_price) if min_price else None,
+                max_price=Decimal(max_price) if max_price else None
+            )
+        else:
+            products = get_product_service().get_all_products(active_only=True)
+
+        body = app.json.dumps(products).encode('utf-8')
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        gzipped = gzip.compress(body, 6) if len(body) >= app.config['COMPRESS_MIN_SIZE'] else None
+        _products_responses[key] = (etag, body, gzipped)
+        return etag, body, gzipped
+
+
+# Response shape of an empty cart (read-only; items is a tuple so it cannot be mutated)
+EMPTY_CART = {
+    'items': (),
+    'subtotal': '0.00',
+    'tax_rate': '0.08',
+    'tax_amount': '0.00',
+    'shipping_cost': '0.00',
+    'total': '0.00'
+}
+
+
+# The session keeps only [[product_id, quantity], ...]; names, images and
+# prices are read from the (cached) product data on every request, so a
+# price change shows up in carts that already hold the product
+def get_cart_items() -> list:
+    """[[product_id, quantity], ...] of the session cart"""
+    packed = session.get('cart')
+    if packed is None:
+        return []
+
+    if 'ref' in packed:
+        items = cart_overflow.get(packed['ref']) if cart_overflow is not None else None
+        if isinstance(items, dict):
+            # Overflow entry written before the compact layout (full cart dict)
+            items = [[item['product_id'], item['quantity']] for item in items['items']]
+        return items or []
+
+    # Cookies written before the compact layout carry 6 fields per item
+    # (product_id first, quantity fifth)
+    return [item if len(item) == 2 else [item[0], item[4]] for item in packed['items']]
+
+
+def build_cart(items: list) -> "Cart":
+    """Cart for [[product_id, quantity], ...] priced from the current product data"""
+    from src.models.store_models import Cart, CartItem
+    products = get_product_service().get_products_by_ids([pid for pid, _ in items]) if items else {}
+    # Products deleted since they were added drop out of the cart
+    cart = Cart(items=[
+        CartItem(
+            product_id=pid,
+            product_name=product['name'],
+            product_price=product['price'],
+            product_image=product.get('image_url'),
+            quantity=quantity
+        )
+        for pid, quantity in items
+        if (product := products.get(pid)) is not None
+    ])
+    cart.calculate_totals()
     return cart
 
 
-def save_cart_to_session(cart: Cart):
-    """Save cart to session"""
-    session['cart'] = {
-        'items': [item.model_dump() for item in cart.items],
-        'subtotal': str(cart.subtotal),
+def cart_to_dict(cart: "Cart") -> dict:
+    """Cart as returned by the API (money formatted from integer cents)"""
+    from src.models.store_models import format_cents
+    totals = cart.totals_cents()
+    return {
+        'items': [
+            {
+                'product_id': item.product_id,
+                'product_name': item.product_name,
+                'product_price': format_cents(item.price_cents),
+                'product_image': item.product_image,
+                'quantity': item.quantity,
+                'subtotal': format_cents(item.price_cents * item.quantity)
+            }
+            for item in cart.items
+        ],
+        'subtotal': format_cents(totals['subtotal']),
         'tax_rate': str(cart.tax_rate),
-        'tax_amount': str(cart.tax_amount),
-        'shipping_cost': str(cart.shipping_cost),
-        'total': str(cart.total)
+        'tax_amount': format_cents(totals['tax_amount']),
+        'shipping_cost': format_cents(totals['shipping_cost']),
+        'total': format_cents(totals['total'])
     }
+
+
+def get_cart_raw() -> dict:
+    """The session cart as returned by the API, priced with the current product data"""
+    items = get_cart_items()
+    if not items:
+        return EMPTY_CART
+    return cart_to_dict(build_cart(items))
+
+
+def get_cart_version() -> int:
+    """Version of the session cart, bumped on every save"""
+    return (session.get('cart') or {}).get('v', 0)
+
+
+def save_cart_items(items: list) -> None:
+    """Store [[product_id, quantity], ...] in the cookie session (or server-side if too big)"""
+    previous = session.get('cart') or {}
+    version = previous.get('v', 0) + 1
+
+    if cart_overflow is not None and len(json.dumps(items)) > CART_COOKIE_LIMIT:
+        ref = previous.get('ref') or uuid.uuid4().hex
+        cart_overflow.set(ref, items)
+        session['cart'] = {'ref': ref, 'v': version}
+    else:
+        if 'ref' in previous and cart_overflow is not None:
+            cart_overflow.delete(previous['ref'])
+        session['cart'] = {'items': items, 'v': version}
+
     session.modified = True
 
 
-def decimal_to_float(obj):
-    """Convert Decimal to float for JSON serialization"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+# Cart version header. Not an ETag: Flask-Compress rewrites ETags of
+# compressed bodies ("3" -> "3:gzip"), which would break the comparison
+CART_VERSION_HEADER = 'X-Cart-Version'
+
+
+def cart_response(payload: dict, status: int = 200) -> Response:
+    """JSON response carrying the cart version in X-Cart-Version"""
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers[CART_VERSION_HEADER] = str(get_cart_version())
+    return response
+
+
+def cart_version_conflict() -> Optional[Response]:
+    """
+    Optimistic concurrency check for cart mutations.
+
+    Clients send back the X-Cart-Version of the cart they last saw; a
+    stale version gets 409 plus the current cart so the client can retry.
+    Requests without the header are accepted as before.
+    """
+    seen = request.headers.get(CART_VERSION_HEADER)
+    if seen is not None and seen.strip() != str(get_cart_version()):
+        return cart_response({'error': 'Cart was modified, retry', 'cart': get_cart_raw()}, 409)
+    return None
+
+
+def get_cart_from_session() -> "Cart":
+    """Get the session cart as a Cart priced from the current product data"""
+    return build_cart(get_cart_items())
+
+
+def save_cart_to_session(cart: "Cart") -> dict:
+    """Save cart to session and return it as the API dict"""
+    save_cart_items([[item.product_id, item.quantity] for item in cart.items])
+    return cart_to_dict(cart)
 
 
 # Routes
@@ -127,8 +372,7 @@ def cart_page():
 @app.route('/checkout')
 def checkout_page():
     """Checkout page"""
-    cart = get_cart_from_session()
-    if not cart.items:
+    if not get_cart_items():
         return render_template('store_cart.html', error="Your cart is empty")
     return render_template('store_checkout.html')
 
@@ -150,17 +394,27 @@ def get_products():
         min_price = request.args.get('min_price')
         max_price = request.args.get('max_price')
 
-        if any([search, category, min_price, max_price]):
-            products = product_service.search_products(
-                search_term=search,
-                category=category,
-                min_price=Decimal(min_price) if min_price else None,
-                max_price=Decimal(max_price) if max_price else None
-            )
+        # ?limit=&after= -> keyset page streamed as a JSON array
+        if 'limit' in request.args or 'after' in request.args:
+            from src.services.product_service import PRODUCT_PAGE_MAX, PRODUCT_PAGE_SIZE
+            limit = min(request.args.get('limit', PRODUCT_PAGE_SIZE, type=int), PRODUCT_PAGE_MAX)
+            after = request.args.get('after', type=int)
+            return stream_products_page(after, max(limit, 1), category)
+
+        etag, body, gzipped = get_products_response(search, category, min_price, max_price)
+
+        # Serve the cached gzip copy as-is so it is not recompressed per request
+        if gzipped is not None and 'gzip' in request.accept_encodings:
+            response = Response(gzipped, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            etag += '-gzip'
         else:
-            products = product_service.get_all_products(active_only=True)
+            response = Response(body, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
 
-        return jsonify(products), 200
+        # 304 when the client already has this exact listing
+        response.set_etag(etag)
+        return response.make_conditional(request)
 
     except Exception as e:
         logger.error(f"Error getting products: {e}")
@@ -171,7 +425,7 @@ def get_products():
 def get_product(product_id):
     """Get specific product"""
     try:
-        product = product_service.get_product_by_id(product_id)
+        product = get_product_service().get_product_by_id(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
 
@@ -186,8 +440,7 @@ def get_product(product_id):
 def get_categories():
     """Get all product categories"""
     try:
-        categories = product_service.get_categories()
-        return jsonify(categories), 200
+        return Response(get_categories_body(), mimetype='application/json'), 200
 
     except Exception as e:
         logger.error(f"Error getting categories: {e}")
@@ -198,8 +451,7 @@ def get_categories():
 def get_cart():
     """Get current cart"""
     try:
-        cart = get_cart_from_session()
-        return jsonify(cart.model_dump()), 200
+        return cart_response(get_cart_raw())
 
     except Exception as e:
         logger.error(f"Error getting cart: {e}")
@@ -217,14 +469,18 @@ def add_to_cart():
         if not product_id:
             return jsonify({'error': 'Product ID is required'}), 400
 
+        conflict = cart_version_conflict()
+        if conflict is not None:
+            return conflict
+
         cart = get_cart_from_session()
-        cart = store_service.add_to_cart(cart, product_id, quantity)
-        save_cart_to_session(cart)
+        cart = get_store_service().add_to_cart(cart, product_id, quantity)
+        cart_data = save_cart_to_session(cart)
 
-        return jsonify({
+        return cart_response({
             'message': 'Product added to cart',
-            'cart': cart.model_dump()
-        }), 200
+            'cart': cart_data
+        })
 
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -244,14 +500,18 @@ def update_cart():
         if not product_id or quantity is None:
             return jsonify({'error': 'Product ID and quantity are required'}), 400
 
+        conflict = cart_version_conflict()
+        if conflict is not None:
+            return conflict
+
         cart = get_cart_from_session()
-        cart = store_service.update_cart_item(cart, product_id, quantity)
-        save_cart_to_session(cart)
+        cart = get_store_service().update_cart_item(cart, product_id, quantity)
+        cart_data = save_cart_to_session(cart)
 
-        return jsonify({
+        return cart_response({
             'message': 'Cart updated',
-            'cart': cart.model_dump()
-        }), 200
+            'cart': cart_data
+        })
 
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -264,14 +524,18 @@ def update_cart():
 def remove_from_cart(product_id):
     """Remove item from cart"""
     try:
+        conflict = cart_version_conflict()
+        if conflict is not None:
+            return conflict
+
         cart = get_cart_from_session()
-        cart = store_service.remove_from_cart(cart, product_id)
-        save_cart_to_session(cart)
+        cart = get_store_service().remove_from_cart(cart, product_id)
+        cart_data = save_cart_to_session(cart)
 
-        return jsonify({
+        return cart_response({
             'message': 'Product removed from cart',
-            'cart': cart.model_dump()
-        }), 200
+            'cart': cart_data
+        })
 
     except Exception as e:
         logger.error(f"Error removing from cart: {e}")
@@ -282,14 +546,16 @@ def remove_from_cart(product_id):
 def clear_cart():
     """Clear cart"""
     try:
-        cart = get_cart_from_session()
-        cart = store_service.clear_cart(cart)
-        save_cart_to_session(cart)
+        conflict = cart_version_conflict()
+        if conflict is not None:
+            return conflict
 
-        return jsonify({
+        save_cart_items([])
+
+        return cart_response({
             'message': 'Cart cleared',
-            'cart': cart.model_dump()
-        }), 200
+            'cart': EMPTY_CART
+        })
 
     except Exception as e:
         logger.error(f"Error clearing cart: {e}")
@@ -302,28 +568,30 @@ def checkout():
     try:
         data = request.get_json()
 
-        # Get cart from session
-        cart = get_cart_from_session()
-
-        if not cart.items:
+        # Empty carts are rejected before building any model
+        items = get_cart_items()
+        if not items:
             return jsonify({'error': 'Cart is empty'}), 400
 
+        from src.models.store_models import CheckoutRequest, CustomerInfo
+        # Priced from the current product data, never from the cookie
+        cart = build_cart(items)
+
         # Create customer info
-        customer_info = CustomerInfo(**data['customer_info'])
+        customer_info = CustomerInfo.model_validate(data['customer_info'])
 
         # Create checkout request
-        checkout_request = CheckoutRequest(
-            customer_info=customer_info,
-            cart=cart,
-            payment_method=data.get('payment_method', 'simulated')
-        )
+        checkout_request = CheckoutRequest.model_validate({
+            'customer_info': customer_info,
+            'cart': cart,
+            'payment_method': data.get('payment_method', 'simulated')
+        })
 
         # Process checkout
-        order = store_service.process_checkout(checkout_request)
+        order = get_store_service().process_checkout(checkout_request)
 
         # Clear cart after successful checkout
-        cart = store_service.clear_cart(cart)
-        save_cart_to_session(cart)
+        save_cart_items([])
 
         return jsonify({
             'message': 'Order created successfully',
@@ -341,7 +609,7 @@ def checkout():
 def get_order(order_id):
     """Get order details"""
     try:
-        order = store_service.get_order_by_id(order_id)
+        order = get_store_service().get_order_by_id(order_id)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
 
@@ -356,7 +624,7 @@ def get_order(order_id):
 def get_orders_by_email(email):
     """Get orders by customer email"""
     try:
-        orders = store_service.get_orders_by_email(email)
+        orders = get_store_service().get_orders_by_email(email)
         return jsonify(orders), 200
 
     except Exception as e:
@@ -375,5 +643,7 @@ def health_check():
 
 
 if __name__ == '__main__':
+    # Development server only; production runs store_wsgi:app under gunicorn
     logger.info("Starting Store Web Application on port 3000")
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    app.run(host='0.0.0.0', port=3000, threaded=True,
+            debug=STORE_DEBUG)
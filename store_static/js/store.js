@@ -44,9 +44,42 @@ function showNotification(message, type = 'success') {
 }
 
 // Cart functions
+
+// Last cart version seen from the server; mutations send it back in X-Cart-Version
+let cartVersion = null;
+let cartQueue = Promise.resolve();
+
+function rememberCartVersion(response) {
+    const version = response.headers.get('X-Cart-Version');
+    if (version) cartVersion = version;
+}
+
+function cartMutation(url, options) {
+    // Run cart mutations one at a time; on 409 retry once with the fresh version
+    const run = async () => {
+        const send = () => fetch(url, {
+            ...options,
+            headers: { ...(options.headers || {}), ...(cartVersion ? { 'X-Cart-Version': cartVersion } : {}) }
+        });
+
+        let response = await send();
+        if (response.status === 409) {
+            rememberCartVersion(response);
+            response = await send();
+        }
+        rememberCartVersion(response);
+        return response;
+    };
+
+    const result = cartQueue.then(run, run);
+    cartQueue = result.catch(() => {});
+    return result;
+}
+
 async function getCart() {
     try {
         const response = await fetch(`${API_BASE}/api/cart`);
+        rememberCartVersion(response);
         const cart = await response.json();
         return cart;
     } catch (error) {
@@ -57,7 +90,7 @@ async function getCart() {
 
 async function addToCart(productId, quantity = 1) {
     try {
-        const response = await fetch(`${API_BASE}/api/cart/add`, {
+        const response = await cartMutation(`${API_BASE}/api/cart/add`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -84,7 +117,7 @@ async function addToCart(productId, quantity = 1) {
 
 async function updateCartItem(productId, quantity) {
     try {
-        const response = await fetch(`${API_BASE}/api/cart/update`, {
+        const response = await cartMutation(`${API_BASE}/api/cart/update`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json'
@@ -109,7 +142,7 @@ async function updateCartItem(productId, quantity) {
 
 async function removeFromCart(productId) {
     try {
-        const response = await fetch(`${API_BASE}/api/cart/remove/${productId}`, {
+        const response = await cartMutation(`${API_BASE}/api/cart/remove/${productId}`, {
             method: 'DELETE'
         });
 
@@ -0,0 +1,18 @@
+"""
+WSGI/ASGI entry point for the customer store.
+
+Production (Linux). STORE_SECRET_KEY must be set (env or .env) so every
+worker signs the session cookie with the same key; the app refuses to start
+without it unless STORE_DEBUG=1:
+    gunicorn -k gthread -w $(nproc) --threads 8 -b 0.0.0.0:3000 --access-logfile - store_wsgi:app
+
+ASGI servers (requires asgiref):
+    uvicorn --workers 4 --loop uvloop --interface asgi3 store_wsgi:asgi_app
+"""
+from store_app import app
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    asgi_app = WsgiToAsgi(app)
+except ImportError:
+    asgi_app = None
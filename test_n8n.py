@@ -1,5 +1,7 @@
 """Test n8n webhook connection"""
+import asyncio
 import sys
+import time
 sys.path.insert(0, '.')
 
 from src.config.settings import n8n_settings
@@ -18,21 +20,56 @@ if not n8n_settings.enabled:
     print("   Set N8N_WEBHOOK_ENABLED=true in your .env file")
     sys.exit(1)
 
-print("Testing connection to n8n...")
+# Number of concurrent probes (python test_n8n.py 5)
+PROBES = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+
+async def timed_probe(index: int):
+    """Send one test event through the production async path and time it"""
+    start = time.perf_counter()
+    response = await n8n_webhook.asend_event('chatbot.message', {
+        'message': f'Test desde Python #{index}',
+        'user': 'test_user',
+        'timestamp': '2025-11-12T13:50:00'
+    })
+    return response, time.perf_counter() - start
+
+
+async def probe():
+    """Fire every probe at once over the shared client and collect the results"""
+    try:
+        return await asyncio.gather(
+            *(timed_probe(i) for i in range(1, PROBES + 1)), return_exceptions=True
+        )
+    finally:
+        await n8n_webhook.aclose()
+
+
+print(f"Testing connection to n8n ({PROBES} concurrent events)...")
 print("-" * 60)
 
-response = n8n_webhook.send_event('chatbot.message', {
-    'message': 'Test desde Python',
-    'user': 'test_user',
-    'timestamp': '2025-11-12T13:50:00'
-})
+results = asyncio.run(probe())
+
+print()
+latencies = []
+ok = 0
+for index, result in enumerate(results, start=1):
+    if isinstance(result, Exception):
+        print(f"  #{index}: ❌ {result}")
+        continue
+    response, elapsed = result
+    latencies.append(elapsed)
+    ok += bool(response)
+    print(f"  #{index}: {'✅' if response else '❌'} {elapsed * 1000:.0f} ms  {response or ''}")
+
+if latencies:
+    print(f"\nLatency avg {sum(latencies) / len(latencies) * 1000:.0f} ms, worst {max(latencies) * 1000:.0f} ms")
 
 print()
-if response:
+if ok == PROBES:
     print("✅ SUCCESS: n8n webhook is working!")
-    print(f"Response: {response}")
 else:
-    print("❌ FAILED: Could not connect to n8n webhook")
+    print(f"❌ FAILED: {PROBES - ok} of {PROBES} events could not be delivered")
     print("   Check the logs above for error details")
 
 print("=" * 60)
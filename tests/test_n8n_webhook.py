@@ -0,0 +1,90 @@
+"""
+Payload serialization for the n8n webhook client.
+
+Run with: python -m unittest discover tests
+"""
+import json
+import unittest
+from unittest import mock
+
+from src.integrations import n8n_webhook
+from src.integrations.n8n_webhook import N8NWebhook, _dumps
+
+
+def _enabled_webhook() -> N8NWebhook:
+    """Real client built as if N8N_WEBHOOK_ENABLED were set (nothing is sent)"""
+    with mock.patch.object(n8n_webhook, "N8N_WEBHOOK_ENABLED", True):
+        return N8NWebhook()
+
+
+class _Stop(Exception):
+    """Raised by the patched _post to end the _drain_queue loop"""
+
+
+class DumpsTest(unittest.TestCase):
+
+    def test_bulk_status_payload_with_int_keys(self):
+        # Same shape web_app sends from /api/orders/bulk-status
+        updated = [
+            {"order_id": 101, "old_status": "Pending"},
+            {"order_id": 102, "old_status": "Shipped"},
+        ]
+        data = {
+            "order_ids": [row["order_id"] for row in updated],
+            "new_status": "Order Finished",
+            "updated_count": len(updated),
+            "old_statuses": {row["order_id"]: row["old_status"] for row in updated},
+        }
+        payload = _enabled_webhook()._build_payload("order.bulk_status_update", data)
+
+        decoded = json.loads(_dumps(payload))
+
+        self.assertEqual(decoded["event_type"], "order.bulk_status_update")
+        self.assertEqual(decoded["data"]["old_statuses"], {"101": "Pending", "102": "Shipped"})
+        self.assertEqual(decoded["data"]["order_ids"], [101, 102])
+
+
+class DrainQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.webhook = _enabled_webhook()
+        # Events are drained by hand below, not by the background thread
+        self.webhook._ensure_worker = lambda: None
+        self.webhook._post = mock.Mock(side_effect=_Stop)
+
+    def test_queued_events_are_sent_as_one_batch(self):
+        self.webhook.send_order_deleted(101)
+        self.webhook.send_order_status_changed(102, "Pending", "Shipped")
+
+        with self.assertRaises(_Stop):
+            self.webhook._drain_queue()
+
+        self.webhook._post.assert_called_once()
+        event_type, payload = self.webhook._post.call_args.args
+        decoded = json.loads(_dumps(payload))
+
+        self.assertEqual(event_type, "batch")
+        self.assertEqual(list(decoded), ["event_type", "timestamp", "source", "events"])
+        self.assertEqual(decoded["event_type"], "batch")
+        self.assertEqual(decoded["source"], "NextFlow")
+        self.assertEqual(
+            [event["event_type"] for event in decoded["events"]],
+            ["order.deleted", "order.status_changed"],
+        )
+        self.assertEqual(decoded["events"][0]["data"], {"order_id": 101})
+        self.assertEqual(decoded["events"][1]["data"]["new_status"], "Shipped")
+
+    def test_lone_event_is_sent_unwrapped(self):
+        self.webhook.send_order_deleted(101)
+
+        with self.assertRaises(_Stop):
+            self.webhook._drain_queue()
+
+        event_type, payload = self.webhook._post.call_args.args
+        self.assertEqual(event_type, "order.deleted")
+        self.assertEqual(payload["data"], {"order_id": 101})
+        self.assertNotIn("events", payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
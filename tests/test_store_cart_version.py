@@ -0,0 +1,65 @@
+"""
+Optimistic cart versioning (X-Cart-Version) on compressed responses.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+os.environ.setdefault('STORE_SECRET_KEY', 'test-secret-key')
+
+from store_app import app, CART_VERSION_HEADER
+
+
+def _products(items: int = 20) -> dict:
+    """Products whose cart JSON is well above COMPRESS_MIN_SIZE"""
+    return {
+        i: {
+            'product_id': i,
+            'name': f'Producto de prueba {i}',
+            'price': Decimal('19.99'),
+            'image_url': f'https://example.com/images/product-{i}.jpg',
+        }
+        for i in range(items)
+    }
+
+
+class CartVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['cart'] = {'items': [[i, 1] for i in range(20)], 'v': 3}
+
+        # The cookie only holds [product_id, quantity]; prices come from here
+        patcher = mock.patch('store_app.get_product_service')
+        patcher.start().return_value.get_products_by_ids.return_value = _products()
+        self.addCleanup(patcher.stop)
+
+    def test_version_round_trips_on_gzip_responses(self):
+        response = self.client.get('/api/cart', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.get_data()), app.config['COMPRESS_MIN_SIZE'])
+        version = response.headers[CART_VERSION_HEADER]
+        self.assertEqual(version, '3')
+
+        response = self.client.delete(
+            '/api/cart/clear',
+            headers={'Accept-Encoding': 'gzip', CART_VERSION_HEADER: version}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers[CART_VERSION_HEADER], '4')
+
+    def test_stale_version_gets_409(self):
+        response = self.client.delete(
+            '/api/cart/clear',
+            headers={'Accept-Encoding': 'gzip', CART_VERSION_HEADER: '2'}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers[CART_VERSION_HEADER], '3')
+
+
+if __name__ == '__main__':
+    unittest.main()
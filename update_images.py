@@ -1,7 +1,14 @@
 """
 Script para actualizar imágenes de productos de forma fácil.
 """
-from src.database.connection import DatabaseConnection
+import hashlib
+import os
+import sys
+
+import requests
+from psycopg2.extras import execute_values
+
+from src.database.connection import db_connection
 from loguru import logger
 
 # Mapeo de productos a URLs de imágenes
@@ -30,41 +37,87 @@ PRODUCT_IMAGES = {
     "Notebook Set": "https://images.unsplash.com/photo-1531346878377-a5be20888e57?w=800&q=80",
 }
 
+# Carpeta estática de la tienda y URL pública con la que se sirve
+# (STORE_IMAGE_BASE_URL permite apuntar a un CDN delante de esa carpeta)
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'store_static', 'images')
+IMAGE_BASE_URL = os.getenv('STORE_IMAGE_BASE_URL', '/store_static/images')
+
+
+def localize_images(images: dict) -> dict:
+    """
+    Descargar cada imagen una vez y guardarla con nombre por hash de contenido.
+
+    El nombre cambia si cambia el contenido, así que la tienda puede servirla
+    con Cache-Control immutable. Si una descarga falla se conserva la URL original.
+    """
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    localized = {}
+
+    with requests.Session() as http:
+        for product_name, url in images.items():
+            try:
+                response = http.get(url, timeout=30)
+                response.raise_for_status()
+                content = response.content
+
+                filename = f"{hashlib.blake2b(content).hexdigest()[:16]}.jpg"
+                path = os.path.join(IMAGES_DIR, filename)
+                if not os.path.exists(path):
+                    with open(path, 'wb') as f:
+                        f.write(content)
 
-def update_product_images():
+                localized[product_name] = f"{IMAGE_BASE_URL}/{filename}"
+                print(f"[OK] Descargada: {product_name} -> {filename}")
+
+            except Exception as e:
+                print(f"[WARN] No se pudo descargar {product_name}, se usa la URL original: {e}")
+                localized[product_name] = url
+
+    return localized
+
+
+def update_product_images(localize: bool = True):
     """Actualizar las imágenes de los productos en la base de datos."""
-    db = DatabaseConnection()
+    db = db_connection
 
     print("=" * 80)
     print("ACTUALIZANDO IMÁGENES DE PRODUCTOS")
     print("=" * 80)
     print()
 
+    images = localize_images(PRODUCT_IMAGES) if localize else PRODUCT_IMAGES
+
     updated_count = 0
+    names = list(images)
 
     try:
         with db.get_connection() as conn:
             with conn.cursor() as cursor:
-                for product_name, image_url in PRODUCT_IMAGES.items():
-                    try:
-                        # Actualizar la imagen del producto
-                        cursor.execute(
-                            "UPDATE products SET image_url = %s WHERE name = %s",
-                            (image_url, product_name)
-                        )
-
-                        if cursor.rowcount > 0:
-                            print(f"[OK] Actualizado: {product_name}")
-                            updated_count += cursor.rowcount
-                        else:
-                            print(f"[WARN] No encontrado: {product_name}")
-
-                    except Exception as e:
-                        print(f"[ERROR] Error actualizando {product_name}: {e}")
+                # Un solo SELECT para saber cuáles existen
+                cursor.execute("SELECT name FROM products WHERE name = ANY(%s)", (names,))
+                found = {row['name'] for row in cursor.fetchall()}
+
+                # Un solo UPDATE ... FROM (VALUES ...) para todas las imágenes
+                # (page_size cubre todo el mapeo, así rowcount es el total)
+                execute_values(
+                    cursor,
+                    "UPDATE products p SET image_url = v.url "
+                    "FROM (VALUES %s) AS v(name, url) WHERE p.name = v.name",
+                    list(images.items()),
+                    template="(%s, %s)",
+                    page_size=max(len(names), 1)
+                )
+                updated_count = cursor.rowcount
 
                 # Confirmar cambios
                 conn.commit()
 
+        for product_name in names:
+            if product_name in found:
+                print(f"[OK] Actualizado: {product_name}")
+            else:
+                print(f"[WARN] No encontrado: {product_name}")
+
         print()
         print("=" * 80)
         print(f"[COMPLETADO] {updated_count} productos actualizados")
@@ -79,4 +132,5 @@ def update_product_images():
 
 
 if __name__ == "__main__":
-    update_product_images()
+    # --hotlink guarda las URLs remotas tal cual, sin descargarlas
+    update_product_images(localize='--hotlink' not in sys.argv)
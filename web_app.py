@@ -4,11 +4,26 @@ Aplicación web Flask para gestión de limpieza de datos y visualización.
 import sys
 import os
 import json
+import hashlib
+import hmac
+import threading
+import time
+import zlib
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file
+from itertools import product
+from cachetools import TTLCache
+from flask import Flask, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-import pandas as pd
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+from flask_socketio import SocketIO, emit, join_room
+from socketio import PubSubManager
+try:
+    import redis
+except ImportError:
+    redis = None
 import plotly.graph_objs as go
 import plotly.utils
 
@@ -17,52 +32,172 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.database.connection import db_connection
 from src.services.order_service import OrderService
+from src.services.store_service import StoreService
 from src.utils.logger import logger
+from src.utils.json_provider import init_json_provider, SocketIOJSON
 from src.integrations.n8n_webhook import n8n_webhook
-from src.config.settings import n8n_settings
-
-def convert_pandas_types(obj):
-    """Convierte tipos de pandas/numpy a tipos nativos de Python para serialización JSON."""
-    import numpy as np
-    import pandas as pd
-    
-    if isinstance(obj, (np.integer, np.int64, np.int32, np.int16, np.int8)):
-        return int(obj)
-    elif isinstance(obj, (np.floating, np.float64, np.float32, np.float16)):
-        return float(obj)
-    elif isinstance(obj, np.bool_):
-        return bool(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, pd.Series):
-        return obj.tolist()
-    elif isinstance(obj, pd.DataFrame):
-        return obj.to_dict('records')
-    elif hasattr(obj, 'dtype') and hasattr(obj, 'item'):
-        # Para tipos de pandas específicos
-        try:
-            return obj.item()
-        except (ValueError, AttributeError):
-            return str(obj)
-    elif hasattr(obj, 'dtype'):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_pandas_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_pandas_types(item) for item in obj]
-    elif isinstance(obj, tuple):
-        return tuple(convert_pandas_types(item) for item in obj)
-    else:
-        return obj
+from src.config.settings import N8N_WEBHOOK_URL, N8N_WEBHOOK_ENABLED, N8N_WEBHOOK_SECRET
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'nextflow-secret-key-2024'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# jsonify serializa con orjson (si está instalado)
+init_json_provider(app)
+
+# Comprimir respuestas JSON/CSV grandes (brotli si está disponible, si no gzip)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/csv', 'text/html']
+# Flask-Compress bufferiza las respuestas en streaming para comprimirlas; las
+# exportaciones (CSV, Power BI) se comprimen por trozos en su generador
+app.config['COMPRESS_STREAMS'] = False
+if Compress is not None:
+    Compress(app)
+# Con varios procesos (detrás de un balanceador con sticky sessions) los
+# broadcasts se reparten por la cola de mensajes, p. ej. redis://localhost:6379/0
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE') or None,
+    json=SocketIOJSON(app)
+)
 
 # Inicializar servicios
 order_service = OrderService()
 
+# Columnas de una orden que devuelve la API (sin las generadas order_year/month/quarter)
+ORDER_COLUMNS = ("order_id, status, customer_name, order_date, quantity, "
+                 "subtotal_amount, tax_rate, shipping_cost, category, subcategory")
+
+# Campos requeridos para crear/reemplazar una orden
+ORDER_REQUIRED_FIELDS = ('status', 'customer_name', 'order_date', 'quantity',
+                         'subtotal_amount', 'tax_rate', 'shipping_cost', 'category', 'subcategory')
+
+# Consultas frecuentes como sentencias preparadas (parse/plan una vez por conexión)
+ORDER_BY_ID_QUERY = f"SELECT {ORDER_COLUMNS} FROM orders WHERE order_id = $1"
+DELETE_ORDER_QUERY = "DELETE FROM orders WHERE order_id = $1"
+UPDATE_ORDER_STATUS_QUERY = "UPDATE orders SET status = $2 WHERE order_id = $1"
+UPDATE_ORDER_QUERY = (
+    "UPDATE orders SET "
+    + ", ".join(f"{field} = ${i}" for i, field in enumerate(ORDER_REQUIRED_FIELDS, start=2))
+    + " WHERE order_id = $1"
+)
+UPDATE_ORDER_ARG_TYPES = "bigint, text, text, date, integer, numeric, numeric, numeric, text, text"
+
+# Filtros de search_orders en orden fijo: (campo, condición con {} para el parámetro)
+ORDER_SEARCH_FILTERS = (
+    ('status', "status = {}"),
+    ('customer_name', "customer_name ILIKE {}"),
+    ('category', "category = {}"),
+)
+
+# Filtros de GET /api/orders en orden fijo
+ORDER_LIST_FILTERS = ('status', 'category')
+
+
+def _where(conditions):
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _build_order_statements():
+    """
+    Todas las variantes (nombre, query con $n, tipos) de los listados de órdenes,
+    generadas una vez al importar: el texto de cada variante es fijo y se
+    prepara una sola vez por conexión.
+    """
+    search = {}
+    for shape in product((False, True), repeat=len(ORDER_SEARCH_FILTERS)):
+        clauses = [clause for used, (_, clause) in zip(shape, ORDER_SEARCH_FILTERS) if used]
+        conditions = [clause.format(f"${n}") for n, clause in enumerate(clauses, start=1)]
+        search[shape] = (
+            "order_search_" + "".join("1" if used else "0" for used in shape),
+            f"SELECT {ORDER_COLUMNS} FROM orders {_where(conditions)} ORDER BY order_id DESC LIMIT 50",
+            ", ".join(["text"] * len(conditions)),
+        )
+
+    counts, pages = {}, {}
+    for shape in product((False, True), repeat=len(ORDER_LIST_FILTERS)):
+        used = [field for flag, field in zip(shape, ORDER_LIST_FILTERS) if flag]
+        conditions = [f"{field} = ${n}" for n, field in enumerate(used, start=1)]
+        suffix = "".join("1" if flag else "0" for flag in shape)
+        types = ["text"] * len(used)
+        n = len(used)
+        counts[shape] = (
+            f"orders_count_{suffix}",
+            f"SELECT COUNT(*) AS total FROM orders {_where(conditions)}",
+            ", ".join(types),
+        )
+        # Keyset (after_id) y OFFSET
+        pages[shape, True] = (
+            f"orders_page_keyset_{suffix}",
+            f"SELECT {ORDER_COLUMNS} FROM orders {_where(conditions + [f'order_id < ${n + 1}'])} "
+            f"ORDER BY order_id DESC LIMIT ${n + 2}",
+            ", ".join(types + ["bigint", "integer"]),
+        )
+        pages[shape, False] = (
+            f"orders_page_{suffix}",
+            f"SELECT {ORDER_COLUMNS} FROM orders {_where(conditions)} "
+            f"ORDER BY order_id DESC LIMIT ${n + 1} OFFSET ${n + 2}",
+            ", ".join(types + ["integer", "integer"]),
+        )
+    return search, counts, pages
+
+
+ORDER_SEARCH_STATEMENTS, ORDER_COUNT_STATEMENTS, ORDER_PAGE_STATEMENTS = _build_order_statements()
+
+
+def _bind(statement, params):
+    """(nombre, query, tipos) + parámetros -> argumentos de query_prepared."""
+    name, query, arg_types = statement
+    return name, query, params, arg_types
+
+# Respuestas de agregados ya serializadas: clave -> (etag, body).
+# Se vacía en cada escritura (refresh_order_stats) y caduca a los 30s
+_agg_cache: TTLCache = TTLCache(maxsize=64, ttl=30)
+_agg_cache_lock = threading.Lock()
+# Caché del navegador/proxy para esas respuestas (revalidan con ETag)
+AGG_CLIENT_MAX_AGE = 15
+
+# Payload de 'dashboard_update' compartido entre procesos en Redis (REDIS_URL)
+DASHBOARD_CACHE_KEY = 'nextflow:dashboard:stats:v1'
+DASHBOARD_CACHE_TTL = 10
+REDIS_URL = os.getenv('REDIS_URL')
+redis_client = (
+    redis.from_url(REDIS_URL, socket_keepalive=True, socket_timeout=1)
+    if redis is not None and REDIS_URL else None
+)
+
+
+def cached_value(key, compute):
+    """Return compute()'s result from the aggregate cache (same TTL and invalidation)."""
+    with _agg_cache_lock:
+        value = _agg_cache.get(key)
+    if value is None:
+        value = compute()
+        with _agg_cache_lock:
+            _agg_cache[key] = value
+    return value
+
+
+def cached_json_response(key, build):
+    """Serve build()'s result as JSON, computing it once per TTL; answers 304 on a matching ETag."""
+    with _agg_cache_lock:
+        cached = _agg_cache.get(key)
+
+    if cached is None:
+        body = app.json.dumps(build()).encode('utf-8')
+        cached = (hashlib.blake2b(body, digest_size=16).hexdigest(), body)
+        with _agg_cache_lock:
+            _agg_cache[key] = cached
+
+    etag, body = cached
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = AGG_CLIENT_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route('/')
 def index():
     """Página principal del dashboard."""
@@ -71,56 +206,31 @@ def index():
 @app.route('/api/dashboard/stats')
 def dashboard_stats():
     """API endpoint para estadísticas del dashboard."""
-    try:
-        # Obtener estadísticas básicas
-        total_query = "SELECT COUNT(*) as total FROM orders"
-        total_orders = db_connection.execute_query(total_query)[0]['total']
-        
-        # Estadísticas por estado
-        status_query = """
-        SELECT status, COUNT(*) as count 
-        FROM orders 
-        GROUP BY status
-        """
-        status_stats = db_connection.execute_query(status_query)
-        
-        # Estadísticas por categoría
-        category_query = """
-        SELECT category, COUNT(*) as count, SUM(subtotal_amount) as total_amount
-        FROM orders 
-        GROUP BY category
-        ORDER BY total_amount DESC
-        """
-        category_stats = db_connection.execute_query(category_query)
-        
-        # Estadísticas por año
-        year_query = """
-        SELECT EXTRACT(YEAR FROM order_date) as year, COUNT(*) as count, SUM(subtotal_amount) as total_amount
-        FROM orders 
-        GROUP BY EXTRACT(YEAR FROM order_date)
-        ORDER BY year
-        """
-        year_stats = db_connection.execute_query(year_query)
+    def build():
+        # Agregados precalculados (vistas materializadas)
+        stats = order_service.get_order_stats()
+        status_stats = stats['by_status']
+        category_stats = stats['by_category']
+        year_stats = stats['by_year']
+        total_orders = sum(item['order_count'] for item in status_stats)
         
         # Preparar datos para respuesta
-        response_data = {
+        return {
             'total_orders': int(total_orders),
-            'status_distribution': {item['status']: int(item['count']) for item in status_stats},
-            'category_distribution': {item['category']: int(item['count']) for item in category_stats},
-            'category_revenue': {item['category']: float(item['total_amount']) for item in category_stats},
+            'status_distribution': {item['status']: int(item['order_count']) for item in status_stats},
+            'category_distribution': {item['category']: int(item['order_count']) for item in category_stats},
+            'category_revenue': {item['category']: float(item['total_revenue']) for item in category_stats},
             'yearly_stats': [
                 {
                     'year': int(item['year']),
-                    'orders': int(item['count']),
-                    'revenue': float(item['total_amount'])
+                    'orders': int(item['order_count']),
+                    'revenue': float(item['total_revenue'])
                 } for item in year_stats
             ]
         }
-        
-        # Convertir tipos de pandas/numpy
-        response_data = convert_pandas_types(response_data)
-        
-        return jsonify(response_data)
+
+    try:
+        return cached_json_response('dashboard_stats', build)
     except Exception as e:
         logger.error(f"Error getting dashboard stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -129,11 +239,7 @@ def dashboard_stats():
 def data_quality_report():
     """API endpoint para reporte de calidad de datos."""
     try:
-        report = order_service.get_data_quality_report()
-        
-        # Convertir tipos de datos no serializables
-        report = convert_pandas_types(report)
-        return jsonify(report)
+        return cached_json_response('data_quality_report', order_service.get_data_quality_report)
     except Exception as e:
         logger.error(f"Error getting data quality report: {e}")
         return jsonify({'error': str(e)}), 500
@@ -149,8 +255,6 @@ def check_duplicates():
             'warnings': int(result.warnings),
             'summary': result.cleaning_summary
         }
-        # Convertir tipos de pandas/numpy
-        response_data = convert_pandas_types(response_data)
         return jsonify(response_data)
     except Exception as e:
         logger.error(f"Error checking duplicates: {e}")
@@ -168,8 +272,6 @@ def check_incomplete():
             'warnings': int(result.warnings),
             'summary': result.cleaning_summary
         }
-        # Convertir tipos de pandas/numpy
-        response_data = convert_pandas_types(response_data)
         return jsonify(response_data)
     except Exception as e:
         logger.error(f"Error checking incomplete records: {e}")
@@ -186,8 +288,6 @@ def validate_data():
             'warnings': int(result.warnings),
             'summary': result.cleaning_summary
         }
-        # Convertir tipos de pandas/numpy
-        response_data = convert_pandas_types(response_data)
         return jsonify(response_data)
     except Exception as e:
         logger.error(f"Error validating data: {e}")
@@ -199,68 +299,80 @@ def get_orders():
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
-        status = request.args.get('status', '')
-        category = request.args.get('category', '')
-        
-        # Construir query con filtros
-        where_conditions = []
-        params = {}
+        # Keyset: order_id de la última fila vista (evita OFFSET en páginas profundas)
+        after_id = request.args.get('after_id', type=int)
+        filters = [request.args.get(field, '') for field in ORDER_LIST_FILTERS]
+        shape = tuple(bool(value) for value in filters)
+        params = [value for value in filters if value]
         
-        if status:
-            where_conditions.append("status = %(status)s")
-            params['status'] = status
+        # Total por filtro, cacheado junto a los agregados (se invalida al escribir)
+        total = cached_value(
+            ('orders_count', *filters),
+            lambda: db_connection.query_prepared(*_bind(ORDER_COUNT_STATEMENTS[shape], params))[0]['total']
+        )
         
-        if category:
-            where_conditions.append("category = %(category)s")
-            params['category'] = category
-        
-        where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-        
-        # Query para obtener total
-        count_query = f"SELECT COUNT(*) as total FROM orders {where_clause}"
-        total = db_connection.execute_query(count_query, params)[0]['total']
-        
-        # Query para obtener datos paginados
-        offset = (page - 1) * per_page
-        data_query = f"""
-        SELECT * FROM orders 
-        {where_clause}
-        ORDER BY order_id DESC 
-        LIMIT %(limit)s OFFSET %(offset)s
-        """
-        params.update({'limit': per_page, 'offset': offset})
-        orders = db_connection.execute_query(data_query, params)
+        # Página: keyset si viene after_id, si no OFFSET
+        if after_id is not None:
+            page_params = params + [after_id, per_page]
+        else:
+            page_params = params + [per_page, (page - 1) * per_page]
+        orders = db_connection.query_prepared(
+            *_bind(ORDER_PAGE_STATEMENTS[shape, after_id is not None], page_params)
+        )
         
         return jsonify({
             'orders': orders,
             'total': total,
             'page': page,
             'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            'total_pages': (total + per_page - 1) // per_page,
+            'next_after_id': orders[-1]['order_id'] if len(orders) == per_page else None
         })
     except Exception as e:
         logger.error(f"Error getting orders: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Exportación CSV: las mismas columnas que devuelve la API
+ORDERS_CSV_COPY = f"COPY (SELECT {ORDER_COLUMNS} FROM orders ORDER BY order_id) TO STDOUT WITH CSV HEADER"
+CSV_CHUNK_SIZE = 64 * 1024
+
+def gzip_chunks(chunks):
+    """gzip a stream of bytes chunks as it is produced (one gzip member)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/api/export/csv')
 def export_csv():
     """API endpoint para exportar datos a CSV."""
     try:
-        # Obtener todos los datos
-        orders = order_service.get_all_orders()
-        df = pd.DataFrame(orders)
-        
-        # Crear archivo CSV temporal
         filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        filepath = os.path.join('exports', filename)
-        
-        # Crear directorio si no existe
-        os.makedirs('exports', exist_ok=True)
-        
-        # Guardar CSV
-        df.to_csv(filepath, index=False)
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
+
+        # PostgreSQL genera el CSV (COPY); nada de DataFrame ni archivo en exports/
+        buffer = db_connection.copy_out(ORDERS_CSV_COPY)
+
+        # gzip incremental si el cliente lo acepta (Flask-Compress no toca
+        # respuestas que ya traen Content-Encoding)
+        use_gzip = 'gzip' in request.accept_encodings
+
+        def generate():
+            with buffer:
+                while True:
+                    chunk = buffer.read(CSV_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        body = gzip_chunks(generate()) if use_gzip else generate()
+        response = app.response_class(body, mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
     except Exception as e:
         logger.error(f"Error exporting CSV: {e}")
         return jsonify({'error': str(e)}), 500
@@ -269,32 +381,49 @@ def export_csv():
 def powerbi_orders():
     """API endpoint específico para Power BI."""
     try:
-        # Obtener datos optimizados para Power BI
-        query = """
-        SELECT 
-            order_id,
-            status,
-            customer_name,
-            order_date,
-            quantity,
-            subtotal_amount,
-            tax_rate,
-            shipping_cost,
-            category,
-            subcategory,
-            EXTRACT(YEAR FROM order_date) as year,
-            EXTRACT(MONTH FROM order_date) as month,
-            EXTRACT(QUARTER FROM order_date) as quarter
-        FROM orders 
-        ORDER BY order_id DESC
-        """
-        orders = db_connection.execute_query(query)
-        
-        return jsonify({
-            'data': orders,
-            'last_updated': datetime.now().isoformat(),
-            'total_records': len(orders)
-        })
+        # Filas leídas de la vista orders_powerbi con un cursor de servidor y
+        # enviadas a medida que llegan (?format=ndjson: una orden por línea)
+        ndjson = (request.args.get('format') == 'ndjson'
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        last_updated = datetime.now().isoformat()
+        dumps = app.json.dumps
+
+        rows = order_service.iter_powerbi_orders()
+        # Primera fila aquí para que un error de conexión siga siendo un 500
+        first = next(rows, None)
+
+        def generate():
+            if first is None:
+                if not ndjson:
+                    yield f'{{"data":[],"last_updated":{dumps(last_updated)},"total_records":0}}'
+                return
+            if ndjson:
+                yield dumps(first) + '\n'
+                for row in rows:
+                    yield dumps(row) + '\n'
+                return
+            total = 1
+            yield '{"data":[' + dumps(first)
+            for row in rows:
+                total += 1
+                yield ',' + dumps(row)
+            yield f'],"last_updated":{dumps(last_updated)},"total_records":{total}}}'
+
+        # gzip por trozos (COMPRESS_STREAMS está desactivado)
+        use_gzip = 'gzip' in request.accept_encodings
+        if use_gzip:
+            body = gzip_chunks(chunk.encode('utf-8') for chunk in generate())
+        else:
+            body = generate()
+
+        mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        response = app.response_class(body, mimetype=mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # Devuelve la conexión al pool aunque el cliente corte a mitad
+        response.call_on_close(rows.close)
+        return response
     except Exception as e:
         logger.error(f"Error getting Power BI data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -302,61 +431,78 @@ def powerbi_orders():
 @app.route('/api/powerbi/summary')
 def powerbi_summary():
     """API endpoint para resumen de datos para Power BI."""
-    try:
-        # Resumen por categoría
-        category_summary = db_connection.execute_query("""
-            SELECT 
-                category,
-                COUNT(*) as order_count,
-                SUM(subtotal_amount) as total_revenue,
-                AVG(subtotal_amount) as avg_order_value,
-                SUM(quantity) as total_quantity
-            FROM orders 
-            GROUP BY category
-            ORDER BY total_revenue DESC
-        """)
-        
-        # Resumen por año
-        yearly_summary = db_connection.execute_query("""
-            SELECT 
-                EXTRACT(YEAR FROM order_date) as year,
-                COUNT(*) as order_count,
-                SUM(subtotal_amount) as total_revenue,
-                AVG(subtotal_amount) as avg_order_value
-            FROM orders 
-            GROUP BY EXTRACT(YEAR FROM order_date)
-            ORDER BY year
-        """)
-        
-        # Resumen por estado
-        status_summary = db_connection.execute_query("""
-            SELECT 
-                status,
-                COUNT(*) as order_count,
-                SUM(subtotal_amount) as total_revenue
-            FROM orders 
-            GROUP BY status
-            ORDER BY order_count DESC
-        """)
-        
-        return jsonify({
-            'category_summary': category_summary,
-            'yearly_summary': yearly_summary,
-            'status_summary': status_summary,
+    def build():
+        # Resúmenes precalculados (vistas materializadas)
+        stats = order_service.get_order_stats()
+        return {
+            'category_summary': stats['by_category'],
+            'yearly_summary': stats['by_year'],
+            'status_summary': stats['by_status'],
             'last_updated': datetime.now().isoformat()
-        })
+        }
+
+    try:
+        return cached_json_response('powerbi_summary', build)
     except Exception as e:
         logger.error(f"Error getting Power BI summary: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Exportación de órdenes de la tienda (datos personales): solo con el token
+# de administración; sin ADMIN_API_TOKEN la ruta queda desactivada
+_ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '').encode()
+CUSTOMER_ORDERS_EXPORT_MAX = 10000
+
+def admin_token_valid(provided_token):
+    """Constant-time check of the X-Admin-Token header (False while no token is configured)."""
+    return bool(_ADMIN_API_TOKEN) and hmac.compare_digest(
+        _ADMIN_API_TOKEN, (provided_token or '').encode()
+    )
+
+@app.route('/api/store/customer-orders')
+def export_customer_orders():
+    """API endpoint para exportar órdenes de la tienda como JSON lines (?limit=&offset=)."""
+    if not admin_token_valid(request.headers.get('X-Admin-Token')):
+        logger.warning("Unauthorized customer orders export attempt")
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if limit is None or not 1 <= limit <= CUSTOMER_ORDERS_EXPORT_MAX or offset < 0:
+        return jsonify({
+            'error': f'limit (1-{CUSTOMER_ORDERS_EXPORT_MAX}) es requerido y offset debe ser >= 0'
+        }), 400
+
+    try:
+        orders = StoreService().iter_customer_orders(limit, offset)
+        # Primera fila aquí para que un error de conexión siga siendo un 500
+        first = next(orders, None)
+    except Exception as e:
+        logger.error(f"Error exporting customer orders: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    dumps = app.json.dumps
+
+    def generate():
+        if first is None:
+            return
+        yield dumps(first) + '\n'
+        for order in orders:
+            yield dumps(order) + '\n'
+
+    # stream_with_context cierra el generador (y libera la conexión) si el cliente se va
+    response = app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(orders.close)
+    return response
+
 # ===== GESTIÓN DE ÓRDENES =====
 
 @app.route('/api/orders/<int:order_id>')
 def get_order(order_id):
     """API endpoint para obtener una orden específica."""
     try:
-        query = "SELECT * FROM orders WHERE order_id = %(order_id)s"
-        orders = db_connection.execute_query(query, {"order_id": order_id})
+        orders = db_connection.query_prepared(
+            "order_by_id", ORDER_BY_ID_QUERY, (order_id,), "bigint"
+        )
         
         if not orders:
             return jsonify({'error': 'Orden no encontrada'}), 404
@@ -373,24 +519,19 @@ def update_order(order_id):
         data = request.get_json()
         
         # Validar campos requeridos
-        required_fields = ['status', 'customer_name', 'order_date', 'quantity', 
-                          'subtotal_amount', 'tax_rate', 'shipping_cost', 'category', 'subcategory']
-        
-        for field in required_fields:
+        for field in ORDER_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Campo requerido: {field}'}), 400
         
-        # Construir query de actualización
-        set_clauses = []
         params = {"order_id": order_id}
+        params.update((field, data[field]) for field in ORDER_REQUIRED_FIELDS)
         
-        for field in required_fields:
-            set_clauses.append(f"{field} = %({field})s")
-            params[field] = data[field]
-        
-        query = f"UPDATE orders SET {', '.join(set_clauses)} WHERE order_id = %(order_id)s"
-        
-        affected_rows = db_connection.execute_update(query, params)
+        affected_rows = db_connection.update_prepared(
+            "order_update",
+            UPDATE_ORDER_QUERY,
+            (order_id, *(data[field] for field in ORDER_REQUIRED_FIELDS)),
+            UPDATE_ORDER_ARG_TYPES
+        )
         
         if affected_rows > 0:
             logger.info(f"Order {order_id} updated successfully")
@@ -416,28 +557,12 @@ def create_order():
         data = request.get_json()
         
         # Validar campos requeridos
-        required_fields = ['status', 'customer_name', 'order_date', 'quantity', 
-                          'subtotal_amount', 'tax_rate', 'shipping_cost', 'category', 'subcategory']
-        
-        for field in required_fields:
+        for field in ORDER_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Campo requerido: {field}'}), 400
         
-        # Obtener el siguiente order_id
-        max_id_query = "SELECT MAX(order_id) as max_id FROM orders"
-        max_id_result = db_connection.execute_query(max_id_query)
-        next_id = (max_id_result[0]['max_id'] or 0) + 1
-        
-        # Insertar nueva orden
-        insert_query = """
-        INSERT INTO orders (order_id, status, customer_name, order_date, quantity, 
-                           subtotal_amount, tax_rate, shipping_cost, category, subcategory)
-        VALUES (%(order_id)s, %(status)s, %(customer_name)s, %(order_date)s, %(quantity)s,
-                %(subtotal_amount)s, %(tax_rate)s, %(shipping_cost)s, %(category)s, %(subcategory)s)
-        """
-        
+        # Insertar nueva orden (order_id lo asigna la secuencia)
         params = {
-            'order_id': next_id,
             'status': data['status'],
             'customer_name': data['customer_name'],
             'order_date': data['order_date'],
@@ -449,10 +574,10 @@ def create_order():
             'subcategory': data['subcategory']
         }
         
-        affected_rows = db_connection.execute_update(insert_query, params)
+        next_id = order_service.create_order(params)
+        params['order_id'] = next_id
         
-        if affected_rows > 0:
-            logger.info(f"New order {next_id} created successfully")
+        if next_id:
             # Broadcast the change to all connected clients
             broadcast_order_change(next_id, 'created', params)
             broadcast_notification(f'Nueva orden #{next_id} creada', 'success')
@@ -472,16 +597,10 @@ def create_order():
 def delete_order(order_id):
     """API endpoint para eliminar una orden."""
     try:
-        # Verificar que la orden existe
-        check_query = "SELECT order_id FROM orders WHERE order_id = %(order_id)s"
-        existing = db_connection.execute_query(check_query, {"order_id": order_id})
-        
-        if not existing:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        # Eliminar la orden
-        delete_query = "DELETE FROM orders WHERE order_id = %(order_id)s"
-        affected_rows = db_connection.execute_update(delete_query, {"order_id": order_id})
+        # Eliminar la orden (0 filas afectadas = no existe)
+        affected_rows = db_connection.update_prepared(
+            "order_delete", DELETE_ORDER_QUERY, (order_id,), "bigint"
+        )
         
         if affected_rows > 0:
             logger.info(f"Order {order_id} deleted successfully")
@@ -494,7 +613,7 @@ def delete_order(order_id):
 
             return jsonify({'message': 'Orden eliminada exitosamente', 'order_id': order_id})
         else:
-            return jsonify({'error': 'Error al eliminar la orden'}), 500
+            return jsonify({'error': 'Orden no encontrada'}), 404
             
     except Exception as e:
         logger.error(f"Error deleting order {order_id}: {e}")
@@ -509,30 +628,60 @@ def update_order_status(order_id):
         if 'status' not in data:
             return jsonify({'error': 'Campo status es requerido'}), 400
         
-        # Verificar que la orden existe
-        check_query = "SELECT order_id FROM orders WHERE order_id = %(order_id)s"
-        existing = db_connection.execute_query(check_query, {"order_id": order_id})
-        
-        if not existing:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        # Actualizar solo el estado
-        update_query = "UPDATE orders SET status = %(status)s WHERE order_id = %(order_id)s"
-        affected_rows = db_connection.execute_update(update_query, {
-            "order_id": order_id,
-            "status": data['status']
-        })
+        # Actualizar solo el estado (0 filas afectadas = no existe)
+        affected_rows = db_connection.update_prepared(
+            "order_update_status", UPDATE_ORDER_STATUS_QUERY,
+            (order_id, data['status']), "bigint, text"
+        )
         
         if affected_rows > 0:
             logger.info(f"Order {order_id} status updated to {data['status']}")
+            enqueue_broadcast(refresh_order_stats)
             return jsonify({'message': 'Estado actualizado exitosamente', 'order_id': order_id, 'new_status': data['status']})
         else:
-            return jsonify({'error': 'Error al actualizar el estado'}), 500
+            return jsonify({'error': 'Orden no encontrada'}), 404
             
     except Exception as e:
         logger.error(f"Error updating order {order_id} status: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/orders/bulk', methods=['POST'])
+def create_orders_bulk():
+    """API endpoint para crear varias órdenes (lista o {"orders": [...]}) en un solo INSERT."""
+    try:
+        data = request.get_json()
+        orders = data.get('orders') if isinstance(data, dict) else data
+        
+        if not isinstance(orders, list) or len(orders) == 0:
+            return jsonify({'error': 'orders debe ser una lista no vacía'}), 400
+        
+        for index, order in enumerate(orders):
+            if not isinstance(order, dict):
+                return jsonify({'error': f'Orden {index}: debe ser un objeto'}), 400
+            for field in ORDER_REQUIRED_FIELDS:
+                if field not in order:
+                    return jsonify({'error': f'Orden {index}: campo requerido: {field}'}), 400
+        
+        rows = [{field: order[field] for field in ORDER_REQUIRED_FIELDS} for order in orders]
+        # Cada fila devuelta trae su propio order_id (RETURNING no garantiza el orden)
+        created = order_service.create_orders(rows)
+        order_ids = [order['order_id'] for order in created]
+        
+        # Un solo broadcast y un solo webhook para todo el lote
+        broadcast_order_change(order_ids, 'bulk_created', {'created_count': len(order_ids)})
+        broadcast_notification(f'{len(order_ids)} órdenes creadas', 'success')
+        n8n_webhook.send_orders_created(created)
+        
+        return jsonify({
+            'message': 'Órdenes creadas exitosamente',
+            'created_count': len(order_ids),
+            'order_ids': order_ids
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Error in bulk order creation: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/orders/bulk-status', methods=['PATCH'])
 def bulk_update_status():
     """API endpoint para actualizar el estado de múltiples órdenes."""
@@ -548,14 +697,20 @@ def bulk_update_status():
         if not isinstance(order_ids, list) or len(order_ids) == 0:
             return jsonify({'error': 'order_ids debe ser una lista no vacía'}), 400
         
-        # Construir query para múltiples IDs
-        placeholders = ','.join(['%s'] * len(order_ids))
-        update_query = f"UPDATE orders SET status = %s WHERE order_id IN ({placeholders})"
+        # Un solo UPDATE para todos los IDs
+        updated = order_service.bulk_update_status(order_ids, new_status)
+        affected_rows = len(updated)
         
-        params = [new_status] + order_ids
-        affected_rows = db_connection.execute_update(update_query, params)
+        # Un solo webhook para todo el lote
+        if updated:
+            enqueue_broadcast(refresh_order_stats)
+            n8n_webhook.send_bulk_status_update(
+                [row['order_id'] for row in updated],
+                new_status,
+                affected_rows,
+                old_statuses={row['order_id']: row['old_status'] for row in updated}
+            )
         
-        logger.info(f"Bulk status update: {affected_rows} orders updated to {new_status}")
         return jsonify({
             'message': f'Estados actualizados exitosamente',
             'updated_count': affected_rows,
@@ -568,6 +723,13 @@ def bulk_update_status():
 
 # ===== N8N WEBHOOK ENDPOINTS =====
 
+# Secreto compartido con n8n, codificado una vez (vacío = sin verificación)
+_N8N_SECRET = (N8N_WEBHOOK_SECRET or '').encode()
+
+def n8n_secret_valid(provided_secret):
+    """Constant-time check of the secret sent by n8n."""
+    return hmac.compare_digest(_N8N_SECRET, (provided_secret or '').encode())
+
 @app.route('/api/n8n/webhook', methods=['POST'])
 def n8n_webhook_handler():
     """
@@ -581,14 +743,12 @@ def n8n_webhook_handler():
     }
     """
     try:
-        from src.config.settings import n8n_settings
-
         data = request.get_json()
 
         # Verify secret if configured
-        if n8n_settings.secret:
+        if _N8N_SECRET:
             provided_secret = data.get('secret') or request.headers.get('X-N8N-Secret')
-            if provided_secret != n8n_settings.secret:
+            if not n8n_secret_valid(provided_secret):
                 logger.warning("Unauthorized n8n webhook attempt")
                 return jsonify({'error': 'Unauthorized'}), 401
 
@@ -627,20 +787,7 @@ def n8n_webhook_handler():
 def handle_n8n_create_order(data):
     """Handle order creation from n8n."""
     try:
-        # Get next ID
-        max_id_query = "SELECT MAX(order_id) as max_id FROM orders"
-        max_id_result = db_connection.execute_query(max_id_query)
-        next_id = (max_id_result[0]['max_id'] or 0) + 1
-
-        insert_query = """
-        INSERT INTO orders (order_id, status, customer_name, order_date, quantity,
-                           subtotal_amount, tax_rate, shipping_cost, category, subcategory)
-        VALUES (%(order_id)s, %(status)s, %(customer_name)s, %(order_date)s, %(quantity)s,
-                %(subtotal_amount)s, %(tax_rate)s, %(shipping_cost)s, %(category)s, %(subcategory)s)
-        """
-
         params = {
-            'order_id': next_id,
             'status': data.get('status', 'pending'),
             'customer_name': data['customer_name'],
             'order_date': data.get('order_date', datetime.now().strftime('%Y-%m-%d')),
@@ -652,9 +799,10 @@ def handle_n8n_create_order(data):
             'subcategory': data['subcategory']
         }
 
-        affected_rows = db_connection.execute_update(insert_query, params)
+        next_id = order_service.create_order(params)
+        params['order_id'] = next_id
 
-        if affected_rows > 0:
+        if next_id:
             broadcast_order_change(next_id, 'created', params)
             broadcast_notification(f'Orden #{next_id} creada desde n8n', 'success')
             return jsonify({
@@ -717,8 +865,9 @@ def handle_n8n_delete_order(data):
         if not order_id:
             return jsonify({'error': 'order_id is required'}), 400
 
-        delete_query = "DELETE FROM orders WHERE order_id = %(order_id)s"
-        affected_rows = db_connection.execute_update(delete_query, {"order_id": order_id})
+        affected_rows = db_connection.update_prepared(
+            "order_delete", DELETE_ORDER_QUERY, (order_id,), "bigint"
+        )
 
         if affected_rows > 0:
             broadcast_order_change(order_id, 'deleted')
@@ -743,8 +892,9 @@ def handle_n8n_get_order(data):
         if not order_id:
             return jsonify({'error': 'order_id is required'}), 400
 
-        query = "SELECT * FROM orders WHERE order_id = %(order_id)s"
-        orders = db_connection.execute_query(query, {"order_id": order_id})
+        orders = db_connection.query_prepared(
+            "order_by_id", ORDER_BY_ID_QUERY, (order_id,), "bigint"
+        )
 
         if orders:
             return jsonify({
@@ -761,20 +911,19 @@ def handle_n8n_get_order(data):
 
 def handle_n8n_get_stats():
     """Handle stats retrieval from n8n."""
-    try:
-        total_query = "SELECT COUNT(*) as total FROM orders"
-        total_orders = db_connection.execute_query(total_query)[0]['total']
-
-        status_query = "SELECT status, COUNT(*) as count FROM orders GROUP BY status"
-        status_stats = db_connection.execute_query(status_query)
-
-        return jsonify({
+    def build():
+        status_stats = order_service.get_order_stats()['by_status']
+        total_orders = sum(item['order_count'] for item in status_stats)
+        return {
             'success': True,
             'stats': {
                 'total_orders': int(total_orders),
-                'by_status': {item['status']: int(item['count']) for item in status_stats}
+                'by_status': {item['status']: int(item['order_count']) for item in status_stats}
             }
-        })
+        }
+
+    try:
+        return cached_json_response('n8n_stats', build)
 
     except Exception as e:
         logger.error(f"Error getting stats from n8n: {e}")
@@ -784,25 +933,14 @@ def handle_n8n_get_stats():
 def handle_n8n_search_orders(data):
     """Handle order search from n8n."""
     try:
-        where_conditions = []
-        params = {}
-
-        if 'status' in data:
-            where_conditions.append("status = %(status)s")
-            params['status'] = data['status']
-
-        if 'customer_name' in data:
-            where_conditions.append("customer_name ILIKE %(customer_name)s")
-            params['customer_name'] = f"%{data['customer_name']}%"
-
-        if 'category' in data:
-            where_conditions.append("category = %(category)s")
-            params['category'] = data['category']
-
-        where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        shape = tuple(field in data for field, _ in ORDER_SEARCH_FILTERS)
+        params = [
+            f"%{data[field]}%" if field == 'customer_name' else data[field]
+            for field, _ in ORDER_SEARCH_FILTERS if field in data
+        ]
 
-        query = f"SELECT * FROM orders {where_clause} ORDER BY order_id DESC LIMIT 50"
-        orders = db_connection.execute_query(query, params)
+        # Una sentencia preparada por combinación de filtros (8 como máximo)
+        orders = db_connection.query_prepared(*_bind(ORDER_SEARCH_STATEMENTS[shape], params))
 
         return jsonify({
             'success': True,
@@ -832,6 +970,7 @@ def test_n8n_connection():
 def handle_connect():
     """Handle client connection."""
     logger.info(f"Client connected: {request.sid}")
+    join_room(DASHBOARD_ROOM)
     emit('connection_response', {'data': 'Connected to NextFlow'})
 
 @socketio.on('disconnect')
@@ -843,92 +982,319 @@ def handle_disconnect():
 def handle_dashboard_update_request():
     """Send dashboard stats to client."""
     try:
-        # Obtener estadísticas básicas
-        total_query = "SELECT COUNT(*) as total FROM orders"
-        total_orders = db_connection.execute_query(total_query)[0]['total']
-
-        # Estadísticas por estado
-        status_query = """
-        SELECT status, COUNT(*) as count
-        FROM orders
-        GROUP BY status
-        """
-        status_stats = db_connection.execute_query(status_query)
-
-        # Estadísticas por categoría
-        category_query = """
-        SELECT category, COUNT(*) as count, SUM(subtotal_amount) as total_amount
-        FROM orders
-        GROUP BY category
-        ORDER BY total_amount DESC
-        """
-        category_stats = db_connection.execute_query(category_query)
-
-        response_data = {
-            'total_orders': int(total_orders),
-            'status_distribution': {item['status']: int(item['count']) for item in status_stats},
-            'category_distribution': {item['category']: int(item['count']) for item in category_stats},
-            'category_revenue': {item['category']: float(item['total_amount']) for item in category_stats}
-        }
-
-        response_data = convert_pandas_types(response_data)
-        emit('dashboard_update', response_data)
+        emit('dashboard_update', get_dashboard_update())
 
     except Exception as e:
         logger.error(f"Error sending dashboard update: {e}")
         emit('error', {'message': str(e)})
 
-def broadcast_order_change(order_id, action, data=None):
-    """Broadcast order changes to all connected clients."""
+def build_dashboard_update():
+    """Dashboard summary pushed over the socket, from the pre-aggregated stats."""
+    stats = order_service.get_order_stats()
+
+    total_orders = 0
+    status_distribution = {}
+    for item in stats['by_status']:
+        count = int(item['order_count'])
+        status_distribution[item['status']] = count
+        total_orders += count
+
+    # Una sola pasada para los dos diccionarios por categoría
+    category_distribution, category_revenue = {}, {}
+    for item in stats['by_category']:
+        category = item['category']
+        category_distribution[category] = int(item['order_count'])
+        category_revenue[category] = float(item['total_revenue'])
+
+    return {
+        'total_orders': total_orders,
+        'status_distribution': status_distribution,
+        'category_distribution': category_distribution,
+        'category_revenue': category_revenue
+    }
+
+def get_dashboard_update():
+    """
+    Dashboard payload shared by every client: from Redis when configured
+    (all processes), otherwise from the in-process aggregate cache.
+    """
+    if redis_client is not None:
+        try:
+            cached = redis_client.get(DASHBOARD_CACHE_KEY)
+            if cached is not None:
+                return app.json.loads(cached)
+        except redis.RedisError as e:
+            logger.warning(f"Redis dashboard cache unavailable: {e}")
+
+    data = cached_value('dashboard_update', build_dashboard_update)
+
+    if redis_client is not None:
+        try:
+            redis_client.setex(DASHBOARD_CACHE_KEY, DASHBOARD_CACHE_TTL, app.json.dumps(data))
+        except redis.RedisError as e:
+            logger.warning(f"Redis dashboard cache unavailable: {e}")
+    return data
+
+def clear_order_caches():
+    """Drop the cached aggregates (in-process and Redis) after orders change."""
+    with _agg_cache_lock:
+        _agg_cache.clear()
+    if redis_client is not None:
+        try:
+            redis_client.delete(DASHBOARD_CACHE_KEY)
+        except redis.RedisError as e:
+            logger.warning(f"Redis dashboard cache unavailable: {e}")
+
+def _refresh_and_push_stats():
+    """Refresh the aggregate views and push the new dashboard summary."""
+    global _stats_refresh_scheduled
+    with _stats_refresh_lock:
+        _stats_refresh_scheduled = False
     try:
-        socketio.emit('order_changed', {
-            'order_id': order_id,
-            'action': action,  # 'created', 'updated', 'deleted'
-            'data': data,
-            'timestamp': datetime.now().isoformat()
-        })
-        logger.info(f"Broadcasted order change: {action} for order {order_id}")
+        order_service.refresh_stats_views()
+    except Exception as e:
+        logger.error(f"Error refreshing order stats: {e}")
+        return
+    clear_order_caches()
+    try:
+        # Se calcula una vez y queda en caché para los request_dashboard_update
+        broadcast_batched('dashboard_update', get_dashboard_update(), room=DASHBOARD_ROOM)
+    except Exception as e:
+        logger.error(f"Error pushing dashboard update: {e}")
+
+def _delayed_stats_refresh(delay):
+    socketio.sleep(delay)
+    enqueue_broadcast(_refresh_and_push_stats)
+
+# Cada REFRESH de las vistas recorre orders entero: tras una escritura se
+# refrescan como mucho una vez por STATS_MAX_AGE_SECONDS; las escrituras que
+# llegan antes dejan programado un único refresco al final del intervalo
+_stats_refresh_lock = threading.Lock()
+_stats_refresh_scheduled = False
+
+def refresh_order_stats():
+    """
+    After a write: clear the caches and refresh the aggregate views (now, or
+    once at the end of the current refresh interval), then push the new
+    dashboard summary to the dashboard room.
+    """
+    global _stats_refresh_scheduled
+    clear_order_caches()
+    with _stats_refresh_lock:
+        if _stats_refresh_scheduled:
+            return
+        _stats_refresh_scheduled = True
+    delay = order_service.stats_refresh_due_in()
+    if delay > 0:
+        socketio.start_background_task(_delayed_stats_refresh, delay)
+    else:
+        _refresh_and_push_stats()
+
+# Difusiones (refresco de agregados + Socket.IO) en una tarea de fondo para que
+# la respuesta HTTP no espere al REFRESH ni al fan-out a los clientes
+_broadcast_queue = None
+_broadcast_lock = threading.Lock()
+
+def _broadcast_worker():
+    """Run queued broadcast calls one at a time."""
+    while True:
+        func, args = _broadcast_queue.get()
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Error in background broadcast {func.__name__}: {e}")
+
+def enqueue_broadcast(func, *args):
+    """Queue func(*args) for the broadcast task, starting it on first use."""
+    global _broadcast_queue
+    if _broadcast_queue is None:
+        with _broadcast_lock:
+            if _broadcast_queue is None:
+                # Cola del modo async de Socket.IO (eventlet/threading)
+                _broadcast_queue = socketio.server.eio.create_queue()
+                socketio.start_background_task(_broadcast_worker)
+    _broadcast_queue.put((func, args))
+
+# Marca de tiempo de los mensajes de Socket.IO: se formatea como mucho una vez
+# cada CLOCK_RESOLUTION_S (basta para metadatos de broadcast); las respuestas
+# HTTP siguen usando la hora exacta
+CLOCK_RESOLUTION_S = 0.1
+_clock = (0.0, '')
+
+def broadcast_timestamp():
+    """ISO timestamp for socket payloads, reformatted at most every CLOCK_RESOLUTION_S."""
+    global _clock
+    now = time.monotonic()
+    expires, stamp = _clock
+    if now >= expires:
+        stamp = datetime.now().isoformat()
+        _clock = (now + CLOCK_RESOLUTION_S, stamp)
+    return stamp
+
+# Sala a la que se unen los clientes del dashboard al conectar; los broadcasts
+# van solo a ella (un solo encode por lote, sin clientes ajenos)
+DASHBOARD_ROOM = 'dashboard'
+
+# Broadcasts a muchos clientes: por lotes, cediendo el hub entre lote y lote
+BROADCAST_BATCH_SIZE = 50
+
+def broadcast_batched(event, payload, room=None, namespace='/'):
+    """Emit to every client in ``room`` (all clients if None) in chunks of BROADCAST_BATCH_SIZE."""
+    manager = socketio.server.manager
+    if isinstance(manager, PubSubManager):
+        # Con cola de mensajes los clientes de otros procesos no están aquí
+        socketio.emit(event, payload, namespace=namespace, to=room)
+        return
+    sids = [sid for sid, _ in manager.get_participants(namespace, room)]
+    if len(sids) <= BROADCAST_BATCH_SIZE:
+        socketio.emit(event, payload, namespace=namespace, to=room)
+        return
+    for start in range(0, len(sids), BROADCAST_BATCH_SIZE):
+        # El paquete se codifica una vez por lote
+        socketio.emit(event, payload, namespace=namespace,
+                      to=sids[start:start + BROADCAST_BATCH_SIZE])
+        socketio.sleep(0)
+
+def dashboard_client_connected(sid, namespace='/'):
+    """True if ``sid`` is a socket connected to this process and joined to DASHBOARD_ROOM."""
+    manager = socketio.server.manager
+    if isinstance(manager, PubSubManager):
+        # Los participantes de otros procesos no se ven desde aquí
+        return False
+    return any(participant == sid for participant, _ in
+               manager.get_participants(namespace, DASHBOARD_ROOM))
+
+# Los logs por mensaje van a DEBUG con argumentos diferidos: loguru no formatea
+# el mensaje si ningún handler acepta el nivel
+def _emit_order_changes():
+    """Send the changes collected during the coalescing window (one stats refresh)."""
+    global _order_changes_scheduled
+    with _order_changes_lock:
+        changes = list(_pending_order_changes.values())
+        _pending_order_changes.clear()
+        _order_changes_scheduled = False
+    if not changes:
+        return
+
+    refresh_order_stats()
+    try:
+        if len(changes) == 1:
+            broadcast_batched('order_changed', changes[0], room=DASHBOARD_ROOM)
+        else:
+            broadcast_batched('order_changed_batch', changes, room=DASHBOARD_ROOM)
+        logger.debug("Broadcasted {} order change(s)", len(changes))
     except Exception as e:
         logger.error(f"Error broadcasting order change: {e}")
 
-def broadcast_notification(message, type='info'):
-    """Broadcast notification to all connected clients."""
+def _schedule_order_changes():
+    """Wait out the coalescing window, then hand the flush to the broadcast task."""
+    socketio.sleep(ORDER_CHANGE_COALESCE_S)
+    enqueue_broadcast(_emit_order_changes)
+
+def _emit_notification(message, type, timestamp):
     try:
-        socketio.emit('notification', {
+        broadcast_batched('notification', {
             'message': message,
             'type': type,  # 'info', 'success', 'warning', 'error'
-            'timestamp': datetime.now().isoformat()
-        })
-        logger.info(f"Broadcasted notification: {message}")
+            'timestamp': timestamp
+        }, room=DASHBOARD_ROOM)
+        logger.debug("Broadcasted notification: {}", message)
     except Exception as e:
         logger.error(f"Error broadcasting notification: {e}")
 
+# Ráfagas de cambios (p. ej. importaciones) se agrupan durante
+# ORDER_CHANGE_COALESCE_S: un solo refresco de agregados y un solo
+# order_changed_batch; para el mismo order_id gana el último cambio
+ORDER_CHANGE_COALESCE_S = 0.05
+_pending_order_changes = {}
+_order_changes_lock = threading.Lock()
+_order_changes_scheduled = False
+
+def broadcast_order_change(order_id, action, data=None):
+    """Broadcast order changes to all connected clients (in the background, coalesced)."""
+    global _order_changes_scheduled
+    change = {
+        'order_id': order_id,
+        'action': action,  # 'created', 'updated', 'deleted', 'bulk_created'
+        'data': data,
+        'timestamp': broadcast_timestamp()
+    }
+    key = tuple(order_id) if isinstance(order_id, list) else order_id
+    with _order_changes_lock:
+        _pending_order_changes[key] = change
+        if _order_changes_scheduled:
+            return
+        _order_changes_scheduled = True
+    socketio.start_background_task(_schedule_order_changes)
+
+def broadcast_notification(message, type='info'):
+    """Broadcast notification to all connected clients (in the background)."""
+    enqueue_broadcast(_emit_notification, message, type, broadcast_timestamp())
+
 # ============================================================================
 # CHATBOT ENDPOINTS
 # ============================================================================
 
+# Respuesta del GET de prueba: la config de n8n no cambia en runtime, así que el
+# cuerpo se serializa una sola vez (se crea un Response nuevo por request
+# para que los hooks de CORS/sesión no muten uno compartido)
+_CHATBOT_FALLBACK = 'El bot no está disponible. Verifica:\n1. Que tu workflow de n8n esté ACTIVO\n2. Que el webhook responda con JSON: {"message": "tu respuesta"}'
+_CHATBOT_WS_FALLBACK = 'El bot no está disponible en este momento. Verifica que tu workflow de n8n esté activo y configurado correctamente.'
+
+# Cuerpos JSON de error/fallback serializados al importar; en el fallback
+# solo se añade el timestamp (última clave, igual que con jsonify)
+_CHATBOT_FALLBACK_HEAD = app.json.dumps({
+    'success': False,
+    'status': 'fallback',
+    'message': _CHATBOT_FALLBACK
+})[:-1].encode('utf-8')
+
+_JSON_ERRORS = {
+    message: app.json.dumps({'error': message}).encode('utf-8')
+    for message in ('Message is required', 'Response message is required', 'Payload too large')
+}
+
+def json_error(message, status):
+    """Precompiled {"error": message} response for the fixed chatbot errors."""
+    return app.response_class(_JSON_ERRORS[message], status=status, mimetype='application/json')
+
+def chatbot_fallback_response():
+    """503 answer used when n8n is disabled or did not reply."""
+    body = b''.join((
+        _CHATBOT_FALLBACK_HEAD, b',"timestamp":"', datetime.now().isoformat().encode('ascii'), b'"}'
+    ))
+    return app.response_class(body, status=503, mimetype='application/json')
+
+_CHATBOT_GET_BODY = app.json.dumps({
+    'status': 'ok',
+    'message': 'Chatbot API is working. Send POST with {"message": "your message"}',
+    'webhook_enabled': N8N_WEBHOOK_ENABLED,
+    'webhook_url': N8N_WEBHOOK_URL
+}).encode('utf-8')
+
 @app.route('/api/chatbot/message', methods=['POST', 'GET'])
 def chatbot_message():
     """Receive message from user and send to n8n for processing."""
     try:
         # Handle GET for testing
         if request.method == 'GET':
-            return jsonify({
-                'status': 'ok',
-                'message': 'Chatbot API is working. Send POST with {"message": "your message"}',
-                'webhook_enabled': n8n_settings.enabled,
-                'webhook_url': n8n_settings.webhook_url
-            }), 200
+            return app.response_class(_CHATBOT_GET_BODY, mimetype='application/json')
 
         data = request.get_json()
         message = data.get('message', '').strip()
 
         if not message:
-            return jsonify({'error': 'Message is required'}), 400
+            return json_error('Message is required', 400)
+
+        # Con n8n desactivado no hay nada que esperar
+        if not N8N_WEBHOOK_ENABLED:
+            return chatbot_fallback_response()
 
         logger.info(f"📨 Sending message to n8n: {message}")
 
         # Send message to n8n for processing
+        # Sin sid: el cuerpo HTTP no prueba que el socket sea de quien llama,
+        # así que las respuestas asíncronas de esta ruta van a todo el dashboard
         n8n_response = n8n_webhook.send_event('chatbot.message', {
             'message': message,
             'user': 'web_user',
@@ -951,12 +1317,7 @@ def chatbot_message():
         else:
             # If n8n is not available, provide a basic response
             logger.warning("❌ n8n not available or no response")
-            return jsonify({
-                'success': False,
-                'status': 'fallback',
-                'message': 'El bot no está disponible. Verifica:\n1. Que tu workflow de n8n esté ACTIVO\n2. Que el webhook responda con JSON: {"message": "tu respuesta"}',
-                'timestamp': datetime.now().isoformat()
-            }), 503
+            return chatbot_fallback_response()
 
     except Exception as e:
         logger.error(f"❌ Error processing chatbot message: {e}")
@@ -966,33 +1327,47 @@ def chatbot_message():
             'message': f'Error: {str(e)}'
         }), 500
 
+# Límite del cuerpo de /api/chatbot/response; se rechaza antes de parsear
+CHATBOT_RESPONSE_MAX_BYTES = 32 * 1024
+
 @app.route('/api/chatbot/response', methods=['POST'])
 def chatbot_response():
     """Receive response from n8n and broadcast to user via WebSocket."""
     try:
+        if (request.content_length or 0) > CHATBOT_RESPONSE_MAX_BYTES:
+            return json_error('Payload too large', 413)
+
         # Validate n8n secret
         secret = request.headers.get('X-N8N-Secret', '')
-        from src.config.settings import n8n_settings
 
-        if n8n_settings.secret and secret != n8n_settings.secret:
+        if _N8N_SECRET and not n8n_secret_valid(secret):
             logger.warning("Invalid n8n secret in chatbot response")
             return jsonify({'error': 'Invalid or missing secret'}), 401
 
-        data = request.get_json()
+        # Un solo parseo; cuerpo vacío o no-JSON cae en el 400 de abajo
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
         response_message = data.get('response', '')
         user = data.get('user', 'bot')
 
         if not response_message:
-            return jsonify({'error': 'Response message is required'}), 400
+            return json_error('Response message is required', 400)
 
-        # Broadcast response to user via WebSocket
-        socketio.emit('chatbot_response', {
+        payload = {
             'message': response_message,
             'user': user,
-            'timestamp': datetime.now().isoformat()
-        })
+            'timestamp': broadcast_timestamp()
+        }
+        sid = data.get('sid')
+        if sid and dashboard_client_connected(sid):
+            # Solo al cliente que hizo la pregunta (sid enviado en chatbot.message)
+            socketio.emit('chatbot_response', payload, to=sid)
+        else:
+            # Workflows que no devuelven el sid (o sid ajeno al dashboard): a todos, como antes
+            broadcast_batched('chatbot_response', payload, room=DASHBOARD_ROOM)
 
-        logger.info(f"Chatbot response broadcasted: {response_message}")
+        logger.debug("Chatbot response broadcasted: {}", response_message)
         return jsonify({'status': 'ok', 'message': 'Response broadcasted'})
 
     except Exception as e:
@@ -1000,25 +1375,13 @@ def chatbot_response():
         return jsonify({'error': str(e)}), 500
 
 # WebSocket event for chatbot
-@socketio.on('chatbot_message')
-def handle_chatbot_message(data):
-    """Handle chatbot message via WebSocket."""
+def _reply_to_chat(sid, message):
+    """Ask n8n for the reply to a WebSocket chat message and send it to ``sid``."""
     try:
-        message = data.get('message', '').strip()
-        if not message:
-            emit('chatbot_response', {
-                'message': 'Por favor escribe un mensaje',
-                'user': 'bot',
-                'timestamp': datetime.now().isoformat()
-            })
-            return
-
-        logger.info(f"Received chatbot message via WebSocket: {message}")
-
-        # Send to n8n for processing
         n8n_response = n8n_webhook.send_event('chatbot.message', {
             'message': message,
             'user': 'web_user',
+            'sid': sid,
             'timestamp': datetime.now().isoformat()
         })
 
@@ -1027,29 +1390,59 @@ def handle_chatbot_message(data):
             # Extract message from n8n response
             bot_message = n8n_response.get('message') or n8n_response.get('output') or str(n8n_response)
 
-            logger.info(f"✅ Received response from n8n: {bot_message}")
+            logger.debug("✅ Received response from n8n: {}", bot_message)
 
+            reply = bot_message
+        else:
+            # If n8n is not available or disabled, provide basic fallback
+            reply = _CHATBOT_WS_FALLBACK
+
+    except Exception as e:
+        logger.error(f"Error handling chatbot message: {e}")
+        reply = f'Error procesando mensaje: {str(e)}'
+
+    socketio.emit('chatbot_response', {
+        'message': reply,
+        'user': 'bot',
+        'timestamp': broadcast_timestamp()
+    }, to=sid)
+
+@socketio.on('chatbot_message')
+def handle_chatbot_message(data):
+    """Handle chatbot message via WebSocket; n8n is called from a background task."""
+    try:
+        message = data.get('message', '').strip()
+        if not message:
             emit('chatbot_response', {
-                'message': bot_message,
+                'message': 'Por favor escribe un mensaje',
                 'user': 'bot',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': broadcast_timestamp()
             })
-        else:
-            # If n8n is not available or disabled, provide basic fallback
+            return
+
+        if not N8N_WEBHOOK_ENABLED:
             emit('chatbot_response', {
-                'message': 'El bot no está disponible en este momento. Verifica que tu workflow de n8n esté activo y configurado correctamente.',
+                'message': _CHATBOT_WS_FALLBACK,
                 'user': 'bot',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': broadcast_timestamp()
             })
+            return
+
+        logger.debug("Received chatbot message via WebSocket: {}", message)
+
+        # La llamada a n8n no retiene el handler: la respuesta llega por sid
+        socketio.start_background_task(_reply_to_chat, request.sid, message)
 
     except Exception as e:
         logger.error(f"Error handling chatbot message: {e}")
         emit('chatbot_response', {
             'message': f'Error procesando mensaje: {str(e)}',
             'user': 'bot',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': broadcast_timestamp()
         })
 
 if __name__ == '__main__':
     logger.info("Starting web application with WebSocket support...")
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
+    # Solo desarrollo; en producción: gunicorn -k eventlet -w 1 --worker-connections 2000 web_wsgi:app (ver web_wsgi.py)
+    debug = os.getenv('WEB_DEBUG', '').lower() in ('1', 'true', 'yes')
+    socketio.run(app, debug=debug, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
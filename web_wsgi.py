@@ -0,0 +1,30 @@
+"""
+WSGI entry point for the admin dashboard (web_app) with Socket.IO.
+
+Production (Linux):
+    gunicorn -k eventlet -w 1 --worker-connections 2000 --keep-alive 5 \
+        -b 0.0.0.0:5000 --access-logfile - web_wsgi:app
+
+Flask-SocketIO needs a single gunicorn worker (gunicorn's balancer has no
+sticky sessions); concurrency comes from eventlet green threads, and
+--worker-connections caps how many clients (HTTP + WebSocket) that worker
+holds at once (gunicorn's default is 1000). To scale out,
+run several of these behind a sticky load balancer and set
+SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) so broadcasts reach
+every process.
+"""
+import eventlet
+
+# Antes de importar la app: sockets, threads y time cooperativos
+eventlet.monkey_patch()
+
+try:
+    # psycopg2 bloquea el hub sin esto (consultas en paralelo entre greenlets)
+    from psycogreen.eventlet import patch_psycopg
+except ImportError:
+    patch_psycopg = None
+
+if patch_psycopg is not None:
+    patch_psycopg()
+
+from web_app import app, socketio  # noqa: E402